@@ -0,0 +1,112 @@
+"""
+Async clients for the asyncio execution mode
+
+One AsyncServices instance per event loop owns the AsyncOpenAI client, the
+`aio` Azure Search / Blob clients and an async HTTP client, plus a global
+concurrency limiter per remote service, so a single process can keep
+hundreds of requests in flight without a thread per request.
+
+    async with AsyncServices() as svc:
+        async with svc.limit("openai"):
+            resp = await svc.openai.embeddings.create(...)
+"""
+
+import asyncio
+import os
+from contextlib import asynccontextmanager
+
+
+# Max in-flight requests per remote service (ASYNC_LIMIT_<SERVICE> to override)
+SERVICE_LIMITS = {
+    "openai": int(os.environ.get("ASYNC_LIMIT_OPENAI", 32)),
+    "search": int(os.environ.get("ASYNC_LIMIT_SEARCH", 16)),
+    "blob": int(os.environ.get("ASYNC_LIMIT_BLOB", 16)),
+    "http": int(os.environ.get("ASYNC_LIMIT_HTTP", 64)),
+    # Browser/OCR page preparation runs in worker threads; keep it small
+    "scrape": int(os.environ.get("ASYNC_LIMIT_SCRAPE", 4)),
+}
+
+HTTP_TIMEOUT = 15
+USER_AGENT = 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+
+
+class AsyncServices:
+    """Lazily-created async clients + per-service semaphores for one event loop"""
+
+    def __init__(self, limits=None, search_key_env="AZURE_SEARCH_ADMIN_KEY"):
+        self.limits = {**SERVICE_LIMITS, **(limits or {})}
+        self.search_key_env = search_key_env
+        self._semaphores = {name: asyncio.Semaphore(n) for name, n in self.limits.items()}
+        self._openai = None
+        self._search = None
+        self._blob = None
+        self._http = None
+
+    @asynccontextmanager
+    async def limit(self, service):
+        """Wait for a free slot on `service` before issuing a request"""
+        async with self._semaphores[service]:
+            yield
+
+    @property
+    def openai(self):
+        if self._openai is None:
+            from openai import AsyncOpenAI
+            # Retries / throttling are handled by rate_limit
+            self._openai = AsyncOpenAI(max_retries=0)
+        return self._openai
+
+    @property
+    def search(self):
+        if self._search is None:
+            from azure.core.credentials import AzureKeyCredential
+            from azure.search.documents.aio import SearchClient
+            # Retries / throttling are handled by rate_limit
+            self._search = SearchClient(
+                endpoint=os.environ["AZURE_SEARCH_ENDPOINT"],
+                index_name=os.environ["AZURE_SEARCH_INDEX"],
+                credential=AzureKeyCredential(os.environ[self.search_key_env]),
+                retry_total=0,
+            )
+        return self._search
+
+    @property
+    def blob(self):
+        if self._blob is None:
+            from azure.storage.blob.aio import BlobServiceClient
+            self._blob = BlobServiceClient.from_connection_string(
+                os.environ["AZURE_STORAGE_CONNECTION_STRING"]
+            )
+        return self._blob
+
+    @property
+    def http(self):
+        if self._http is None:
+            import httpx
+            try:
+                import h2  # noqa: F401
+                http2 = True
+            except ImportError:
+                http2 = False
+            self._http = httpx.AsyncClient(
+                http2=http2,
+                headers={'User-Agent': USER_AGENT},
+                timeout=HTTP_TIMEOUT,
+                limits=httpx.Limits(max_connections=self.limits["http"]),
+                follow_redirects=True,
+            )
+        return self._http
+
+    async def close(self):
+        for client in (self._openai, self._search, self._blob):
+            if client is not None:
+                await client.close()
+        if self._http is not None:
+            await self._http.aclose()
+        self._openai = self._search = self._blob = self._http = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
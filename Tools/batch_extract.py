@@ -0,0 +1,372 @@
+"""
+Offline bulk extraction through the OpenAI Batch API
+
+For large backfills (full history import, re-extraction after a schema
+change). Scrapes every URL, writes the pending extraction prompts to a JSONL
+batch file, submits it, polls until it finishes and fans the results back
+into finalize → embed → upload.
+
+All progress lives in the work directory, so a restarted run resumes where
+it stopped (already-prepared URLs are not re-scraped, a submitted batch is
+polled instead of resubmitted, already-ingested products are skipped).
+The OpenAI client honours OPENAI_BASE_URL, so the batch endpoints can be
+pointed at a local stand-in.
+"""
+
+import hashlib
+import json
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import llm_cache
+from scraping_pipeline import (
+    LLM_MODEL, build_smart_messages, smart_cache_key,
+    prepare_extraction, finalize_extraction, reuse_extraction, client,
+)
+
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_MAX_REQUESTS = 50000
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+def custom_id_for(url):
+    return hashlib.sha1(url.encode('utf-8')).hexdigest()[:20]
+
+
+class BatchRun:
+    """Files + state of one offline extraction run in `work_dir`"""
+
+    def __init__(self, work_dir):
+        self.dir = Path(work_dir)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.state_path = self.dir / "state.json"
+        self.prepared_path = self.dir / "prepared.jsonl"
+        self.results_path = self.dir / "results.jsonl"
+        self.ingested_path = self.dir / "ingested.txt"
+        self.state = self._load_state()
+
+    def _load_state(self):
+        if self.state_path.exists():
+            with open(self.state_path) as f:
+                return json.load(f)
+        return {"phase": "prepare", "batches": []}
+
+    def save_state(self):
+        tmp = self.state_path.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            json.dump(self.state, f, indent=2)
+        tmp.replace(self.state_path)
+
+    @staticmethod
+    def _read_jsonl(path):
+        if not path.exists():
+            return []
+        entries = []
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # Torn last line from a crash mid-write
+                    continue
+        return entries
+
+    @staticmethod
+    def _append_jsonl(path, entry):
+        with open(path, "a") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def prepared(self):
+        return self._read_jsonl(self.prepared_path)
+
+    def add_prepared(self, entry):
+        self._append_jsonl(self.prepared_path, entry)
+
+    def results(self):
+        return {r["custom_id"]: r for r in self._read_jsonl(self.results_path)}
+
+    def add_result(self, entry):
+        self._append_jsonl(self.results_path, entry)
+
+    def ingested(self):
+        if not self.ingested_path.exists():
+            return set()
+        return set(self.ingested_path.read_text().split())
+
+    def mark_ingested(self, custom_id):
+        with open(self.ingested_path, "a") as f:
+            f.write(custom_id + "\n")
+
+
+def prepare_all(run, history, output_dir):
+    """Scrape + OCR every URL not prepared yet (append-only, resumable)"""
+    done = {entry["custom_id"] for entry in run.prepared()}
+    total = len(history)
+
+    for idx, item in enumerate(history, 1):
+        url = item.get("url")
+        if not url:
+            continue
+        custom_id = custom_id_for(url)
+        if custom_id in done:
+            continue
+
+        print(f"\n[prepare {idx}/{total}] {url}")
+        try:
+            prepared = prepare_extraction(url, output_dir=output_dir,
+                                          last_visit_time=item.get("lastVisitTime"))
+            run.add_prepared({"custom_id": custom_id, "prepared": prepared})
+        except Exception as e:
+            print(f"✗ Error preparing {url}: {e}")
+            run.add_prepared({"custom_id": custom_id, "url": url, "error": str(e)})
+        done.add(custom_id)
+
+
+def submit_batches(run):
+    """
+    Write pending prompts to JSONL batch files and submit them
+
+    Each submitted batch records its custom_ids, so a run interrupted
+    between two chunks submits only the requests no batch holds yet.
+    """
+    batches = run.state["batches"]
+    if any("custom_ids" not in info for info in batches):
+        # State written before batches recorded their requests: they cover everything
+        print("Batches already submitted, resuming poll")
+        run.state["phase"] = "submitted"
+        run.save_state()
+        return
+    submitted = {custom_id for info in batches for custom_id in info["custom_ids"]}
+    if submitted:
+        print(f"Resuming submission: {len(batches)} batch(es) with {len(submitted)} request(s) already submitted")
+
+    pending = []
+    for entry in run.prepared():
+        prepared = entry.get("prepared")
+        if prepared is None or entry["custom_id"] in submitted:
+            continue
+        # Content unchanged since the last visit → stored extraction is reused
+        if prepared.get("previous_product") is not None:
+            continue
+        # Already extracted before (cache) → no need to pay for it again
+        if llm_cache.get(smart_cache_key(prepared["ocr_text"], prepared["text_data"])) is not None:
+            continue
+        pending.append({
+            "custom_id": entry["custom_id"],
+            "method": "POST",
+            "url": BATCH_ENDPOINT,
+            "body": {
+                "model": LLM_MODEL,
+                "response_format": {"type": "json_object"},
+                "messages": build_smart_messages(prepared["ocr_text"], prepared["text_data"]),
+            },
+        })
+
+    print(f"\n{len(pending)} extraction(s) pending for the Batch API")
+
+    for chunk_idx in range(0, len(pending), BATCH_MAX_REQUESTS):
+        chunk = pending[chunk_idx:chunk_idx + BATCH_MAX_REQUESTS]
+        input_path = run.dir / f"batch_input_{len(batches)}.jsonl"
+        with open(input_path, "w") as f:
+            for request in chunk:
+                f.write(json.dumps(request, ensure_ascii=False) + "\n")
+
+        with open(input_path, "rb") as f:
+            input_file = client.files.create(file=f, purpose="batch")
+
+        batch = client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window="24h",
+        )
+        print(f"✓ Submitted batch {batch.id} ({len(chunk)} requests)")
+
+        run.state["batches"].append({
+            "batch_id": batch.id,
+            "input_file_id": input_file.id,
+            "status": batch.status,
+            "downloaded": False,
+            "custom_ids": [request["custom_id"] for request in chunk],
+        })
+        run.save_state()
+
+    run.state["phase"] = "submitted"
+    run.save_state()
+
+
+def _store_result_line(run, line):
+    """Record one Batch API output line (result JSON or error) in results.jsonl"""
+    custom_id = line.get("custom_id")
+    response = line.get("response") or {}
+    body = response.get("body") or {}
+
+    if response.get("status_code") != 200 or not body.get("choices"):
+        error = line.get("error") or body.get("error") or f"status {response.get('status_code')}"
+        run.add_result({"custom_id": custom_id, "error": str(error)})
+        return
+
+    try:
+        result = json.loads(body["choices"][0]["message"]["content"])
+    except (json.JSONDecodeError, KeyError, TypeError) as e:
+        run.add_result({"custom_id": custom_id, "error": f"invalid JSON output: {e}"})
+        return
+
+    run.add_result({"custom_id": custom_id, "result": result, "usage": body.get("usage")})
+
+
+def poll_batches(run, poll_interval=30):
+    """Poll submitted batches until all are terminal, downloading outputs"""
+    while True:
+        pending = [b for b in run.state["batches"] if not b["downloaded"]]
+        if not pending:
+            break
+
+        for info in pending:
+            batch = client.batches.retrieve(info["batch_id"])
+            info["status"] = batch.status
+            counts = getattr(batch, "request_counts", None)
+            if counts is not None:
+                print(f"Batch {batch.id}: {batch.status} "
+                      f"({counts.completed}/{counts.total} done, {counts.failed} failed)")
+            else:
+                print(f"Batch {batch.id}: {batch.status}")
+
+            if batch.status not in TERMINAL_STATUSES:
+                continue
+
+            for file_id in (batch.output_file_id, batch.error_file_id):
+                if not file_id:
+                    continue
+                content = client.files.content(file_id).text
+                for raw in content.splitlines():
+                    if raw.strip():
+                        _store_result_line(run, json.loads(raw))
+
+            info["downloaded"] = True
+            run.save_state()
+
+        if any(not b["downloaded"] for b in run.state["batches"]):
+            time.sleep(poll_interval)
+
+    run.state["phase"] = "downloaded"
+    run.save_state()
+
+
+def fan_in(run, output_dir, ingest=True):
+    """Finalize every extracted product and push it into embed/upload"""
+    if ingest:
+        from json2vectordb import ingest_product
+
+    results = run.results()
+    ingested = run.ingested()
+
+    stats = {"total": 0, "processed": 0, "products": 0, "non_products": 0, "errors": 0}
+    products = []
+
+    for entry in run.prepared():
+        stats["total"] += 1
+        custom_id = entry["custom_id"]
+
+        prepared = entry.get("prepared")
+        if prepared is None:
+            stats["errors"] += 1
+            continue
+
+        cache_key = smart_cache_key(prepared["ocr_text"], prepared["text_data"])
+        result_entry = results.get(custom_id)
+        reused = reuse_extraction(prepared)
+        if reused is not None:
+            final_json = reused
+        elif result_entry is not None and "result" in result_entry:
+            final_json = result_entry["result"]
+            usage = result_entry.get("usage") or {}
+            llm_cache.put(cache_key, final_json, SimpleNamespace(**usage))
+        else:
+            final_json = llm_cache.get(cache_key)
+
+        if final_json is None:
+            error = result_entry.get("error") if result_entry else "no batch result"
+            print(f"✗ No extraction for {prepared['url']}: {error}")
+            stats["errors"] += 1
+            continue
+
+        stats["processed"] += 1
+        if custom_id in ingested:
+            continue
+
+        product_json = finalize_extraction(prepared, final_json, output_dir)
+
+        if product_json.get("is_product") != "Yes":
+            stats["non_products"] += 1
+            run.mark_ingested(custom_id)
+            continue
+
+        try:
+            if ingest:
+                print(f"\n==== Uploading to Azure AI Search ====\n")
+                ingest_product(product_json)
+            products.append(product_json)
+            stats["products"] += 1
+            run.mark_ingested(custom_id)
+        except Exception as e:
+            print(f"✗ Error ingesting {prepared['url']}: {e}")
+            stats["errors"] += 1
+
+    run.state["phase"] = "done"
+    run.save_state()
+    return {"stats": stats, "products": products}
+
+
+def run_batch_extraction(history, work_dir="batch_work", output_dir="output",
+                         poll_interval=30, ingest=True):
+    """
+    Full offline run: prepare → submit → poll → fan in (resumable)
+
+    Args:
+        history: List of dicts with 'url' and optionally 'lastVisitTime'
+        work_dir: Directory holding the run state, batch files and results
+        output_dir: Output directory for product JSON files
+        poll_interval: Seconds between batch status polls
+        ingest: Embed + upload products to Azure AI Search
+    """
+    run = BatchRun(work_dir)
+    print(f"Batch run in {run.dir} (phase: {run.state['phase']})")
+
+    if run.state["phase"] == "prepare":
+        prepare_all(run, history, output_dir)
+        submit_batches(run)
+    if run.state["phase"] == "submitted":
+        poll_batches(run, poll_interval)
+
+    result = fan_in(run, output_dir, ingest=ingest)
+
+    print(f"\n{'='*80}")
+    print(f"Batch extraction complete: {result['stats']}")
+    print(f"{'='*80}\n")
+    return result
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Bulk-extract products from history.json through the OpenAI Batch API"
+    )
+    parser.add_argument("--history", default="history.json", help="Path to history.json file (default: history.json)")
+    parser.add_argument("--work-dir", default="batch_work", help="Run state directory; reuse it to resume (default: batch_work)")
+    parser.add_argument("--out", default="output", help="Output directory for product JSON (default: output)")
+    parser.add_argument("--poll-interval", type=int, default=30, help="Seconds between status polls (default: 30)")
+    parser.add_argument("--no-ingest", action="store_true", help="Skip embedding + Azure AI Search upload")
+
+    args = parser.parse_args()
+
+    with open(args.history, 'r') as f:
+        history_data = json.load(f)
+
+    run_batch_extraction(history_data, args.work_dir, args.out, args.poll_interval,
+                         ingest=not args.no_ingest)
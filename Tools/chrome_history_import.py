@@ -0,0 +1,317 @@
+"""
+Bulk backfill straight from Chrome's `History` SQLite database
+
+Reads `urls` joined with `visits` in id-ordered chunks (constant memory),
+keeps URLs visited inside the date range and triages out pages that can
+never be products. URLs with the same canonical form are merged like
+cron_processor's HistoryMerger does: the newest lastVisitTime (with its
+url / title / id) wins and visit / typed counts are summed. Merged items
+are then emitted in the chrome.history.search shape process_history
+expects:
+
+    {"id", "url", "title", "lastVisitTime" (ms since epoch), "visitCount", "typedCount"}
+
+Both passes keep their state in a small SQLite checkpoint next to the
+output (scan: last url id + merged rows on disk; emit: last emitted row +
+output size), so an interrupted import resumes exactly where it stopped.
+
+    python chrome_history_import.py --since 2023-01-01 --out backfill.ndjson
+    python chrome_history_import.py --since 2023-01-01 --process
+"""
+
+import hashlib
+import json
+import os
+import platform
+import re
+import sqlite3
+from datetime import datetime, timezone
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from http_cache import canonical_url
+
+
+CHUNK_SIZE = 5000
+
+# Chrome timestamps: microseconds since 1601-01-01 UTC
+WEBKIT_EPOCH_OFFSET_US = 11644473600 * 1000 * 1000
+
+# visits.transition core types of frames the user never navigated to
+SUBFRAME_TRANSITIONS = (3, 4)
+
+NON_PRODUCT_HOSTS = (
+    'google.', 'bing.com', 'duckduckgo.com', 'search.yahoo.com', 'chatgpt.com', 'chat.openai.com',
+    'mail.', 'outlook.', 'docs.google.com', 'drive.google.com', 'calendar.google.com',
+    'github.com', 'stackoverflow.com', 'localhost', '127.0.0.1', 'youtube.com', 'wikipedia.org',
+    'linkedin.com', 'facebook.com', 'instagram.com', 'twitter.com', 'x.com', 'reddit.com',
+    'accounts.', 'login.', 'portal.azure.com',
+)
+NON_PRODUCT_PATHS = re.compile(
+    r'/(search|login|signin|sign-in|signup|logout|account|cart|checkout|basket|orders?|'
+    r'wishlist|help|support|settings)(/|$|\?)',
+    re.I
+)
+NON_PAGE_EXTENSIONS = ('.pdf', '.jpg', '.jpeg', '.png', '.gif', '.webp', '.svg', '.zip', '.json', '.xml')
+
+
+def default_history_path():
+    """Default profile's History file for this OS"""
+    home = Path.home()
+    system = platform.system()
+    if system == 'Darwin':
+        return home / 'Library/Application Support/Google/Chrome/Default/History'
+    if system == 'Windows':
+        return Path(os.environ.get('LOCALAPPDATA', home)) / 'Google/Chrome/User Data/Default/History'
+    return home / '.config/google-chrome/Default/History'
+
+
+def to_webkit(dt):
+    return int(dt.replace(tzinfo=timezone.utc).timestamp() * 1_000_000) + WEBKIT_EPOCH_OFFSET_US
+
+
+def webkit_to_ms(value):
+    """Chrome timestamp → JS milliseconds since epoch (chrome.history lastVisitTime)"""
+    return (value - WEBKIT_EPOCH_OFFSET_US) / 1000
+
+
+def triage(url):
+    """Reason the URL can be skipped, or None if it may be a product page"""
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https'):
+        return 'scheme'
+    # 'google.' matches any google.<tld> label, 'x.com' the domain and its subdomains
+    host = '.' + (parts.hostname or '').lower()
+    if any(f'.{h}' in host if h.endswith('.') else host.endswith(f'.{h}') for h in NON_PRODUCT_HOSTS):
+        return 'host'
+    path = parts.path.lower()
+    if path.endswith(NON_PAGE_EXTENSIONS):
+        return 'file'
+    if NON_PRODUCT_PATHS.search(path):
+        return 'path'
+    return None
+
+
+class Checkpoint:
+    """Resume state + merged items, committed together per chunk"""
+
+    # Bumped when the checkpoint layout changes, so old checkpoints are refused
+    FORMAT = 2
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT)")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS merged (
+                seq INTEGER PRIMARY KEY,
+                key BLOB UNIQUE,
+                url_id INTEGER,
+                url TEXT,
+                title TEXT,
+                last_visit INTEGER,
+                visit_count INTEGER,
+                typed_count INTEGER
+            )
+        """)
+        self.conn.commit()
+
+    def get(self, key, default=None):
+        row = self.conn.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set(self, key, value):
+        self.conn.execute("INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+
+    def merge(self, url_id, url, title, typed_count, last_visit, visit_count):
+        """
+        Add a row under its canonical URL: the newest visit's url / title / id
+        win, visit and typed counts add up
+        """
+        key = hashlib.sha1(canonical_url(url).encode('utf-8')).digest()[:12]
+        # SET expressions see the row's values before the update
+        self.conn.execute("""
+            INSERT INTO merged (key, url_id, url, title, last_visit, visit_count, typed_count)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(key) DO UPDATE SET
+                url_id = CASE WHEN excluded.last_visit > last_visit THEN excluded.url_id ELSE url_id END,
+                url = CASE WHEN excluded.last_visit > last_visit THEN excluded.url ELSE url END,
+                title = CASE WHEN excluded.last_visit > last_visit THEN excluded.title ELSE title END,
+                last_visit = MAX(last_visit, excluded.last_visit),
+                visit_count = visit_count + excluded.visit_count,
+                typed_count = typed_count + excluded.typed_count
+        """, (key, url_id, url, title or "", last_visit, visit_count, typed_count or 0))
+
+    def merged_count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM merged").fetchone()[0]
+
+    def iter_merged(self, after_seq=0, chunk_size=CHUNK_SIZE):
+        """Yield lists of (seq, item) in first-seen order"""
+        while True:
+            rows = self.conn.execute(
+                "SELECT seq, url_id, url, title, last_visit, visit_count, typed_count "
+                "FROM merged WHERE seq > ? ORDER BY seq LIMIT ?", (after_seq, chunk_size)
+            ).fetchall()
+            if not rows:
+                return
+            yield [(seq, {
+                "id": str(url_id),
+                "url": url,
+                "title": title,
+                "lastVisitTime": webkit_to_ms(last_visit),
+                "visitCount": visit_count,
+                "typedCount": typed_count,
+            }) for seq, url_id, url, title, last_visit, visit_count, typed_count in rows]
+            after_seq = rows[-1][0]
+
+    def commit(self):
+        self.conn.commit()
+
+
+def iter_chunks(db_path, since=None, until=None, after_id=0, chunk_size=CHUNK_SIZE):
+    """
+    Yield lists of (url_id, url, title, typed_count, last_visit, visits_in_range)
+
+    Keyset pagination on urls.id keeps memory flat and makes the last id a
+    precise resume point. Opened read-only/immutable, so a running Chrome
+    (which locks the file) is not disturbed.
+    """
+    uri = f"file:{Path(db_path).resolve()}?mode=ro&immutable=1"
+    conn = sqlite3.connect(uri, uri=True)
+    start = to_webkit(since) if since else 0
+    end = to_webkit(until) if until else 2 ** 62
+
+    query = f"""
+        SELECT u.id, u.url, u.title, u.typed_count, MAX(v.visit_time), COUNT(v.id)
+        FROM urls u JOIN visits v ON v.url = u.id
+        WHERE u.id > ? AND u.hidden = 0
+          AND v.visit_time >= ? AND v.visit_time < ?
+          AND (v.transition & 255) NOT IN ({','.join('?' * len(SUBFRAME_TRANSITIONS))})
+        GROUP BY u.id
+        ORDER BY u.id
+        LIMIT ?
+    """
+    try:
+        while True:
+            rows = conn.execute(query, (after_id, start, end, *SUBFRAME_TRANSITIONS, chunk_size)).fetchall()
+            if not rows:
+                return
+            yield rows
+            after_id = rows[-1][0]
+    finally:
+        conn.close()
+
+
+def scan(checkpoint, db_path, since, until, chunk_size, counts):
+    """Pass 1: triage every History row and merge it into the checkpoint"""
+    after_id = checkpoint.get("last_id", 0)
+    if after_id:
+        print(f"Resuming scan after url id {after_id}")
+
+    for rows in iter_chunks(db_path, since, until, after_id, chunk_size):
+        for row in rows:
+            counts["read"] += 1
+            reason = triage(row[1])
+            if reason:
+                counts[reason] += 1
+                continue
+            checkpoint.merge(*row)
+
+        checkpoint.set("last_id", rows[-1][0])
+        checkpoint.set("counts", counts)
+        checkpoint.commit()
+        print(f"… url id {rows[-1][0]}: read {counts['read']}, "
+              f"triaged {counts['scheme'] + counts['host'] + counts['file'] + counts['path']}")
+
+    counts["kept"] = checkpoint.merged_count()
+    counts["duplicate"] = counts["read"] - counts["kept"] - sum(counts[k] for k in ("scheme", "host", "file", "path"))
+    checkpoint.set("counts", counts)
+    checkpoint.set("scanned", True)
+    checkpoint.commit()
+
+
+def run_import(db_path, out_path=None, since=None, until=None, chunk_size=CHUNK_SIZE,
+               process=False, output_dir="output"):
+    """
+    Stream History rows into NDJSON (`out_path`) and/or process_history
+
+    Returns:
+        dict with read / kept / duplicate / skipped counters (cumulative across resumes)
+    """
+    state_base = Path(out_path) if out_path else Path(output_dir) / "chrome_import"
+    state_base.parent.mkdir(parents=True, exist_ok=True)
+    checkpoint = Checkpoint(f"{state_base}.checkpoint.db")
+
+    params = {"db": str(Path(db_path).resolve()), "since": str(since), "until": str(until),
+              "format": Checkpoint.FORMAT}
+    if checkpoint.get("params", params) != params:
+        raise SystemExit(f"Checkpoint {state_base}.checkpoint.db belongs to a different import: "
+                         f"{checkpoint.get('params')}")
+    checkpoint.set("params", params)
+
+    counts = checkpoint.get("counts", {"read": 0, "kept": 0, "duplicate": 0, "emitted": 0,
+                                       "scheme": 0, "host": 0, "file": 0, "path": 0})
+    if not checkpoint.get("scanned", False):
+        scan(checkpoint, db_path, since, until, chunk_size, counts)
+
+    after_seq = checkpoint.get("emitted_seq", 0)
+    if after_seq:
+        print(f"Resuming output after {counts['emitted']} of {counts['kept']} items")
+
+    out = None
+    if out_path:
+        out = open(out_path, "ab")
+        # Drop anything written after the last committed chunk
+        out.truncate(checkpoint.get("out_bytes", 0))
+        out.seek(0, os.SEEK_END)
+
+    if process:
+        from process_history import process_history
+
+    try:
+        for chunk in checkpoint.iter_merged(after_seq, chunk_size):
+            items = [item for _, item in chunk]
+            if out is not None:
+                out.write("".join(json.dumps(item, ensure_ascii=False) + "\n" for item in items).encode("utf-8"))
+                out.flush()
+                os.fsync(out.fileno())
+            if process:
+                process_history(items, output_dir)
+
+            counts["emitted"] += len(items)
+            checkpoint.set("emitted_seq", chunk[-1][0])
+            checkpoint.set("counts", counts)
+            if out is not None:
+                checkpoint.set("out_bytes", out.tell())
+            checkpoint.commit()
+            print(f"… emitted {counts['emitted']}/{counts['kept']}")
+    finally:
+        if out is not None:
+            out.close()
+
+    print(f"\nImport complete: {counts}")
+    return counts
+
+
+if __name__ == "__main__":
+    import argparse
+
+    def parse_date(value):
+        return datetime.strptime(value, "%Y-%m-%d")
+
+    parser = argparse.ArgumentParser(description="Backfill products from a Chrome History SQLite file")
+    parser.add_argument("--history-db", default=str(default_history_path()),
+                        help="Path to Chrome's History file (default: default profile)")
+    parser.add_argument("--since", type=parse_date, help="Only URLs visited on/after this date (YYYY-MM-DD)")
+    parser.add_argument("--until", type=parse_date, help="Only URLs visited before this date (YYYY-MM-DD)")
+    parser.add_argument("--out", help="Write items as NDJSON to this file (resumable)")
+    parser.add_argument("--process", action="store_true",
+                        help="Run each chunk through process_history (scrape + upload)")
+    parser.add_argument("--output-dir", default="output", help="Output directory for process_history (default: output)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help=f"Rows per chunk (default: {CHUNK_SIZE})")
+
+    args = parser.parse_args()
+    if not args.out and not args.process:
+        parser.error("nothing to do: pass --out and/or --process")
+
+    run_import(args.history_db, args.out, args.since, args.until, args.chunk_size,
+               process=args.process, output_dir=args.output_dir)
@@ -0,0 +1,303 @@
+"""
+CLIP image / text embeddings (openai/clip-vit-base-patch32)
+
+The model is loaded on first use, once per process, so importing this
+module is cheap (pool workers that never embed never pay for it).
+Vectors are L2-normalized, matching the `image_vector` field of the index.
+
+Two backends, picked with CLIP_BACKEND:
+
+- "torch" (default): eager PyTorch fp32, as before
+- "onnx": the text and vision towers exported to ONNX (once, into
+  CLIP_ONNX_DIR) and run with ONNX Runtime, fp32 by default;
+  CLIP_ONNX_QUANTIZE=1 opts into dynamic int8 weights. Skips loading the
+  PyTorch model entirely after the first export. `python clip_embed.py
+  parity` (and tests/test_clip_parity.py) checks the vectors stay within
+  COSINE_TOLERANCE of the torch ones (index compatibility) — run it before
+  switching an index's producer to int8.
+"""
+
+import os
+import threading
+import time
+from io import BytesIO
+from pathlib import Path
+
+from PIL import Image
+
+
+MODEL_NAME = "openai/clip-vit-base-patch32"
+MIN_IMAGE_SIZE = 50
+
+CLIP_BACKEND = os.environ.get("CLIP_BACKEND", "torch")
+ONNX_DIR = Path(os.environ.get(
+    "CLIP_ONNX_DIR",
+    Path.home() / ".history_memory" / "clip_onnx"
+))
+ONNX_QUANTIZE = os.environ.get("CLIP_ONNX_QUANTIZE", "0") == "1"
+ONNX_THREADS = int(os.environ.get("CLIP_ONNX_THREADS", os.cpu_count() or 1))
+COSINE_TOLERANCE = 0.99
+
+_model = None
+_processor = None
+_device = None
+_sessions = None
+_lock = threading.RLock()
+
+
+def load():
+    """Load (once) and return the torch (model, processor, device)"""
+    global _model, _processor, _device
+    if _model is None:
+        with _lock:
+            if _model is None:
+                import torch
+                from transformers import CLIPModel
+
+                _device = "cuda" if torch.cuda.is_available() else "cpu"
+                _model = CLIPModel.from_pretrained(MODEL_NAME).to(_device).eval()
+    return _model, get_processor(), _device
+
+
+def get_processor():
+    global _processor
+    if _processor is None:
+        from transformers import CLIPProcessor
+        _processor = CLIPProcessor.from_pretrained(MODEL_NAME)
+    return _processor
+
+
+# -- ONNX ------------------------------------------------------------------
+
+def _onnx_paths(quantize=ONNX_QUANTIZE):
+    suffix = ".int8.onnx" if quantize else ".onnx"
+    return ONNX_DIR / f"text{suffix}", ONNX_DIR / f"vision{suffix}"
+
+
+def export_onnx(quantize=ONNX_QUANTIZE):
+    """Export both towers (projection + L2 norm included) to ONNX, optionally int8"""
+    import torch
+
+    global _device
+    model, processor, _ = load()
+    model = model.to("cpu")
+    _device = "cpu"
+    ONNX_DIR.mkdir(parents=True, exist_ok=True)
+    text_fp32, vision_fp32 = _onnx_paths(quantize=False)
+
+    class TextTower(torch.nn.Module):
+        def __init__(self, clip):
+            super().__init__()
+            self.clip = clip
+
+        def forward(self, input_ids, attention_mask):
+            features = self.clip.get_text_features(input_ids=input_ids, attention_mask=attention_mask)
+            return features / features.norm(p=2, dim=-1, keepdim=True)
+
+    class VisionTower(torch.nn.Module):
+        def __init__(self, clip):
+            super().__init__()
+            self.clip = clip
+
+        def forward(self, pixel_values):
+            features = self.clip.get_image_features(pixel_values=pixel_values)
+            return features / features.norm(p=2, dim=-1, keepdim=True)
+
+    sample_text = processor(text=["a red shoe"], return_tensors="pt", padding=True)
+    sample_image = processor(images=[Image.new("RGB", (224, 224))], return_tensors="pt")
+
+    with torch.no_grad():
+        torch.onnx.export(
+            TextTower(model).eval(),
+            (sample_text["input_ids"], sample_text["attention_mask"]),
+            str(text_fp32),
+            input_names=["input_ids", "attention_mask"],
+            output_names=["embeddings"],
+            dynamic_axes={"input_ids": {0: "batch", 1: "sequence"},
+                          "attention_mask": {0: "batch", 1: "sequence"},
+                          "embeddings": {0: "batch"}},
+            opset_version=17,
+        )
+        torch.onnx.export(
+            VisionTower(model).eval(),
+            (sample_image["pixel_values"],),
+            str(vision_fp32),
+            input_names=["pixel_values"],
+            output_names=["embeddings"],
+            dynamic_axes={"pixel_values": {0: "batch"}, "embeddings": {0: "batch"}},
+            opset_version=17,
+        )
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        for fp32, int8 in zip((text_fp32, vision_fp32), _onnx_paths(quantize=True)):
+            quantize_dynamic(str(fp32), str(int8), weight_type=QuantType.QInt8)
+
+    print(f"✓ Exported CLIP ONNX towers to {ONNX_DIR} ({'int8' if quantize else 'fp32'})")
+
+
+def _make_session(path):
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    options.intra_op_num_threads = ONNX_THREADS
+    options.inter_op_num_threads = 1
+    return ort.InferenceSession(str(path), options, providers=["CPUExecutionProvider"])
+
+
+def load_onnx(quantize=ONNX_QUANTIZE):
+    """Load (once, exporting first if needed) the ONNX Runtime sessions → (text, vision)"""
+    global _sessions
+    if _sessions is None:
+        with _lock:
+            if _sessions is None:
+                text_path, vision_path = _onnx_paths(quantize)
+                if not (text_path.exists() and vision_path.exists()):
+                    export_onnx(quantize)
+                _sessions = (_make_session(text_path), _make_session(vision_path))
+    return _sessions
+
+
+# -- embedding -------------------------------------------------------------
+
+def _normalize(features):
+    features = features / features.norm(p=2, dim=-1, keepdim=True)
+    return features.cpu().tolist()
+
+
+def embed_images(images, backend=None):
+    """Embed a batch of PIL images → list of vectors"""
+    if (backend or CLIP_BACKEND) == "onnx":
+        _, vision = load_onnx()
+        pixels = get_processor()(images=list(images), return_tensors="np")["pixel_values"]
+        return vision.run(None, {"pixel_values": pixels.astype("float32")})[0].tolist()
+
+    import torch
+
+    model, processor, device = load()
+    inputs = processor(images=list(images), return_tensors="pt").to(device)
+    with torch.no_grad():
+        features = model.get_image_features(**inputs)
+    return _normalize(features)
+
+
+def embed_texts(texts, backend=None):
+    """Embed a batch of strings → list of vectors"""
+    if (backend or CLIP_BACKEND) == "onnx":
+        text, _ = load_onnx()
+        inputs = get_processor()(text=list(texts), return_tensors="np", padding=True, truncation=True)
+        return text.run(None, {
+            "input_ids": inputs["input_ids"].astype("int64"),
+            "attention_mask": inputs["attention_mask"].astype("int64"),
+        })[0].tolist()
+
+    import torch
+
+    model, processor, device = load()
+    inputs = processor(
+        text=list(texts),
+        images=None,
+        return_tensors="pt",
+        padding=True,
+        truncation=True,
+    ).to(device)
+    with torch.no_grad():
+        features = model.get_text_features(**inputs)
+    return _normalize(features)
+
+
+def embed_image_bytes(content: bytes) -> list[float] | None:
+    """Embed encoded image bytes; None for images too small to be a product photo"""
+    image = Image.open(BytesIO(content)).convert("RGB")
+
+    if image.size[0] < MIN_IMAGE_SIZE or image.size[1] < MIN_IMAGE_SIZE:
+        print(f"Skipping tiny image: {image.size}")
+        return None
+
+    return embed_images([image])[0]
+
+
+def parity_cosines(texts, images):
+    """Cosine similarity of each ONNX vector with its torch one → (text cosines, image cosines)"""
+    def cosines(torch_vectors, onnx_vectors):
+        # Both backends return L2-normalized vectors
+        return [sum(x * y for x, y in zip(a, b)) for a, b in zip(torch_vectors, onnx_vectors)]
+
+    texts, images = list(texts), list(images)
+    text_cosines = cosines(embed_texts(texts, "torch"), embed_texts(texts, "onnx")) if texts else []
+    image_cosines = cosines(embed_images(images, "torch"), embed_images(images, "onnx")) if images else []
+    return text_cosines, image_cosines
+
+
+def parity_check(texts, image_paths, tolerance=COSINE_TOLERANCE, repeat=10):
+    """
+    Compare the ONNX backend against torch: cosine similarity per vector,
+    cold-start load time and per-query latency
+
+    Returns True when every vector is within `tolerance`.
+    """
+    images = [Image.open(path).convert("RGB") for path in image_paths]
+
+    start = time.perf_counter()
+    load()
+    torch_load = time.perf_counter() - start
+
+    # A first run exports the towers; that is a one-off, not part of the cold start
+    export_time = None
+    if not all(path.exists() for path in _onnx_paths()):
+        start = time.perf_counter()
+        export_onnx()
+        export_time = time.perf_counter() - start
+    start = time.perf_counter()
+    load_onnx()
+    onnx_load = time.perf_counter() - start
+
+    latency = {}
+    for backend in ("torch", "onnx"):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for text in texts:
+                embed_texts([text], backend=backend)
+            for image in images:
+                embed_images([image], backend=backend)
+        latency[backend] = (time.perf_counter() - start) / (repeat * max(1, len(texts) + len(images)))
+
+    text_cosines, image_cosines = parity_cosines(texts, images)
+    cosines = text_cosines + image_cosines
+
+    worst = min(cosines) if cosines else 1.0
+    if export_time is not None:
+        print(f"Export:  {export_time:.2f}s (first run only)")
+    print(f"Load:    torch {torch_load:.2f}s | onnx ({'int8' if ONNX_QUANTIZE else 'fp32'}) {onnx_load:.2f}s")
+    print(f"Latency: torch {latency['torch'] * 1000:.1f}ms | onnx {latency['onnx'] * 1000:.1f}ms per query")
+    print(f"Cosine:  min {worst:.4f} | mean {sum(cosines) / max(len(cosines), 1):.4f} "
+          f"over {len(cosines)} vectors (tolerance {tolerance})")
+
+    ok = worst >= tolerance
+    print("✓ ONNX vectors compatible with the index" if ok else "✗ ONNX vectors drift beyond tolerance")
+    return ok
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="CLIP ONNX export and torch parity check")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = sub.add_parser("export", help="Export the ONNX towers")
+    export_parser.add_argument("--int8", action="store_true", help="Also write int8-quantized towers")
+
+    parity_parser = sub.add_parser("parity", help="Compare ONNX vectors and speed with torch")
+    parity_parser.add_argument("--images", nargs="*", default=[], help="Product images to embed")
+    parity_parser.add_argument("--texts", nargs="*", default=[
+        "red running shoes", "black leather handbag", "white cotton t-shirt", "blue denim jacket",
+    ], help="Queries to embed")
+    parity_parser.add_argument("--tolerance", type=float, default=COSINE_TOLERANCE)
+
+    args = parser.parse_args()
+    if args.command == "export":
+        export_onnx(quantize=args.int8)
+    else:
+        raise SystemExit(0 if parity_check(args.texts, args.images, args.tolerance) else 1)
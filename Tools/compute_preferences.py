@@ -6,6 +6,8 @@ from collections import Counter, defaultdict
 from azure.core.credentials import AzureKeyCredential
 from azure.search.documents import SearchClient
 
+import price_history
+
 
 AZURE_SEARCH_ENDPOINT = os.environ["AZURE_SEARCH_ENDPOINT"]
 AZURE_SEARCH_INDEX = os.environ["AZURE_SEARCH_INDEX"]
@@ -34,6 +36,31 @@ def get_all_products():
     return products
 
 
+def price_drops(products, limit=10):
+    """
+    Viewed products whose latest recorded price is below the first one,
+    biggest relative drop first (from the local price history)
+    """
+    drops = []
+    for product in products:
+        url = product.get("url")
+        if not url:
+            continue
+        summary = price_history.summary(price_history.doc_id_for_url(url))
+        if summary is None or summary["change_since_first"] >= 0 or not summary["first"]["price"]:
+            continue
+        drops.append({
+            "product_name": product.get("product_name"),
+            "url": url,
+            "first_price": summary["first"]["price"],
+            "previous_price": summary["previous"]["price"] if summary["previous"] else None,
+            "latest_price": summary["latest"]["price"],
+            "drop_percent": round(-100 * summary["change_since_first"] / summary["first"]["price"], 1),
+        })
+    drops.sort(key=lambda drop: drop["drop_percent"], reverse=True)
+    return drops[:limit]
+
+
 def compute_preferences(products):
 
     category_counter = Counter()
@@ -104,7 +131,8 @@ def compute_preferences(products):
         "top_categories": [cat for cat, _ in category_counter.most_common(10)],
         "top_brands": [brand for brand, _ in brand_counter.most_common(10)],
         "top_colors": [color for color, _ in color_counter.most_common(10)],
-        "category_preferences": {}
+        "category_preferences": {},
+        "price_drops": price_drops(products)
     }
 
     for category, data in category_data.items():
@@ -171,3 +199,4 @@ if __name__ == "__main__":
     print(f"  Top categories: {', '.join(preferences['top_categories'][:5])}")
     print(f"  Top brands: {', '.join(preferences['top_brands'][:5])}")
     print(f"  Top colors: {', '.join(preferences['top_colors'][:5])}")
+    print(f"  Price drops: {len(preferences['price_drops'])}")
@@ -0,0 +1,146 @@
+"""
+Content fingerprints of scraped pages, per canonical URL
+
+A revisit of a page whose content has not changed should not pay for
+OCR, LLM extraction, embeddings and a full upload again. After scraping,
+two hashes are taken from the scraped fields (title, price, main content,
+main image URL):
+
+- fingerprint: everything, normalized
+- content fingerprint: the same with prices masked out
+
+and compared with what was stored for the URL last time:
+
+    unchanged  same fingerprint → reuse the stored product, update visit fields
+    price      only the prices differ → re-extract and merge the price fields
+    changed    anything else → full pipeline
+    new        URL not seen before, or the scrape came back empty → full pipeline
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+from http_cache import canonical_url
+
+
+STORE_PATH = Path(os.environ.get(
+    "FINGERPRINT_STORE_PATH",
+    Path.home() / ".history_memory" / "fingerprints.db"
+))
+FINGERPRINTS_ENABLED = os.environ.get("FINGERPRINTS_DISABLED", "0") != "1"
+
+UNCHANGED = "unchanged"
+PRICE = "price"
+CHANGED = "changed"
+NEW = "new"
+
+_WHITESPACE_RE = re.compile(r'\s+')
+# Currency amounts ("$1,299.00", "₹ 499", "49.99 EUR") inside free text
+_PRICE_RE = re.compile(
+    r'([$€£¥₹]|rs\.?|usd|eur|gbp|inr)\s?\d[\d,]*(\.\d+)?|\d[\d,]*(\.\d+)?\s?([$€£¥₹]|usd|eur|gbp|inr)\b',
+    re.I
+)
+_local = threading.local()
+_counts = Counter()
+_counts_lock = threading.Lock()
+
+
+def _db():
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and getattr(_local, 'pid', None) == os.getpid():
+        return conn
+
+    STORE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(STORE_PATH, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS fingerprints (
+            url TEXT PRIMARY KEY,
+            fingerprint TEXT,
+            content_fingerprint TEXT,
+            product TEXT,
+            updated_at REAL
+        )
+    """)
+    conn.commit()
+    _local.conn = conn
+    _local.pid = os.getpid()
+    return conn
+
+
+def _normalize(value):
+    return _WHITESPACE_RE.sub(' ', str(value or '')).strip().lower()
+
+
+def compute(text_data, main_image):
+    """
+    (fingerprint, content fingerprint) of a scrape, or (None, None) when
+    the scrape found no title and no main content: there is nothing to
+    compare, and empty fields would hash the same on every failed scrape
+    """
+    text_data = text_data or {}
+    if not _normalize(text_data.get('title')) and not _normalize(text_data.get('main_content')):
+        return None, None
+    title = _normalize(text_data.get('title'))
+    price = _normalize(text_data.get('price'))
+    content = _normalize(text_data.get('main_content'))
+    image = _normalize(main_image)
+
+    full = hashlib.sha256('\x00'.join((title, price, content, image)).encode('utf-8')).hexdigest()
+    masked = _PRICE_RE.sub('<price>', content)
+    without_price = hashlib.sha256('\x00'.join((title, masked, image)).encode('utf-8')).hexdigest()
+    return full, without_price
+
+
+def lookup(url):
+    """Stored record for the URL's canonical form, or None"""
+    if not FINGERPRINTS_ENABLED:
+        return None
+    row = _db().execute(
+        "SELECT fingerprint, content_fingerprint, product FROM fingerprints WHERE url = ?",
+        (canonical_url(url),)
+    ).fetchone()
+    if row is None:
+        return None
+    return {"fingerprint": row[0], "content_fingerprint": row[1], "product": json.loads(row[2])}
+
+
+def classify(record, fingerprint, content_fingerprint):
+    """unchanged / price / changed / new (counted for stats())"""
+    if record is None:
+        change = NEW
+    elif record["fingerprint"] == fingerprint:
+        change = UNCHANGED
+    elif record["content_fingerprint"] == content_fingerprint:
+        change = PRICE
+    else:
+        change = CHANGED
+    with _counts_lock:
+        _counts[change] += 1
+    return change
+
+
+def store(url, fingerprint, content_fingerprint, product):
+    """Remember the fingerprints and the product extracted from them"""
+    if not FINGERPRINTS_ENABLED or not fingerprint:
+        return
+    conn = _db()
+    conn.execute(
+        "INSERT OR REPLACE INTO fingerprints (url, fingerprint, content_fingerprint, product, updated_at) "
+        "VALUES (?, ?, ?, ?, ?)",
+        (canonical_url(url), fingerprint, content_fingerprint, json.dumps(product, ensure_ascii=False), time.time())
+    )
+    conn.commit()
+
+
+def stats():
+    """Revisit outcomes in this process: unchanged / price / changed / new"""
+    with _counts_lock:
+        return {change: _counts[change] for change in (UNCHANGED, PRICE, CHANGED, NEW)}
@@ -0,0 +1,250 @@
+"""
+Process pool for the CPU-bound steps of ingestion
+
+HTML parsing + extraction, Tesseract OCR and CLIP image embedding hold the
+GIL, so threads (async mode, concurrent items) end up sharing one core.
+These helpers run them in a pool of worker processes instead:
+
+- each worker keeps its own single-engine OCR pool and loads CLIP once, on
+  its first embedding task
+- payloads (HTML, screenshots, images) travel through shared memory; only
+  the block name and the small results are pickled
+- the pool is opt-in: every worker is a fresh interpreter that re-imports
+  the heavy modules, which only pays off when items are processed
+  concurrently. Entry points that do (aprocess_history) call enable();
+  CPU_POOL_SIZE=N forces N workers everywhere, CPU_POOL_SIZE=0 keeps the
+  pool off even there
+
+    main_image, images, text_data = cpu_pool.extract_page(html, url)
+    ocr_text = cpu_pool.ocr_regions(screenshot_png, boxes)
+    vector = cpu_pool.embed_image(image_bytes)
+"""
+
+import atexit
+import multiprocessing
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+
+_cores = os.cpu_count() or 1
+# Workers used by enable(): one per core, no pool on a single core
+DEFAULT_POOL_SIZE = _cores if _cores > 1 else 0
+CPU_POOL_SIZE = int(os.environ.get("CPU_POOL_SIZE", 0))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+# -- shared memory ---------------------------------------------------------
+
+def _to_shm(data):
+    """Copy bytes into a new shared memory block → (block, ref)"""
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    block = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+    block.buf[:len(data)] = data
+    return block, (block.name, len(data))
+
+
+def _from_shm(ref):
+    name, size = ref
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        return bytes(block.buf[:size])
+    finally:
+        block.close()
+
+
+# -- worker side -----------------------------------------------------------
+
+def _init_worker(quiet=False):
+    """Per-worker setup: one OCR engine, single-threaded torch"""
+    if quiet:
+        sys.stdout = open(os.devnull, 'w')
+
+    # Parallelism comes from the processes; intra-op threads would oversubscribe.
+    # Read by torch when clip_embed first imports it.
+    os.environ.setdefault("OMP_NUM_THREADS", "1")
+    os.environ.setdefault("MKL_NUM_THREADS", "1")
+    os.environ.setdefault("CLIP_ONNX_THREADS", "1")
+
+    import ocr_engine
+    ocr_engine.OCR_POOL_SIZE = 1
+    ocr_engine._pool = ocr_engine.EnginePool(size=1)
+
+
+def _extract_page_task(html_ref, url):
+    import page_extract
+    return page_extract.extract_page(page_extract.make_soup(_from_shm(html_ref)), url)
+
+
+def _ocr_regions_task(png_ref, boxes):
+    import ocr_regions
+    return ocr_regions.ocr_regions(_from_shm(png_ref), boxes)
+
+
+def _ocr_task(image_ref):
+    import ocr_engine
+    return ocr_engine.ocr(_from_shm(image_ref))
+
+
+def _embed_image_task(image_ref):
+    import clip_embed
+    return clip_embed.embed_image_bytes(_from_shm(image_ref))
+
+
+# -- caller side -----------------------------------------------------------
+
+def get_executor(size=None, quiet=False):
+    """Process-wide worker pool (None when CPU_POOL_SIZE is 0 and none was started)"""
+    global _executor
+    if size is None:
+        # A pool started with an explicit size (benchmark) stays in use
+        if _executor is not None:
+            return _executor
+        size = CPU_POOL_SIZE
+    if size <= 0:
+        return None
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                # spawn: forking a parent with browser/torch threads can deadlock
+                _executor = ProcessPoolExecutor(
+                    max_workers=size,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(quiet,),
+                )
+    return _executor
+
+
+def enable(size=None):
+    """
+    Turn the pool on for this process (DEFAULT_POOL_SIZE workers unless
+    `size` is given); an explicit CPU_POOL_SIZE in the environment wins
+    """
+    global CPU_POOL_SIZE
+    if "CPU_POOL_SIZE" in os.environ:
+        return
+    CPU_POOL_SIZE = DEFAULT_POOL_SIZE if size is None else size
+
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
+
+
+atexit.register(shutdown)
+
+
+def _run(task, payload, *args):
+    """Run `task` on a worker with `payload` in shared memory (blocks for the result)"""
+    block, ref = _to_shm(payload)
+    try:
+        return get_executor().submit(task, ref, *args).result()
+    finally:
+        block.close()
+        block.unlink()
+
+
+def extract_page(html, url):
+    """Parse + single-pass extraction → (main_image, all_images, text_data)"""
+    if get_executor() is None:
+        import page_extract
+        return page_extract.extract_page(page_extract.make_soup(html), url)
+    return _run(_extract_page_task, html, url)
+
+
+def ocr_regions(screenshot_png, boxes):
+    """Region-cropped OCR of a PNG screenshot"""
+    if get_executor() is None:
+        import ocr_regions as regions
+        return regions.ocr_regions(screenshot_png, boxes)
+    return _run(_ocr_regions_task, screenshot_png, boxes)
+
+
+def ocr(image):
+    """Full-image OCR of encoded image bytes or a file path"""
+    if get_executor() is None or not isinstance(image, (bytes, bytearray, str, os.PathLike)):
+        import ocr_engine
+        return ocr_engine.ocr(image)
+    if not isinstance(image, (bytes, bytearray)):
+        with open(image, 'rb') as f:
+            image = f.read()
+    return _run(_ocr_task, image)
+
+
+def embed_image(content):
+    """CLIP vector for encoded image bytes (None for tiny images)"""
+    if get_executor() is None:
+        import clip_embed
+        return clip_embed.embed_image_bytes(content)
+    return _run(_embed_image_task, content)
+
+
+def benchmark(html_paths, image_paths=(), max_workers=None, copies=4):
+    """
+    Throughput of extract_page (+ OCR / CLIP on `image_paths`) for 1..N workers
+
+    Every input is submitted `copies` times so each pool size has enough
+    concurrent work to keep all workers busy.
+    """
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    max_workers = max_workers or os.cpu_count() or 1
+    pages = []
+    for path in html_paths:
+        with open(path, 'rb') as f:
+            pages.append(f.read())
+    images = []
+    for path in image_paths:
+        with open(path, 'rb') as f:
+            images.append(f.read())
+
+    jobs = [(extract_page, (html, 'https://example.com/')) for html in pages]
+    jobs += [(ocr, (png,)) for png in images]
+    jobs += [(embed_image, (png,)) for png in images]
+    jobs *= copies
+    if not jobs:
+        print("Nothing to benchmark")
+        return {}
+
+    results = {}
+    sizes = sorted({1, 2, 4, 8, 16, 32, 64, max_workers} & set(range(1, max_workers + 1)))
+    for size in sizes:
+        shutdown()
+        get_executor(size, quiet=True)
+        # Warm up: spawn workers and load models outside the timing
+        with ThreadPoolExecutor(max_workers=size) as submitters:
+            list(submitters.map(lambda job: job[0](*job[1]), jobs[:size]))
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=size) as submitters:
+            list(submitters.map(lambda job: job[0](*job[1]), jobs))
+        elapsed = time.perf_counter() - start
+
+        results[size] = len(jobs) / elapsed
+        print(f"{size:3d} worker(s): {results[size]:7.1f} tasks/s | "
+              f"speedup {results[size] / results[sizes[0]]:.2f}x")
+
+    shutdown()
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Scaling curve of the CPU worker pool")
+    parser.add_argument("pages", nargs="*", help="Saved .html files")
+    parser.add_argument("--images", nargs="*", default=[], help="Screenshots / product images for OCR + CLIP")
+    parser.add_argument("--max-workers", type=int, default=None, help="Largest pool size (default: cores)")
+    parser.add_argument("--copies", type=int, default=4, help="Times each input is submitted (default: 4)")
+
+    args = parser.parse_args()
+    benchmark(args.pages, args.images, args.max_workers, args.copies)
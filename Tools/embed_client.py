@@ -0,0 +1,91 @@
+"""
+Thin client for the local embedding service (embed_server)
+
+Uses the shared service when it is up, so the agent and ingestion share
+one CLIP copy and its micro-batches; otherwise embeds in-process. After a
+failed connection (or a server error) the service is not retried for
+RETRY_AFTER seconds, so the fallback costs one refused localhost connect,
+not one per call. Bad input (an undecodable image) is answered in the
+response body and leaves the service in use.
+"""
+
+import os
+import threading
+import time
+
+import requests
+
+
+SERVER_URL = os.environ.get(
+    "EMBED_SERVER_URL",
+    f"http://127.0.0.1:{os.environ.get('EMBED_SERVER_PORT', 8765)}"
+)
+SERVER_ENABLED = os.environ.get("EMBED_SERVER_DISABLED", "0") != "1"
+TIMEOUT = 30
+RETRY_AFTER = 30
+
+_session = requests.Session()
+_down_until = 0.0
+_lock = threading.Lock()
+
+
+def _mark_down(reason):
+    global _down_until
+    with _lock:
+        if time.monotonic() >= _down_until:
+            print(f"Embedding service unavailable ({reason}), embedding in-process")
+        _down_until = time.monotonic() + RETRY_AFTER
+
+
+def _post(path, **kwargs):
+    """
+    POST to the service → parsed JSON, or None when this call has to be
+    embedded in-process
+
+    Only connection errors and 5xx mark the service down for RETRY_AFTER;
+    a rejected request (4xx) says nothing about the service.
+    """
+    if not SERVER_ENABLED or time.monotonic() < _down_until:
+        return None
+    try:
+        response = _session.post(f"{SERVER_URL}{path}", timeout=TIMEOUT, **kwargs)
+        if response.status_code >= 500:
+            _mark_down(f"HTTP {response.status_code}")
+            return None
+        result = response.json()
+    except (requests.RequestException, ValueError) as e:
+        _mark_down(e.__class__.__name__)
+        return None
+
+    if response.status_code >= 400:
+        print(f"Embedding service rejected {path}: {result.get('error')}")
+        return None
+    return result
+
+
+def embed_texts(texts):
+    """CLIP text vectors for a list of strings"""
+    result = _post("/embed/text", json={"texts": list(texts)})
+    if result is not None:
+        return result["vectors"]
+
+    import clip_embed
+    return clip_embed.embed_texts(texts)
+
+
+def embed_text(text):
+    return embed_texts([text])[0]
+
+
+def embed_image_bytes(content):
+    """CLIP vector for encoded image bytes (None for tiny images)"""
+    result = _post("/embed/image", data=content, headers={"Content-Type": "application/octet-stream"})
+    if result is not None:
+        # Undecodable images come back as {"vector": null, "error": ...}
+        if result.get("error"):
+            print(f"Skipping image: {result['error']}")
+        return result["vector"]
+
+    # In-process fallback keeps the model on the CPU pool workers
+    import cpu_pool
+    return cpu_pool.embed_image(content)
@@ -0,0 +1,216 @@
+"""
+Local CLIP embedding service with dynamic micro-batching
+
+One process holds the CLIP model (torch or ONNX, per CLIP_BACKEND) and
+serves both the agent and ingestion over localhost HTTP. Requests that
+arrive within BATCH_WINDOW_MS of each other are embedded as one batch.
+
+    python embed_server.py --port 8765
+
+    POST /embed/text   {"texts": ["red shoes", ...]}  → {"vectors": [[...], ...]}
+    POST /embed/image  raw image bytes                → {"vector": [...] | null, "error"?: ...}
+    GET  /health                                      → backend + batch stats
+
+Clients use embed_client, which falls back to in-process embedding when
+the service is not running.
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+
+from PIL import Image
+
+import clip_embed
+
+
+HOST = os.environ.get("EMBED_SERVER_HOST", "127.0.0.1")
+PORT = int(os.environ.get("EMBED_SERVER_PORT", 8765))
+BATCH_WINDOW_MS = float(os.environ.get("EMBED_BATCH_WINDOW_MS", 5))
+MAX_BATCH = int(os.environ.get("EMBED_MAX_BATCH", 32))
+MAX_BODY_BYTES = 20 * 1024 * 1024
+
+
+class MicroBatcher:
+    """
+    Collects concurrent submissions into batches for `fn(list) → list`
+
+    The first item of a batch waits at most `window_ms` for company; a full
+    batch is dispatched immediately.
+    """
+
+    def __init__(self, fn, window_ms=BATCH_WINDOW_MS, max_batch=MAX_BATCH):
+        self.fn = fn
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.batches = 0
+        self.items = 0
+        self._queue = queue.Queue()
+        threading.Thread(target=self._loop, daemon=True).start()
+
+    def enqueue(self, item):
+        """Queue `item` → Future of its result"""
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def submit(self, item):
+        return self.enqueue(item).result()
+
+    def _loop(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            self.batches += 1
+            self.items += len(batch)
+            try:
+                results = self.fn([item for item, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch": round(self.items / self.batches, 2) if self.batches else 0,
+        }
+
+
+text_batcher = None
+image_batcher = None
+
+
+class EmbedHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length", 0))
+        if length > MAX_BODY_BYTES:
+            # The unread body would be parsed as the next request
+            self.close_connection = True
+            raise ValueError(f"body too large ({length} bytes)")
+        return self.rfile.read(length)
+
+    def do_GET(self):
+        if self.path != "/health":
+            self._send_json(404, {"error": "not found"})
+            return
+        self._send_json(200, {
+            "status": "ok",
+            "backend": clip_embed.CLIP_BACKEND,
+            "text": text_batcher.stats(),
+            "image": image_batcher.stats(),
+        })
+
+    def do_POST(self):
+        # Bad input is answered in the body (4xx / "error"), model failures
+        # with a 5xx: clients only treat the latter as the service being down
+        if self.path == "/embed/text":
+            self._embed_texts()
+        elif self.path == "/embed/image":
+            self._embed_image()
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def _embed_texts(self):
+        try:
+            texts = json.loads(self._read_body())["texts"]
+            if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+                raise ValueError("texts must be a list of strings")
+        except (ValueError, KeyError, TypeError) as e:
+            self._send_json(400, {"error": f"bad request: {e}"})
+            return
+
+        # Each text is its own batch item so concurrent callers share batches;
+        # all are queued before waiting, so one request's texts share a batch too
+        futures = [text_batcher.enqueue(text) for text in texts]
+        try:
+            vectors = [future.result() for future in futures]
+        except Exception as e:
+            self._send_json(500, {"error": str(e)})
+            return
+        self._send_json(200, {"vectors": vectors})
+
+    def _embed_image(self):
+        try:
+            image = Image.open(BytesIO(self._read_body())).convert("RGB")
+        except Exception as e:
+            # Undecodable / oversized image: skipped like a tiny one
+            self._send_json(200, {"vector": None, "error": f"cannot decode image: {e}"})
+            return
+        if image.size[0] < clip_embed.MIN_IMAGE_SIZE or image.size[1] < clip_embed.MIN_IMAGE_SIZE:
+            self._send_json(200, {"vector": None, "skipped": list(image.size)})
+            return
+
+        try:
+            vector = image_batcher.submit(image)
+        except Exception as e:
+            self._send_json(500, {"error": str(e)})
+            return
+        self._send_json(200, {"vector": vector})
+
+
+def serve(host=HOST, port=PORT):
+    global text_batcher, image_batcher
+
+    start = time.perf_counter()
+    # Load before accepting traffic so the first requests don't time out
+    if clip_embed.CLIP_BACKEND == "onnx":
+        clip_embed.load_onnx()
+    else:
+        clip_embed.load()
+    print(f"✓ CLIP loaded ({clip_embed.CLIP_BACKEND}) in {time.perf_counter() - start:.1f}s")
+
+    text_batcher = MicroBatcher(clip_embed.embed_texts)
+    image_batcher = MicroBatcher(clip_embed.embed_images)
+
+    server = ThreadingHTTPServer((host, port), EmbedHandler)
+    server.daemon_threads = True
+    print(f"Embedding service on http://{host}:{port} "
+          f"(window {BATCH_WINDOW_MS}ms, max batch {MAX_BATCH})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Local CLIP embedding service with micro-batching")
+    parser.add_argument("--host", default=HOST, help=f"Bind address (default: {HOST})")
+    parser.add_argument("--port", type=int, default=PORT, help=f"Port (default: {PORT})")
+
+    args = parser.parse_args()
+    serve(args.host, args.port)
@@ -0,0 +1,324 @@
+"""
+On-disk cache for fetched pages and product images
+
+Entries are keyed by canonical URL and store the body plus ETag /
+Last-Modified validators. Fresh entries are served without touching the
+network; stale ones are revalidated with a conditional GET (304 → reuse).
+Total size is capped with LRU eviction.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+
+CACHE_DIR = Path(os.environ.get(
+    "HTTP_CACHE_DIR",
+    Path.home() / ".history_memory" / "http_cache"
+))
+CACHE_ENABLED = os.environ.get("HTTP_CACHE_DISABLED", "0") != "1"
+MAX_BYTES = int(os.environ.get("HTTP_CACHE_MAX_BYTES", 1024 * 1024 * 1024))
+
+# Seconds an entry is served without revalidation, per kind
+TTLS = {
+    "page": int(os.environ.get("HTTP_CACHE_PAGE_TTL", 6 * 3600)),
+    "image": int(os.environ.get("HTTP_CACHE_IMAGE_TTL", 7 * 24 * 3600)),
+}
+# Generic binary types some CDNs serve images as
+UNTYPED_BINARY = ('', 'application/octet-stream', 'binary/octet-stream')
+
+# Query parameters that never change page content (tracking / ad attribution)
+TRACKING_PARAMS = {
+    'gclid', 'fbclid', 'msclkid', 'dclid', 'yclid', 'ref', 'ref_', 'tag',
+    '_encoding', 'content-id', 'dib', 'dib_tag', 'qid', 'sr', 'mcid',
+    'adgrpid', 'crid', 'sprefix', 'keywords', 'hydadcr', 'linkcode',
+    'linkid', 'camp', 'creative', 'creativeasin', 'smid', 'spm', 'srsltid',
+}
+TRACKING_PREFIXES = ('utm_', 'pd_rd_', 'pf_rd_', 'hv')
+
+
+def canonical_url(url):
+    """
+    Normalize a URL so tracking variants of the same page share a key
+
+    Lowercases scheme/host, drops the fragment, default ports and tracking
+    query parameters, and sorts the remaining parameters.
+    """
+    parts = urlsplit(url.strip())
+    scheme = (parts.scheme or 'https').lower()
+    host = (parts.hostname or '').lower()
+    if parts.port and not ((scheme == 'https' and parts.port == 443) or
+                           (scheme == 'http' and parts.port == 80)):
+        host = f"{host}:{parts.port}"
+
+    query = [
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if k.lower() not in TRACKING_PARAMS and not k.lower().startswith(TRACKING_PREFIXES)
+    ]
+    query.sort()
+
+    path = parts.path or '/'
+    # Amazon appends "/ref=..." path segments for attribution
+    if '/ref=' in path:
+        path = path.split('/ref=')[0] or '/'
+
+    return urlunsplit((scheme, host, path, urlencode(query), ''))
+
+
+@dataclass
+class CacheEntry:
+    key: str
+    url: str
+    kind: str
+    body: bytes
+    content_type: str
+    etag: str | None
+    last_modified: str | None
+    strategy: str | None
+    stored_at: float
+
+    @property
+    def fresh(self):
+        return time.time() - self.stored_at < TTLS.get(self.kind, 0)
+
+    def conditional_headers(self):
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+@dataclass
+class CachedResponse:
+    """Minimal response returned by cached_fetch (hit or miss)"""
+    content: bytes
+    content_type: str
+    from_cache: bool
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', errors='replace')
+
+
+_local = threading.local()
+
+
+def _db():
+    """Per-thread (and per-process) sqlite connection to the index"""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and getattr(_local, 'pid', None) == os.getpid():
+        return conn
+
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(CACHE_DIR / "index.db", timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS entries (
+            key TEXT PRIMARY KEY,
+            url TEXT,
+            kind TEXT,
+            content_type TEXT,
+            etag TEXT,
+            last_modified TEXT,
+            strategy TEXT,
+            stored_at REAL,
+            last_access REAL,
+            size INTEGER
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON entries(last_access)")
+    conn.commit()
+    _local.conn = conn
+    _local.pid = os.getpid()
+    return conn
+
+
+def matches_kind(kind, content_type):
+    """
+    Whether a body with this Content-Type may be cached (or served) as `kind`:
+    html/xml for pages, image/* for images. A missing type is allowed for
+    pages (rendered HTML is stored without one) and, like octet-stream, for
+    images.
+    """
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    if kind == 'page':
+        return not content_type or 'html' in content_type or 'xml' in content_type
+    if kind == 'image':
+        return content_type.startswith('image/') or content_type in UNTYPED_BINARY
+    return True
+
+
+def _key(url, kind):
+    return hashlib.sha256(f"{kind}:{canonical_url(url)}".encode()).hexdigest()
+
+
+def _body_path(key):
+    return CACHE_DIR / key[:2] / f"{key}.bin"
+
+
+def lookup(url, kind):
+    """Return the CacheEntry for `url` (fresh or stale), or None"""
+    if not CACHE_ENABLED:
+        return None
+
+    key = _key(url, kind)
+    conn = _db()
+    row = conn.execute(
+        "SELECT url, content_type, etag, last_modified, strategy, stored_at "
+        "FROM entries WHERE key = ?", (key,)
+    ).fetchone()
+    if row is None:
+        return None
+
+    try:
+        if not matches_kind(kind, row[1]):
+            # Stored before content types were checked (e.g. an image as a page)
+            raise OSError(f"cached {row[1]} is not a {kind}")
+        body = _body_path(key).read_bytes()
+    except OSError:
+        _body_path(key).unlink(missing_ok=True)
+        conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+        conn.commit()
+        return None
+
+    conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+    conn.commit()
+
+    return CacheEntry(key, row[0], kind, body, row[1] or '', row[2], row[3], row[4], row[5])
+
+
+def store(url, kind, body, content_type='', etag=None, last_modified=None, strategy=None):
+    """
+    Write (or replace) the entry for `url` and enforce the size cap;
+    bodies whose content type does not match `kind` are not cached
+    """
+    if not CACHE_ENABLED or body is None or not matches_kind(kind, content_type):
+        return
+
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+
+    key = _key(url, kind)
+    path = _body_path(key)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    tmp.write_bytes(body)
+    os.replace(tmp, path)
+
+    now = time.time()
+    conn = _db()
+    conn.execute(
+        "INSERT OR REPLACE INTO entries "
+        "(key, url, kind, content_type, etag, last_modified, strategy, stored_at, last_access, size) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (key, canonical_url(url), kind, content_type, etag, last_modified, strategy, now, now, len(body))
+    )
+    conn.commit()
+    _evict(conn)
+
+
+def touch(entry):
+    """Mark a revalidated (304) entry as fresh again"""
+    if not CACHE_ENABLED:
+        return
+    now = time.time()
+    conn = _db()
+    conn.execute("UPDATE entries SET stored_at = ?, last_access = ? WHERE key = ?", (now, now, entry.key))
+    conn.commit()
+    entry.stored_at = now
+
+
+def _evict(conn):
+    """Drop least-recently-used entries until the cache fits in MAX_BYTES"""
+    total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+    if total <= MAX_BYTES:
+        return
+
+    rows = conn.execute("SELECT key, size FROM entries ORDER BY last_access ASC").fetchall()
+    for key, size in rows:
+        if total <= MAX_BYTES:
+            break
+        try:
+            _body_path(key).unlink()
+        except OSError:
+            pass
+        conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+        total -= size
+    conn.commit()
+
+
+def cached_fetch(url, kind, cloudflare=False, strategy=None):
+    """
+    GET `url` through the cache
+
+    Fresh hit → no network. Stale hit → conditional GET, 304 reuses the
+    cached body. Miss / 200 → fetch over the shared session and store,
+    unless the content type does not match `kind` (the response is still
+    returned; callers check content_type).
+
+    Returns:
+        CachedResponse
+    """
+    from http_session import fetch
+
+    entry = lookup(url, kind)
+    if entry is not None and entry.fresh:
+        return CachedResponse(entry.body, entry.content_type, from_cache=True)
+
+    headers = entry.conditional_headers() if entry is not None else {}
+    response = fetch(url, cloudflare=cloudflare, headers=headers)
+
+    if response.status_code == 304 and entry is not None:
+        touch(entry)
+        return CachedResponse(entry.body, entry.content_type, from_cache=True)
+
+    response.raise_for_status()
+
+    content_type = response.headers.get('Content-Type', '')
+    store(
+        url, kind, response.content,
+        content_type=content_type,
+        etag=response.headers.get('ETag'),
+        last_modified=response.headers.get('Last-Modified'),
+        strategy=strategy,
+    )
+    return CachedResponse(response.content, content_type, from_cache=False)
+
+
+async def acached_fetch(svc, url, kind, strategy=None):
+    """
+    Async cached_fetch over the shared httpx client of an AsyncServices
+
+    Same hit / revalidate / store behaviour; the local index lookups are
+    fast sqlite reads and stay synchronous.
+    """
+    entry = lookup(url, kind)
+    if entry is not None and entry.fresh:
+        return CachedResponse(entry.body, entry.content_type, from_cache=True)
+
+    headers = entry.conditional_headers() if entry is not None else {}
+    async with svc.limit("http"):
+        response = await svc.http.get(url, headers=headers)
+
+    if response.status_code == 304 and entry is not None:
+        touch(entry)
+        return CachedResponse(entry.body, entry.content_type, from_cache=True)
+
+    response.raise_for_status()
+
+    content_type = response.headers.get('Content-Type', '')
+    store(
+        url, kind, response.content,
+        content_type=content_type,
+        etag=response.headers.get('ETag'),
+        last_modified=response.headers.get('Last-Modified'),
+        strategy=strategy,
+    )
+    return CachedResponse(response.content, content_type, from_cache=False)
@@ -0,0 +1,245 @@
+"""
+Process-wide pooled HTTP sessions
+
+One keep-alive session per host (so repeated hits to the same retailer or
+CDN reuse warm TCP/TLS connections), a persistent cookie jar per domain
+(keeps Cloudflare clearance between runs) and a shared retry/timeout policy.
+"""
+
+import atexit
+import os
+import pickle
+import threading
+import time
+from pathlib import Path
+from urllib.parse import urlparse
+
+
+DEFAULT_TIMEOUT = (5, 15)  # (connect, read) seconds
+POOL_MAXSIZE = 10
+RETRY_TOTAL = 3
+RETRY_BACKOFF = 0.5
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+COOKIE_DIR = Path(os.environ.get(
+    "HTTP_COOKIE_DIR",
+    Path.home() / ".history_memory" / "cookies"
+))
+
+USER_AGENT = 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+
+_sessions = {}
+_http2_clients = {}
+_lock = threading.Lock()
+
+
+def _host_of(url):
+    return (urlparse(url).hostname or '').lower()
+
+
+def _cookie_path(host):
+    return COOKIE_DIR / f"{host}.pkl"
+
+
+def _retry_policy():
+    from urllib3.util.retry import Retry
+
+    return Retry(
+        total=RETRY_TOTAL,
+        backoff_factor=RETRY_BACKOFF,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset(['GET', 'HEAD']),
+        respect_retry_after_header=True,
+    )
+
+
+def _mount_pools(session):
+    """Attach keep-alive pools with the shared retry policy"""
+    from requests.adapters import HTTPAdapter
+
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_MAXSIZE, max_retries=_retry_policy())
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+
+def _tune_pools(session):
+    """
+    Apply the pool size and retry policy to the adapters a session already
+    has. cloudscraper mounts its own TLS cipher-suite adapter on https://;
+    replacing it would lose the fingerprint that gets past Cloudflare.
+    """
+    from requests.adapters import HTTPAdapter
+
+    for adapter in set(session.adapters.values()):
+        if isinstance(adapter, HTTPAdapter):
+            adapter.max_retries = _retry_policy()
+            adapter.init_poolmanager(1, POOL_MAXSIZE)
+
+
+def _load_cookies(session, host):
+    path = _cookie_path(host)
+    if not path.exists():
+        return
+    try:
+        with open(path, 'rb') as f:
+            session.cookies.update(pickle.load(f))
+    except Exception as e:
+        print(f"⚠ Could not load cookies for {host}: {e}")
+
+
+def _create_session(host, cloudflare):
+    session = None
+    if cloudflare:
+        try:
+            import cloudscraper
+            session = cloudscraper.create_scraper(
+                browser={
+                    'browser': 'chrome',
+                    'platform': 'darwin',
+                    'desktop': True
+                }
+            )
+        except ImportError:
+            session = None
+
+    if session is None:
+        import requests
+        session = requests.Session()
+        session.headers['User-Agent'] = USER_AGENT
+        _mount_pools(session)
+    else:
+        _tune_pools(session)
+
+    _load_cookies(session, host)
+    return session
+
+
+def get_session(url, cloudflare=False):
+    """
+    Get the shared session for the host of `url`
+
+    Args:
+        url: Any URL on the target host
+        cloudflare: Use a cloudscraper session (anti-bot challenge solving)
+
+    Returns:
+        requests.Session (or cloudscraper.CloudScraper) bound to this host
+    """
+    key = (_host_of(url), cloudflare)
+    session = _sessions.get(key)
+    if session is None:
+        with _lock:
+            session = _sessions.get(key)
+            if session is None:
+                session = _create_session(key[0], cloudflare)
+                _sessions[key] = session
+    return session
+
+
+def _get_http2_client(host):
+    """httpx client with HTTP/2 for this host, or None if httpx/h2 missing"""
+    client = _http2_clients.get(host)
+    if client is not None:
+        return client
+    try:
+        import h2  # noqa: F401
+        import httpx
+    except ImportError:
+        return None
+
+    with _lock:
+        client = _http2_clients.get(host)
+        if client is None:
+            client = httpx.Client(
+                http2=True,
+                headers={'User-Agent': USER_AGENT},
+                timeout=httpx.Timeout(DEFAULT_TIMEOUT[1], connect=DEFAULT_TIMEOUT[0]),
+                limits=httpx.Limits(max_keepalive_connections=POOL_MAXSIZE),
+                # Connect errors only; status retries are done in _http2_get
+                transport=httpx.HTTPTransport(http2=True, retries=RETRY_TOTAL),
+                follow_redirects=True,
+            )
+            _http2_clients[host] = client
+    return client
+
+
+def _httpx_timeout(timeout):
+    import httpx
+
+    if isinstance(timeout, tuple):
+        connect, read = timeout
+        return httpx.Timeout(read, connect=connect)
+    return httpx.Timeout(timeout)
+
+
+def _retry_after(response, attempt):
+    """Seconds to wait before retrying a RETRY_STATUSES response"""
+    try:
+        return min(float(response.headers.get('Retry-After', '')), 60.0)
+    except ValueError:
+        return RETRY_BACKOFF * (2 ** attempt)
+
+
+def _http2_get(client, url, timeout, **kwargs):
+    """client.get with the same status retries as the requests pools"""
+    timeout = _httpx_timeout(timeout)
+    for attempt in range(RETRY_TOTAL + 1):
+        response = client.get(url, timeout=timeout, **kwargs)
+        if response.status_code not in RETRY_STATUSES or attempt == RETRY_TOTAL:
+            return response
+        delay = _retry_after(response, attempt)
+        response.close()
+        time.sleep(delay)
+
+
+def fetch(url, cloudflare=False, timeout=DEFAULT_TIMEOUT, **kwargs):
+    """
+    GET `url` through the shared pool for its host
+
+    Plain (non-cloudflare) fetches go over HTTP/2 when httpx + h2 are
+    installed; otherwise over the pooled requests session.
+    """
+    if not cloudflare:
+        client = _get_http2_client(_host_of(url))
+        if client is not None:
+            return _http2_get(client, url, timeout, **kwargs)
+    return get_session(url, cloudflare=cloudflare).get(url, timeout=timeout, **kwargs)
+
+
+def save_cookies():
+    """Persist every session's cookie jar (one file per host)"""
+    if not _sessions:
+        return
+    try:
+        COOKIE_DIR.mkdir(parents=True, exist_ok=True)
+    except OSError:
+        return
+    merged = {}
+    for (host, _), session in _sessions.items():
+        merged.setdefault(host, []).append(session.cookies)
+    for host, jars in merged.items():
+        if not host:
+            continue
+        try:
+            jar = jars[0].copy()
+            for other in jars[1:]:
+                jar.update(other)
+            with open(_cookie_path(host), 'wb') as f:
+                pickle.dump(jar, f)
+        except Exception as e:
+            print(f"⚠ Could not save cookies for {host}: {e}")
+
+
+def close_all():
+    """Save cookies and close every pooled connection"""
+    save_cookies()
+    with _lock:
+        for session in _sessions.values():
+            session.close()
+        for client in _http2_clients.values():
+            client.close()
+        _sessions.clear()
+        _http2_clients.clear()
+
+
+atexit.register(close_all)
@@ -1,38 +1,32 @@
+import asyncio
 import json
 import os
 import re
-from io import BytesIO
-
-import requests
-from PIL import Image
 import uuid
 
 from openai import OpenAI
-from transformers import CLIPProcessor, CLIPModel
-import torch
 
 from azure.core.credentials import AzureKeyCredential
 from azure.search.documents import SearchClient
 
+from http_cache import cached_fetch, acached_fetch
+import embed_client
+import price_history
+import rate_limit
 
 
 AZURE_SEARCH_ENDPOINT = os.environ["AZURE_SEARCH_ENDPOINT"]
 AZURE_SEARCH_INDEX = os.environ["AZURE_SEARCH_INDEX"]
 AZURE_SEARCH_ADMIN_KEY = os.environ["AZURE_SEARCH_ADMIN_KEY"]
 
-openai_client = OpenAI(api_key=os.environ["OPENAI_API_KEY"])
-
-clip_model_name = "openai/clip-vit-base-patch32"
-clip_model = CLIPModel.from_pretrained(clip_model_name)
-clip_processor = CLIPProcessor.from_pretrained(clip_model_name)
-
-device = "cuda" if torch.cuda.is_available() else "cpu"
-clip_model = clip_model.to(device)
+# Retries / throttling are handled by rate_limit
+openai_client = OpenAI(api_key=os.environ["OPENAI_API_KEY"], max_retries=0)
 
 search_client = SearchClient(
     endpoint=AZURE_SEARCH_ENDPOINT,
     index_name=AZURE_SEARCH_INDEX,
     credential=AzureKeyCredential(AZURE_SEARCH_ADMIN_KEY),
+    retry_total=0,
 )
 
 
@@ -74,50 +68,51 @@ def build_text_from_product(p: dict) -> str:
 
 
 def embed_text(text: str) -> list[float]:
-    resp = openai_client.embeddings.create(
+    resp = rate_limit.call(
+        "openai", openai_client.embeddings.with_raw_response.create,
         model="text-embedding-3-small",
         input=text,
     )
     return resp.data[0].embedding
 
 
-def embed_image_from_url(url: str) -> list[float] | None:
-    try:
-        resp = requests.get(url, timeout=10)
-        resp.raise_for_status()
-
-        image = Image.open(BytesIO(resp.content)).convert("RGB")
-
-        if image.size[0] < 50 or image.size[1] < 50:
-            print(f"Skipping tiny image: {image.size}")
-            return None
-
-        inputs = clip_processor(images=image, return_tensors="pt").to(device)
+def embed_image_bytes(content: bytes) -> list[float] | None:
+    # Shared embedding service when running, else a CPU pool worker (see embed_client)
+    return embed_client.embed_image_bytes(content)
 
-        with torch.no_grad():
-            image_features = clip_model.get_image_features(**inputs)
 
-        image_features = image_features / image_features.norm(p=2, dim=-1, keepdim=True)
-        return image_features.squeeze().cpu().tolist()
+def embed_image_from_url(url: str) -> list[float] | None:
+    try:
+        resp = cached_fetch(url, 'image')
+        return embed_image_bytes(resp.content)
     except Exception as e:
         print(f"Error embedding image: {e}")
         return None 
 
 
-
-def ingest_product_to_azure_search(product: dict):
-    content_text = build_text_from_product(product)
-    text_vec = embed_text(content_text)
-
-    img_vec = None
-    if product.get("main_image"):
-        img_vec = embed_image_from_url(product["main_image"])
-
+def document_id(product: dict) -> str:
     url = product.get("url")
     if url:
-        doc_id = str(uuid.uuid5(uuid.NAMESPACE_URL, url))
-    else:
-        doc_id = str(uuid.uuid4())
+        return price_history.doc_id_for_url(url)
+    return str(uuid.uuid4())
+
+
+def record_price(product: dict):
+    """Add this visit's parsed price to the product's price history"""
+    price = parse_price(product.get("price"))
+    if price is None or not product.get("url"):
+        return
+    # Extension visit times are epoch milliseconds
+    visit_time = product.get("lastVisitTime")
+    ts = visit_time / 1000 if isinstance(visit_time, (int, float)) and visit_time > 1e11 else visit_time
+    try:
+        price_history.record(document_id(product), price, ts)
+    except Exception as e:
+        print(f"Error recording price history: {e}")
+
+
+def build_search_document(product: dict, content_text: str, text_vec, img_vec) -> dict:
+    doc_id = document_id(product)
 
     attrs = product.get("additional_attributes", {})
 
@@ -139,11 +134,127 @@ def ingest_product_to_azure_search(product: dict):
     if img_vec is not None:
         doc["image_vector"] = img_vec
 
-    result = search_client.upload_documents(documents=[doc])
+    return doc
+
+
+def ingest_product_to_azure_search(product: dict):
+    content_text = build_text_from_product(product)
+    text_vec = embed_text(content_text)
+
+    img_vec = None
+    if product.get("main_image"):
+        img_vec = embed_image_from_url(product["main_image"])
+
+    doc = build_search_document(product, content_text, text_vec, img_vec)
+
+    result = rate_limit.call("search", search_client.upload_documents, documents=[doc])
     print("Upload result:", result)
     return result
 
 
+def build_visit_update(product: dict) -> dict:
+    """
+    Partial document for a revisit whose content was reused (see
+    content_fingerprint): the product JSON with the new visit fields, plus
+    the price fields when only the price changed. Vectors are untouched.
+    """
+    doc = {
+        "id": document_id(product),
+        "product_json": json.dumps(product),
+    }
+    if product.get("content_change") == "price":
+        doc["price"] = parse_price(product.get("price"))
+    return doc
+
+
+def _merge_missed(result) -> bool:
+    """The merge found no document (never uploaded, or deleted since)"""
+    return any(not r.succeeded and r.status_code == 404 for r in result)
+
+
+def update_product_visit(product: dict):
+    """merge_documents for a reused extraction; full ingest if the doc is missing"""
+    doc = build_visit_update(product)
+    result = rate_limit.call("search", search_client.merge_documents, documents=[doc])
+    if _merge_missed(result):
+        print("Document not in the index yet, uploading in full")
+        return ingest_product_to_azure_search(product)
+    print("Merge result:", result)
+    return result
+
+
+async def aembed_text(svc, text: str) -> list[float]:
+    async with svc.limit("openai"):
+        resp = await rate_limit.acall(
+            "openai", svc.openai.embeddings.with_raw_response.create,
+            model="text-embedding-3-small",
+            input=text,
+        )
+    return resp.data[0].embedding
+
+
+async def aembed_image_from_url(svc, url: str) -> list[float] | None:
+    try:
+        resp = await acached_fetch(svc, url, 'image')
+        # CLIP is CPU-bound: keep it off the event loop
+        return await asyncio.to_thread(embed_image_bytes, resp.content)
+    except Exception as e:
+        print(f"Error embedding image: {e}")
+        return None
+
+
+async def aingest_product_to_azure_search(svc, product: dict):
+    """Async ingest: text + image embeddings concurrently, aio Search upload"""
+    content_text = build_text_from_product(product)
+
+    if product.get("main_image"):
+        text_vec, img_vec = await asyncio.gather(
+            aembed_text(svc, content_text),
+            aembed_image_from_url(svc, product["main_image"]),
+        )
+    else:
+        text_vec, img_vec = await aembed_text(svc, content_text), None
+
+    doc = build_search_document(product, content_text, text_vec, img_vec)
+
+    async with svc.limit("search"):
+        result = await rate_limit.acall("search", svc.search.upload_documents, documents=[doc])
+    print("Upload result:", result)
+    return result
+
+
+async def aupdate_product_visit(svc, product: dict):
+    """Async update_product_visit"""
+    doc = build_visit_update(product)
+    async with svc.limit("search"):
+        result = await rate_limit.acall("search", svc.search.merge_documents, documents=[doc])
+    if _merge_missed(result):
+        print("Document not in the index yet, uploading in full")
+        return await aingest_product_to_azure_search(svc, product)
+    print("Merge result:", result)
+    return result
+
+
+
+def ingest_product(product: dict):
+    """Full upload, or only a merge of the visit/price fields for reused extractions"""
+    if product.get("content_change") in ("unchanged", "price"):
+        result = update_product_visit(product)
+    else:
+        result = ingest_product_to_azure_search(product)
+    record_price(product)
+    return result
+
+
+async def aingest_product(svc, product: dict):
+    """Async ingest_product"""
+    if product.get("content_change") in ("unchanged", "price"):
+        result = await aupdate_product_visit(svc, product)
+    else:
+        result = await aingest_product_to_azure_search(svc, product)
+    record_price(product)
+    return result
+
 
 def ingest_products_batch(products: list[dict]):
     total = len(products)
@@ -153,7 +264,7 @@ def ingest_products_batch(products: list[dict]):
     for idx, product in enumerate(products, 1):
         print(f"\n[{idx}/{total}] Processing: {product.get('product_name', 'Unknown')}")
         try:
-            ingest_product_to_azure_search(product)
+            ingest_product(product)
             successful += 1
         except Exception as e:
             failed += 1
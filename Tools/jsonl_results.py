@@ -0,0 +1,115 @@
+"""
+Append-only JSONL results file for the history scraping scripts
+
+One JSON object per line, appended as each URL finishes and fsync'd every
+FSYNC_EVERY results, so a run costs O(n) writes instead of rewriting the
+whole results file per URL. A rerun reads the URLs already recorded and
+skips them; `finalize` converts the JSONL into the legacy JSON array.
+"""
+
+import json
+import os
+from pathlib import Path
+
+
+FSYNC_EVERY = 20
+
+
+def read_results(path):
+    """Yield the complete result lines of a JSONL file (a torn last line is ignored)"""
+    path = Path(path)
+    if not path.exists():
+        return
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.endswith('\n'):
+                break
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+
+def done_urls(path, retry_failed=False):
+    """URLs already recorded in the results file (only successes with retry_failed)"""
+    return {
+        r.get('url') for r in read_results(path)
+        if r.get('url') and (r.get('success') or not retry_failed)
+    }
+
+
+class ResultWriter:
+    """Appends results to a JSONL file, fsync'ing every `fsync_every` lines"""
+
+    def __init__(self, path, fsync_every=FSYNC_EVERY):
+        self.path = Path(path)
+        self.fsync_every = fsync_every
+        self.pending = 0
+        self.file = open(self.path, 'ab')
+        self._drop_torn_line()
+
+    def _drop_torn_line(self):
+        """Cut a partial last line left by a crash mid-write"""
+        size = self.file.seek(0, os.SEEK_END)
+        if not size:
+            return
+        with open(self.path, 'rb') as f:
+            f.seek(max(0, size - 1))
+            if f.read(1) == b'\n':
+                return
+            # Walk back to the previous newline
+            pos = size
+            while pos > 0:
+                step = min(65536, pos)
+                f.seek(pos - step)
+                block = f.read(step)
+                newline = block.rfind(b'\n')
+                if newline != -1:
+                    pos = pos - step + newline + 1
+                    break
+                pos -= step
+        self.file.truncate(pos)
+        self.file.seek(0, os.SEEK_END)
+
+    def write(self, result):
+        self.file.write((json.dumps(result, ensure_ascii=False) + '\n').encode('utf-8'))
+        self.pending += 1
+        if self.pending >= self.fsync_every:
+            self.sync()
+
+    def sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.pending = 0
+
+    def close(self):
+        self.sync()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def finalize(jsonl_path, json_path=None):
+    """
+    Convert the JSONL results to the legacy JSON array (last result per URL wins)
+
+    Returns:
+        Path of the JSON file written
+    """
+    jsonl_path = Path(jsonl_path)
+    json_path = Path(json_path) if json_path else jsonl_path.with_suffix('.json')
+
+    results = {}
+    for result in read_results(jsonl_path):
+        results.pop(result.get('url'), None)
+        results[result.get('url')] = result
+
+    tmp_path = json_path.with_name(json_path.name + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(list(results.values()), f, indent=2)
+    os.replace(tmp_path, json_path)
+    return json_path
@@ -0,0 +1,174 @@
+"""
+Persistent cache for LLM JSON extractions
+
+Keyed by (model, prompt version, hash of the normalized input text), where
+the prompt version is a hash of the system prompt — which embeds
+JSON_SCHEMA_EXAMPLE — so editing either invalidates old entries
+automatically. Tracks hit rate and tokens saved.
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+
+CACHE_PATH = Path(os.environ.get(
+    "LLM_CACHE_PATH",
+    Path.home() / ".history_memory" / "llm_cache.db"
+))
+CACHE_ENABLED = os.environ.get("LLM_CACHE_DISABLED", "0") != "1"
+
+_WHITESPACE_RE = re.compile(r'\s+')
+_local = threading.local()
+
+
+def _db():
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and getattr(_local, 'pid', None) == os.getpid():
+        return conn
+
+    CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(CACHE_PATH, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS extractions (
+            key TEXT PRIMARY KEY,
+            model TEXT,
+            prompt_version TEXT,
+            result TEXT,
+            prompt_tokens INTEGER,
+            completion_tokens INTEGER,
+            created_at REAL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS stats (
+            prompt_version TEXT PRIMARY KEY,
+            hits INTEGER DEFAULT 0,
+            misses INTEGER DEFAULT 0,
+            saved_prompt_tokens INTEGER DEFAULT 0,
+            saved_completion_tokens INTEGER DEFAULT 0
+        )
+    """)
+    conn.commit()
+    _local.conn = conn
+    _local.pid = os.getpid()
+    return conn
+
+
+def prompt_version(system_prompt):
+    """Short hash identifying a system prompt (and the schema inside it)"""
+    return hashlib.sha256(system_prompt.encode('utf-8')).hexdigest()[:16]
+
+
+def normalize(text):
+    """Collapse whitespace so re-renders with different spacing share a key"""
+    return _WHITESPACE_RE.sub(' ', text or '').strip()
+
+
+def make_key(model, system_prompt, *inputs):
+    """
+    Cache key for one extraction
+
+    Args:
+        model: Chat model name
+        system_prompt: Full system prompt sent with the request
+        *inputs: Input texts (str) or structured inputs (dict/list, hashed as sorted JSON)
+    """
+    digest = hashlib.sha256()
+    for value in inputs:
+        if not isinstance(value, str):
+            value = json.dumps(value, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+        digest.update(normalize(value).encode('utf-8'))
+        digest.update(b'\x00')
+    return f"{model}|{prompt_version(system_prompt)}|{digest.hexdigest()}"
+
+
+def _bump(conn, version, hits=0, misses=0, prompt_tokens=0, completion_tokens=0):
+    conn.execute("INSERT OR IGNORE INTO stats (prompt_version) VALUES (?)", (version,))
+    conn.execute(
+        "UPDATE stats SET hits = hits + ?, misses = misses + ?, "
+        "saved_prompt_tokens = saved_prompt_tokens + ?, "
+        "saved_completion_tokens = saved_completion_tokens + ? "
+        "WHERE prompt_version = ?",
+        (hits, misses, prompt_tokens, completion_tokens, version)
+    )
+    conn.commit()
+
+
+def get(key):
+    """Cached result dict for `key`, or None (records the hit / miss)"""
+    if not CACHE_ENABLED:
+        return None
+
+    version = key.split('|')[1]
+    conn = _db()
+    row = conn.execute(
+        "SELECT result, prompt_tokens, completion_tokens FROM extractions WHERE key = ?", (key,)
+    ).fetchone()
+
+    if row is None:
+        _bump(conn, version, misses=1)
+        return None
+
+    _bump(conn, version, hits=1, prompt_tokens=row[1] or 0, completion_tokens=row[2] or 0)
+    return json.loads(row[0])
+
+
+def put(key, result, usage=None):
+    """Store an extraction result with the token usage it cost"""
+    if not CACHE_ENABLED:
+        return
+
+    model, version, _ = key.split('|')
+    conn = _db()
+    conn.execute(
+        "INSERT OR REPLACE INTO extractions "
+        "(key, model, prompt_version, result, prompt_tokens, completion_tokens, created_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (
+            key, model, version, json.dumps(result, ensure_ascii=False),
+            getattr(usage, 'prompt_tokens', 0) or 0,
+            getattr(usage, 'completion_tokens', 0) or 0,
+            time.time(),
+        )
+    )
+    conn.commit()
+
+
+def stats():
+    """Totals across prompt versions: hits, misses, hit_rate, saved tokens"""
+    conn = _db()
+    hits, misses, saved_prompt, saved_completion = conn.execute(
+        "SELECT COALESCE(SUM(hits), 0), COALESCE(SUM(misses), 0), "
+        "COALESCE(SUM(saved_prompt_tokens), 0), COALESCE(SUM(saved_completion_tokens), 0) FROM stats"
+    ).fetchone()
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": round(hits / total, 3) if total else 0.0,
+        "saved_prompt_tokens": saved_prompt,
+        "saved_completion_tokens": saved_completion,
+    }
+
+
+def purge_stale(current_versions):
+    """Delete entries whose prompt version is no longer in use"""
+    conn = _db()
+    placeholders = ','.join('?' * len(current_versions))
+    deleted = conn.execute(
+        f"DELETE FROM extractions WHERE prompt_version NOT IN ({placeholders})",
+        list(current_versions)
+    ).rowcount
+    conn.commit()
+    return deleted
+
+
+if __name__ == "__main__":
+    print(json.dumps(stats(), indent=2))
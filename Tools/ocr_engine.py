@@ -0,0 +1,119 @@
+"""
+In-process OCR with a pool of reusable Tesseract engines
+
+Uses tesserocr (libtesseract bindings) so a page pays no process spawn and
+no disk round trip: screenshots are passed in as PNG bytes, numpy arrays or
+PIL images. One engine per core by default. Falls back to pytesseract (the
+`tesseract` binary on PATH) when tesserocr is not installed.
+"""
+
+import os
+import queue
+import threading
+from contextlib import contextmanager
+from io import BytesIO
+from pathlib import Path
+
+from PIL import Image
+
+
+OCR_LANG = os.environ.get("OCR_LANG", "eng")
+OCR_POOL_SIZE = int(os.environ.get("OCR_POOL_SIZE", os.cpu_count() or 1))
+
+try:
+    import tesserocr
+    TESSEROCR_AVAILABLE = True
+except ImportError:
+    TESSEROCR_AVAILABLE = False
+
+
+def to_pil(image):
+    """Accept PNG/JPEG bytes, a file path, a numpy array or a PIL image"""
+    if isinstance(image, Image.Image):
+        return image
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return Image.open(BytesIO(bytes(image)))
+    if isinstance(image, (str, Path)):
+        if not os.path.exists(image):
+            raise FileNotFoundError(f"Screenshot not found: {image}")
+        return Image.open(image)
+    if hasattr(image, '__array_interface__'):
+        return Image.fromarray(image)
+    raise TypeError(f"Unsupported image type: {type(image).__name__}")
+
+
+class EnginePool:
+    """
+    Fixed-size pool of tesserocr.PyTessBaseAPI instances
+
+    Engines are created lazily (initialising one loads the language model)
+    and reused across pages; callers block when all engines are busy.
+    """
+
+    def __init__(self, size=OCR_POOL_SIZE, lang=OCR_LANG):
+        self.size = max(1, size)
+        self.lang = lang
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                return tesserocr.PyTessBaseAPI(lang=self.lang)
+        return self._idle.get()
+
+    @contextmanager
+    def engine(self):
+        api = self._acquire()
+        try:
+            yield api
+        finally:
+            api.Clear()
+            self._idle.put(api)
+
+    def ocr(self, image):
+        with self.engine() as api:
+            api.SetImage(to_pil(image))
+            return api.GetUTF8Text()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().End()
+            except queue.Empty:
+                break
+        self._created = 0
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Process-wide engine pool (created on first use)"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = EnginePool()
+    return _pool
+
+
+def ocr(image):
+    """
+    OCR an in-memory image (or path) and return the text
+
+    Args:
+        image: PNG/JPEG bytes, file path, numpy array or PIL image
+    """
+    if TESSEROCR_AVAILABLE:
+        return get_pool().ocr(image)
+
+    import pytesseract
+    return pytesseract.image_to_string(to_pil(image), lang=OCR_LANG, timeout=30)
@@ -0,0 +1,152 @@
+"""
+Region-of-interest OCR
+
+Instead of OCRing the whole viewport (nav bars, cookie banners, carousels),
+crop the screenshot to the DOM boxes of the title, price, brand and buy-box
+elements measured in the same render, binarize and downscale each tile, and
+OCR the tiles in parallel on the pooled engines.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+import ocr_engine
+
+
+# Evaluated in the page right before the screenshot. Returns device-pixel
+# boxes of visible product regions: [{name, x, y, w, h}, ...]
+REGION_BOXES_JS = """
+const groups = {
+    title: ['#productTitle', '[itemprop="name"]', '[data-testid*="title" i]',
+            '[class*="product-title" i]', '[class*="product_title" i]', 'h1'],
+    brand: ['#bylineInfo', '[itemprop="brand"]', '[class*="brand" i]'],
+    price: ['#corePrice_feature_div', '[itemprop="price"]', '[data-testid*="price" i]',
+            '[class*="price" i]'],
+    buybox: ['#buybox', '#desktop_buybox', '[id*="buy-box" i]', '[class*="buy-box" i]',
+             '[class*="buybox" i]', '[class*="add-to-cart" i]', 'form[action*="cart" i]']
+};
+const dpr = window.devicePixelRatio || 1;
+const vw = window.innerWidth, vh = window.innerHeight;
+const boxes = [];
+for (const [name, selectors] of Object.entries(groups)) {
+    let taken = 0;
+    for (const sel of selectors) {
+        for (const el of document.querySelectorAll(sel)) {
+            const r = el.getBoundingClientRect();
+            if (r.width < 10 || r.height < 8) continue;
+            if (r.bottom <= 0 || r.right <= 0 || r.top >= vh || r.left >= vw) continue;
+            if (r.height > vh * 0.9) continue;
+            const x = Math.max(0, r.left), y = Math.max(0, r.top);
+            const w = Math.min(vw, r.right) - x, h = Math.min(vh, r.bottom) - y;
+            boxes.push({name, x: x * dpr, y: y * dpr, w: w * dpr, h: h * dpr});
+            if (++taken >= 2) break;
+        }
+        if (taken >= 2) break;
+    }
+}
+return boxes;
+"""
+
+TILE_PADDING = 8        # px added around every box
+MAX_TILE_WIDTH = 1200   # wider tiles are downscaled to this width
+MIN_REGION_TEXT = 3     # below this, fall back to the full screenshot
+
+
+def _merge_boxes(boxes):
+    """Merge overlapping boxes so shared areas are OCRed once"""
+    merged = []
+    for box in sorted(boxes, key=lambda b: (b['y'], b['x'])):
+        for m in merged:
+            if (box['x'] < m['x'] + m['w'] and m['x'] < box['x'] + box['w'] and
+                    box['y'] < m['y'] + m['h'] and m['y'] < box['y'] + box['h']):
+                x2 = max(m['x'] + m['w'], box['x'] + box['w'])
+                y2 = max(m['y'] + m['h'], box['y'] + box['h'])
+                m['x'], m['y'] = min(m['x'], box['x']), min(m['y'], box['y'])
+                m['w'], m['h'] = x2 - m['x'], y2 - m['y']
+                if box['name'] not in m['name'].split('+'):
+                    m['name'] = f"{m['name']}+{box['name']}"
+                break
+        else:
+            merged.append(dict(box))
+    return merged
+
+
+def _otsu_threshold(gray):
+    """Otsu threshold from a grayscale PIL image histogram"""
+    hist = gray.histogram()
+    total = sum(hist)
+    sum_all = sum(i * h for i, h in enumerate(hist))
+    sum_bg = weight_bg = 0
+    best, threshold = 0, 127
+    for i, h in enumerate(hist):
+        weight_bg += h
+        if weight_bg == 0:
+            continue
+        weight_fg = total - weight_bg
+        if weight_fg == 0:
+            break
+        sum_bg += i * h
+        mean_bg = sum_bg / weight_bg
+        mean_fg = (sum_all - sum_bg) / weight_fg
+        between = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+        if between > best:
+            best, threshold = between, i
+    return threshold
+
+
+def preprocess_tile(image):
+    """Grayscale → downscale → binarize"""
+    gray = image.convert('L')
+
+    scale = MAX_TILE_WIDTH / gray.width
+    if scale < 1.0:
+        gray = gray.resize((max(1, int(gray.width * scale)), max(1, int(gray.height * scale))),
+                           Image.LANCZOS)
+
+    threshold = _otsu_threshold(gray)
+    return gray.point(lambda p: 255 if p > threshold else 0)
+
+
+def crop_regions(screenshot, boxes):
+    """Crop (padded, merged) region boxes out of the screenshot → [(name, tile)]"""
+    image = ocr_engine.to_pil(screenshot)
+    tiles = []
+    for box in _merge_boxes(boxes):
+        left = max(0, int(box['x']) - TILE_PADDING)
+        top = max(0, int(box['y']) - TILE_PADDING)
+        right = min(image.width, int(box['x'] + box['w']) + TILE_PADDING)
+        bottom = min(image.height, int(box['y'] + box['h']) + TILE_PADDING)
+        if right - left < 10 or bottom - top < 8:
+            continue
+        tiles.append((box['name'], preprocess_tile(image.crop((left, top, right, bottom)))))
+    return tiles
+
+
+def ocr_regions(screenshot, boxes):
+    """
+    OCR only the product regions of a screenshot
+
+    Args:
+        screenshot: PNG bytes / PIL image of the viewport
+        boxes: Region boxes from REGION_BOXES_JS (same render)
+
+    Returns:
+        Text labelled per region, e.g. "[title]\\n...\\n\\n[price]\\n...".
+        Falls back to full-screenshot OCR when no usable regions were found.
+    """
+    tiles = crop_regions(screenshot, boxes or [])
+
+    if tiles:
+        print(f"OCR on {len(tiles)} region tile(s): {', '.join(name for name, _ in tiles)}")
+        workers = min(len(tiles), ocr_engine.OCR_POOL_SIZE)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            texts = list(pool.map(ocr_engine.ocr, [tile for _, tile in tiles]))
+
+        parts = [f"[{name}]\n{text.strip()}" for (name, _), text in zip(tiles, texts) if text.strip()]
+        region_text = "\n\n".join(parts)
+        if len(region_text) >= MIN_REGION_TEXT:
+            return region_text
+
+    print("No usable product regions, OCR on full screenshot")
+    return ocr_engine.ocr(screenshot)
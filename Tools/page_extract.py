@@ -0,0 +1,458 @@
+"""
+Single-pass page extraction for robust_scraper
+
+Parses with lxml when available and visits the DOM once, collecting images,
+headings, meta tags, JSON-LD and price candidates together. Produces the same
+(main_image, all_images, text_data) as the per-feature soup helpers in
+robust_scraper, which are kept as the reference implementation.
+"""
+
+import json
+import re
+from urllib.parse import urljoin
+
+
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = 'lxml'
+except ImportError:
+    HTML_PARSER = 'html.parser'
+
+
+IMG_SRC_ATTRS = ('src', 'data-src', 'data-lazy-src', 'data-srcset', 'data-original')
+HEADING_LEVELS = {'h1': 1, 'h2': 2, 'h3': 3, 'h4': 4, 'h5': 5, 'h6': 6}
+REMOVED_TAGS = {'script', 'style', 'nav', 'footer', 'header'}
+
+MAIN_CONTENT_RE = re.compile(r'(content|main|article|product|detail)', re.I)
+PRICE_CLASS_RE = re.compile(r'price', re.I)
+WHITESPACE_RE = re.compile(r'\s+')
+
+GOOD_CLASS_RE = re.compile('product|hero|main|feature|gallery|zoom|primary')
+JUNK_CLASS_RE = re.compile('logo|icon|sprite|banner|ad|social|avatar|thumb|badge|button|nav')
+JUNK_URL_RE = re.compile(
+    'logo|icon|sprite|banner|ad|social|avatar|badge|button|arrow|placeholder|'
+    'transparent-pixel|grey-pixel|gray-pixel|spacer|loading|1x1'
+)
+GOOD_URL_RE = re.compile('product|hero|main|feature|gallery|zoom|item')
+PARENT_HINT_RE = re.compile('product|main|content|gallery|detail')
+
+
+def make_soup(markup):
+    """Parse HTML with the fastest available BeautifulSoup tree builder"""
+    from bs4 import BeautifulSoup
+    return BeautifulSoup(markup, HTML_PARSER)
+
+
+def _class_str(tag):
+    return ' '.join(tag.get('class', []))
+
+
+def _image_src(img, url):
+    """Resolve an <img> source the same way robust_scraper does"""
+    src = None
+    for attr in IMG_SRC_ATTRS:
+        src = img.get(attr)
+        if src:
+            break
+
+    if not src or src.startswith('data:'):
+        return None
+
+    # Handle srcset - take first URL
+    if ',' in str(src):
+        src = src.split(',')[0].split()[0]
+
+    # Make URL absolute if relative
+    if src.startswith('//'):
+        src = 'https:' + src
+    elif src.startswith('/'):
+        src = urljoin(url, src)
+
+    return src
+
+
+def _score_image(img, src, in_hint_parent):
+    """Heuristic score for one image, or None if it should be skipped"""
+    width = img.get('width')
+    height = img.get('height')
+    alt = img.get('alt', '')
+    class_lower = _class_str(img).lower()
+
+    try:
+        width = int(width) if width else 0
+        height = int(height) if height else 0
+    except (ValueError, TypeError):
+        width = 0
+        height = 0
+
+    # Skip tiny images
+    if width and height and (width < 100 or height < 100):
+        return None
+
+    score = 0
+
+    if width and height:
+        score += min(width * height / 10000, 100)
+        ratio = width / height if height > 0 else 0
+        if 0.5 < ratio < 2.5:
+            score += 30
+    else:
+        score += 20
+
+    if len(alt) > 10:
+        score += min(len(alt) / 2, 30)
+
+    if GOOD_CLASS_RE.search(class_lower):
+        score += 50
+    if JUNK_CLASS_RE.search(class_lower):
+        score -= 50
+
+    lower_src = src.lower()
+    if JUNK_URL_RE.search(lower_src):
+        score -= 50
+    if GOOD_URL_RE.search(lower_src):
+        score += 40
+
+    if in_hint_parent:
+        score += 30
+
+    return {
+        'src': src,
+        'score': score,
+        'width': width,
+        'height': height,
+        'alt': alt[:50],
+    }
+
+
+def _image_from_json_ld(scripts):
+    for script in scripts:
+        try:
+            data = json.loads(script.string)
+            data_list = data if isinstance(data, list) else [data]
+
+            for item in data_list:
+                if item.get('@type') == 'Product' and 'image' in item:
+                    image = item['image']
+                    if isinstance(image, str):
+                        return image
+                    elif isinstance(image, list) and len(image) > 0:
+                        return image[0] if isinstance(image[0], str) else image[0].get('url')
+                    elif isinstance(image, dict) and image.get('url'):
+                        return image['url']
+        except (json.JSONDecodeError, AttributeError, TypeError):
+            continue
+    return None
+
+
+def brand_from_json_ld(scripts):
+    """Brand name from a Schema.org Product block, if any"""
+    for script in scripts:
+        try:
+            data = json.loads(script.string)
+            data_list = data if isinstance(data, list) else [data]
+
+            for item in data_list:
+                if item.get('@type') == 'Product' and item.get('brand'):
+                    brand = item['brand']
+                    if isinstance(brand, list):
+                        brand = brand[0] if brand else None
+                    if isinstance(brand, dict):
+                        brand = brand.get('name')
+                    if isinstance(brand, str) and brand.strip():
+                        return brand.strip()
+        except (json.JSONDecodeError, AttributeError, TypeError):
+            continue
+    return None
+
+
+def brand_from_tags(meta_brand, itemprop_brand):
+    """Brand from <meta property="product:brand"> or an itemprop="brand" element"""
+    if meta_brand and meta_brand.get('content', '').strip():
+        return meta_brand['content'].strip()
+    if itemprop_brand:
+        text = itemprop_brand.get('content') or itemprop_brand.get_text(strip=True)
+        if text and text.strip():
+            return text.strip()
+    return None
+
+
+def _subtree_end(tag):
+    """First tag after `tag`'s subtree in document order (None = end of doc)"""
+    node = tag
+    while node is not None:
+        sibling = node.find_next_sibling(True)
+        if sibling is not None:
+            return sibling
+        node = node.parent
+    return None
+
+
+def scan(soup):
+    """
+    Visit every tag once and collect everything the extractors need
+    """
+    found = {
+        'title': None, 'meta_description': None, 'og_description': None,
+        'og_image': None, 'h1': None, 'main': None, 'article': None,
+        'div_class': None, 'div_id': None, 'body': None,
+        'meta_brand': None, 'itemprop_brand': None,
+    }
+    json_ld = []
+    images = []
+    headings = {level: [] for level in HEADING_LEVELS.values()}
+    og_prices = []
+    price_tags = []
+    removable = []
+    order = {}
+    hint = {id(soup): False}
+
+    for idx, tag in enumerate(soup.find_all(True)):
+        name = tag.name
+        tag_id = tag.get('id')
+        class_str = _class_str(tag)
+        order[id(tag)] = idx
+
+        # Ancestor hint flag: this tag or any ancestor looks like product content
+        parent_hint = hint.get(id(tag.parent), False)
+        hint[id(tag)] = parent_hint or bool(
+            PARENT_HINT_RE.search(class_str.lower()) or
+            (tag_id and PARENT_HINT_RE.search(str(tag_id).lower()))
+        )
+
+        if name == 'img':
+            images.append((tag, parent_hint))
+        elif name in HEADING_LEVELS:
+            headings[HEADING_LEVELS[name]].append(tag)
+            if name == 'h1' and found['h1'] is None:
+                found['h1'] = tag
+        elif name == 'meta':
+            prop = tag.get('property')
+            if prop == 'og:image' and found['og_image'] is None:
+                found['og_image'] = tag
+            elif prop == 'og:description' and found['og_description'] is None:
+                found['og_description'] = tag
+            elif prop == 'og:price:amount':
+                og_prices.append(tag)
+            elif prop in ('product:brand', 'og:brand') and found['meta_brand'] is None:
+                found['meta_brand'] = tag
+            if tag.get('name') == 'description' and found['meta_description'] is None:
+                found['meta_description'] = tag
+        elif name == 'script' and tag.get('type') == 'application/ld+json':
+            json_ld.append(tag)
+        elif name == 'title' and found['title'] is None:
+            found['title'] = tag
+        elif name in ('main', 'article', 'body') and found[name] is None:
+            found[name] = tag
+        elif name == 'div':
+            if found['div_class'] is None and class_str and MAIN_CONTENT_RE.search(class_str):
+                found['div_class'] = tag
+            if found['div_id'] is None and tag_id and MAIN_CONTENT_RE.search(str(tag_id)):
+                found['div_id'] = tag
+
+        if found['itemprop_brand'] is None and tag.get('itemprop') == 'brand':
+            found['itemprop_brand'] = tag
+        if name in REMOVED_TAGS:
+            removable.append(tag)
+        if class_str and PRICE_CLASS_RE.search(class_str):
+            price_tags.append(tag)
+
+    return {
+        **found,
+        'json_ld': json_ld,
+        'images': images,
+        'headings': headings,
+        'og_prices': og_prices,
+        'price_tags': price_tags,
+        'removable': removable,
+        'order': order,
+    }
+
+
+def representative_image(scanned, url):
+    """Same strategy order as get_representative_image_from_soup"""
+    og_image = scanned['og_image']
+    if og_image and og_image.get('content'):
+        print("✓ Found via Open Graph tag")
+        return og_image['content']
+
+    image = _image_from_json_ld(scanned['json_ld'])
+    if image:
+        print("✓ Found via Schema.org Product data")
+        return image
+
+    print("✓ Using heuristic scoring...")
+    scored_images = []
+    for img, in_hint_parent in scanned['images']:
+        src = _image_src(img, url)
+        if not src:
+            continue
+        scored = _score_image(img, src, in_hint_parent)
+        if scored is not None:
+            scored_images.append(scored)
+
+    if scored_images:
+        scored_images.sort(key=lambda x: x['score'], reverse=True)
+
+        print("\nTop 3 candidates:")
+        for i, img in enumerate(scored_images[:3], 1):
+            print(f"{i}. Score: {img['score']:.1f} | {img['width']}x{img['height']} | {img['alt']}")
+            print(f"   {img['src'][:100]}")
+
+        return scored_images[0]['src']
+
+    return None
+
+
+def all_images(scanned, url):
+    """Same output as get_all_images_from_soup"""
+    image_urls = []
+    for img, _ in scanned['images']:
+        src = _image_src(img, url)
+        if src:
+            image_urls.append({'url': src, 'alt': img.get('alt', '')})
+    return image_urls
+
+
+def text_content(scanned):
+    """
+    Same output as extract_text_from_soup (and, like it, strips
+    script/style/nav/footer/header out of the main content in place)
+    """
+    text_data = {}
+
+    title = scanned['title']
+    text_data['title'] = title.get_text(strip=True) if title else None
+
+    meta_desc = scanned['meta_description'] or scanned['og_description']
+    text_data['description'] = meta_desc.get('content', '').strip() if meta_desc else None
+
+    h1 = scanned['h1']
+    text_data['heading'] = h1.get_text(strip=True) if h1 else None
+
+    text_data['brand'] = (brand_from_json_ld(scanned['json_ld']) or
+                          brand_from_tags(scanned['meta_brand'], scanned['itemprop_brand']))
+
+    main_content = (scanned['main'] or scanned['article'] or
+                    scanned['div_class'] or scanned['div_id'] or scanned['body'])
+
+    if main_content:
+        # Decompose removable tags inside main_content using document-order ranges
+        order = scanned['order']
+        start = order[id(main_content)]
+        end_tag = _subtree_end(main_content)
+        end = order[id(end_tag)] if end_tag is not None else len(order)
+        for tag in scanned['removable']:
+            if start < order[id(tag)] < end and not tag.decomposed:
+                tag.decompose()
+
+        text = main_content.get_text(separator=' ', strip=True)
+        text = WHITESPACE_RE.sub(' ', text)
+        text_data['main_content'] = text[:5000]
+    else:
+        text_data['main_content'] = None
+
+    headings = []
+    for level in range(1, 7):
+        for heading in scanned['headings'][level]:
+            if heading.decomposed:
+                continue
+            heading_text = heading.get_text(strip=True)
+            if heading_text:
+                headings.append({'level': level, 'text': heading_text})
+    text_data['headings'] = headings[:20]
+
+    live_prices = [t for t in scanned['price_tags'] if not t.decomposed]
+    price_selectors = [
+        next((t for t in scanned['og_prices'] if not t.decomposed), None),
+        live_prices[0] if live_prices else None,
+        next((t for t in live_prices if t.name == 'span'), None),
+    ]
+
+    price = None
+    for selector in price_selectors:
+        if selector:
+            if selector.name == 'meta':
+                price = selector.get('content', '')
+            else:
+                price = selector.get_text(strip=True)
+            if price:
+                break
+
+    text_data['price'] = price
+
+    return text_data
+
+
+def extract_page(soup, url):
+    """
+    One DOM visit → (main_image, all_images, text_data)
+
+    Mutates `soup` (main content cleanup), so pass a fresh parse.
+    """
+    scanned = scan(soup)
+    images = all_images(scanned, url)
+    main_image = representative_image(scanned, url)
+    text_data = text_content(scanned)
+    return main_image, images, text_data
+
+
+def benchmark(paths, repeat=3):
+    """
+    Compare the legacy soup helpers against extract_page on saved HTML pages
+    """
+    import contextlib
+    import io
+    import time
+    from bs4 import BeautifulSoup
+
+    from robust_scraper import (
+        get_all_images_from_soup, get_representative_image_from_soup, extract_text_from_soup
+    )
+
+    legacy_total = fast_total = 0.0
+    mismatches = 0
+
+    for path in paths:
+        with open(path, 'rb') as f:
+            html = f.read()
+        url = 'https://example.com/'
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            for _ in range(repeat):
+                soup = BeautifulSoup(html, 'html.parser')
+                legacy = (
+                    get_representative_image_from_soup(soup, url),
+                    get_all_images_from_soup(soup, url),
+                    extract_text_from_soup(soup, url),
+                )
+            legacy_time = (time.perf_counter() - start) / repeat
+
+            start = time.perf_counter()
+            for _ in range(repeat):
+                main_image, images, text_data = extract_page(make_soup(html), url)
+            fast_time = (time.perf_counter() - start) / repeat
+
+        same = legacy == (main_image, images, text_data)
+        mismatches += 0 if same else 1
+        legacy_total += legacy_time
+        fast_total += fast_time
+
+        print(f"{path}: legacy {legacy_time * 1000:.1f}ms | single-pass {fast_time * 1000:.1f}ms | "
+              f"{legacy_time / fast_time:.1f}x | {'match' if same else 'MISMATCH'}")
+
+    if paths:
+        print(f"\nTotal: legacy {legacy_total:.3f}s | single-pass ({HTML_PARSER}) {fast_total:.3f}s | "
+              f"speedup {legacy_total / fast_total:.1f}x | mismatches {mismatches}/{len(paths)}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark single-pass extraction on saved HTML pages")
+    parser.add_argument("pages", nargs="+", help="Saved .html files")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per page (default: 3)")
+
+    args = parser.parse_args()
+    benchmark(args.pages, args.repeat)
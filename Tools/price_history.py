@@ -0,0 +1,384 @@
+"""
+Compact per-product price history
+
+Every ingest / revisit of a product records (doc id, time, price) from the
+same parse_price output that goes into the search document, so "has this
+dropped since I looked?" is answered locally instead of by re-reading the
+index (where each revisit overwrites the document).
+
+Storage, under PRICE_HISTORY_DIR:
+
+- log.bin: append-only 32-byte records (16-byte doc id, int64 seconds,
+  int64 cents); an append is one small O_APPEND write under a shared
+  flock on compact.lock, which compact() holds exclusively while it
+  rewrites the log
+- store.bin: columnar snapshot, rebuilt from store + log by compact() once
+  the log holds COMPACT_AFTER records. Series are sorted by doc id; per
+  series a base time/price and latest time/price, then one int32 column of
+  time deltas (seconds) and one of price deltas (cents) for all points.
+  Read through mmap: a lookup is a binary search over the id column and a
+  latest query never decodes the series.
+
+    price_history.record(doc_id, 129.99, ts)
+    price_history.latest(doc_id)            → (ts, price)
+    price_history.history(doc_id, start, end) → [(ts, price), ...]
+    price_history.summary(doc_id)           → first / previous / latest / min / max
+"""
+
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+from pathlib import Path
+
+
+HISTORY_DIR = Path(os.environ.get(
+    "PRICE_HISTORY_DIR",
+    Path.home() / ".history_memory" / "price_history"
+))
+COMPACT_AFTER = int(os.environ.get("PRICE_HISTORY_COMPACT_AFTER", 4096))
+
+MAGIC = b"PHST"
+VERSION = 1
+HEADER = struct.Struct("<4sIQQ8x")      # magic, version, n_series, n_points
+RECORD = struct.Struct("<16sqq")         # doc id, ts seconds, price cents
+
+if sys.byteorder != "little":
+    raise ImportError("price_history's mmap columns assume a little-endian host")
+
+_lock = threading.Lock()
+_store = None
+
+
+def doc_id_for_url(url):
+    """Search document id of a product URL (same as json2vectordb.document_id)"""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, url))
+
+
+def _id_bytes(doc_id):
+    return uuid.UUID(str(doc_id)).bytes
+
+
+def _to_cents(price):
+    return int(round(float(price) * 100))
+
+
+# -- columnar snapshot -----------------------------------------------------
+
+class _Snapshot:
+    """mmap view of store.bin"""
+
+    def __init__(self, path):
+        self._file = open(path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, n_series, n_points = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a price history store (v{VERSION})")
+        self.n_series = n_series
+        self.n_points = n_points
+
+        view = memoryview(self._mm)
+        offset = HEADER.size
+        self.ids = view[offset:offset + 16 * n_series]
+        offset += 16 * n_series
+
+        def column(fmt, count, size):
+            nonlocal offset
+            col = view[offset:offset + count * size].cast(fmt)
+            offset += count * size
+            return col
+
+        self.base_ts = column("q", n_series, 8)
+        self.base_price = column("q", n_series, 8)
+        self.last_ts = column("q", n_series, 8)
+        self.last_price = column("q", n_series, 8)
+        self.starts = column("q", n_series + 1, 8)
+        self.ts_delta = column("i", n_points, 4)
+        self.price_delta = column("i", n_points, 4)
+
+    def find(self, id_bytes):
+        """Series index of a doc id, or None (binary search on the id column)"""
+        lo, hi = 0, self.n_series
+        while lo < hi:
+            mid = (lo + hi) // 2
+            current = self.ids[16 * mid:16 * mid + 16].tobytes()
+            if current < id_bytes:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.n_series and self.ids[16 * lo:16 * lo + 16].tobytes() == id_bytes:
+            return lo
+        return None
+
+    def id_at(self, idx):
+        return self.ids[16 * idx:16 * idx + 16].tobytes()
+
+    def series(self, idx):
+        """Decoded [(ts, cents), ...] of one series"""
+        ts, cents = self.base_ts[idx], self.base_price[idx]
+        points = []
+        for p in range(self.starts[idx], self.starts[idx + 1]):
+            ts += self.ts_delta[p]
+            cents += self.price_delta[p]
+            points.append((ts, cents))
+        return points
+
+    def close(self):
+        for col in (self.ids, self.base_ts, self.base_price, self.last_ts, self.last_price,
+                    self.starts, self.ts_delta, self.price_delta):
+            col.release()
+        self._mm.close()
+        self._file.close()
+
+
+def _write_snapshot(path, series):
+    """Write {id_bytes: [(ts, cents), ...]} as a columnar store (atomic replace)"""
+    ids = sorted(series)
+    n_points = sum(len(series[i]) for i in ids)
+    base_ts, base_price, last_ts, last_price, starts = [], [], [], [], [0]
+    ts_delta, price_delta = [], []
+
+    for id_bytes in ids:
+        points = series[id_bytes]
+        prev_ts, prev_cents = points[0]
+        base_ts.append(prev_ts)
+        base_price.append(prev_cents)
+        for ts, cents in points:
+            ts_delta.append(ts - prev_ts)
+            price_delta.append(cents - prev_cents)
+            prev_ts, prev_cents = ts, cents
+        last_ts.append(prev_ts)
+        last_price.append(prev_cents)
+        starts.append(starts[-1] + len(points))
+
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(ids), n_points))
+        f.write(b"".join(ids))
+        for column in (base_ts, base_price, last_ts, last_price, starts):
+            f.write(struct.pack(f"<{len(column)}q", *column))
+        for column in (ts_delta, price_delta):
+            f.write(struct.pack(f"<{len(column)}i", *column))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+# -- store -----------------------------------------------------------------
+
+class PriceHistory:
+    def __init__(self, directory=HISTORY_DIR):
+        self.dir = Path(directory)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.log_path = self.dir / "log.bin"
+        self.store_path = self.dir / "store.bin"
+        self._snapshot = None
+        self._snapshot_mtime = None
+        self._log = {}
+        self._log_size = 0
+
+    # Reads ---------------------------------------------------------------
+
+    def _refresh(self):
+        """Pick up a new snapshot / log records written by other processes"""
+        try:
+            mtime = self.store_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime != self._snapshot_mtime:
+            if self._snapshot is not None:
+                self._snapshot.close()
+            self._snapshot = _Snapshot(self.store_path) if mtime is not None else None
+            self._snapshot_mtime = mtime
+            # compact() folded the log into the new snapshot and truncated it
+            self._log = {}
+            self._log_size = 0
+
+        try:
+            size = self.log_path.stat().st_size
+        except FileNotFoundError:
+            size = 0
+        if size < self._log_size:
+            self._log, self._log_size = {}, 0
+        if size > self._log_size:
+            with open(self.log_path, "rb") as f:
+                f.seek(self._log_size)
+                data = f.read(size - self._log_size)
+            whole = len(data) - len(data) % RECORD.size
+            for id_bytes, ts, cents in RECORD.iter_unpack(data[:whole]):
+                self._log.setdefault(id_bytes, []).append((ts, cents))
+            self._log_size += whole
+
+    def _points(self, id_bytes):
+        points = []
+        if self._snapshot is not None:
+            idx = self._snapshot.find(id_bytes)
+            if idx is not None:
+                points = self._snapshot.series(idx)
+        tail = self._log.get(id_bytes)
+        if tail:
+            points = sorted(points + tail)
+        return points
+
+    def latest(self, doc_id):
+        """(ts, price) of the newest observation, or None"""
+        id_bytes = _id_bytes(doc_id)
+        with _lock:
+            self._refresh()
+            best = None
+            if self._snapshot is not None:
+                idx = self._snapshot.find(id_bytes)
+                if idx is not None:
+                    best = (self._snapshot.last_ts[idx], self._snapshot.last_price[idx])
+            for point in self._log.get(id_bytes, ()):
+                if best is None or point[0] >= best[0]:
+                    best = point
+        return None if best is None else (best[0], best[1] / 100)
+
+    def history(self, doc_id, start=None, end=None):
+        """[(ts, price), ...] oldest first, optionally within [start, end) seconds"""
+        id_bytes = _id_bytes(doc_id)
+        with _lock:
+            self._refresh()
+            points = self._points(id_bytes)
+        if start is not None:
+            points = points[bisect_left(points, (start, -2 ** 63)):]
+        if end is not None:
+            points = points[:bisect_left(points, (end, -2 ** 63))]
+        return [(ts, cents / 100) for ts, cents in points]
+
+    def summary(self, doc_id):
+        """
+        First / previous / latest observation plus min / max, or None
+
+        "previous" is the observation before the latest one, i.e. the price
+        at the visit before this one.
+        """
+        points = self.history(doc_id)
+        if not points:
+            return None
+        latest = points[-1]
+        first = points[0]
+        previous = points[-2] if len(points) > 1 else None
+        prices = [price for _, price in points]
+        return {
+            "observations": len(points),
+            "first": {"ts": first[0], "price": first[1]},
+            "previous": {"ts": previous[0], "price": previous[1]} if previous else None,
+            "latest": {"ts": latest[0], "price": latest[1]},
+            "min": min(prices),
+            "max": max(prices),
+            "change_since_first": round(latest[1] - first[1], 2),
+            "change_since_previous": round(latest[1] - previous[1], 2) if previous else None,
+        }
+
+    def series_ids(self):
+        """Doc ids (uuid strings) with at least one observation"""
+        with _lock:
+            self._refresh()
+            ids = set(self._log)
+            if self._snapshot is not None:
+                ids.update(self._snapshot.id_at(i) for i in range(self._snapshot.n_series))
+        return [str(uuid.UUID(bytes=id_bytes)) for id_bytes in ids]
+
+    # Writes --------------------------------------------------------------
+
+    def record(self, doc_id, price, ts=None):
+        """Append one observation (price in currency units, ts in epoch seconds)"""
+        if price is None:
+            return
+        ts = int(ts if ts is not None else time.time())
+        record = RECORD.pack(_id_bytes(doc_id), ts, _to_cents(price))
+        # Shared: appends run concurrently, but never while compact() rewrites the log
+        with self._compact_lock(shared=True):
+            fd = os.open(self.log_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, record)
+                size = os.fstat(fd).st_size
+            finally:
+                os.close(fd)
+        if size >= COMPACT_AFTER * RECORD.size:
+            self.compact()
+
+    @contextmanager
+    def _compact_lock(self, shared=False):
+        """flock on compact.lock (own open file, so threads hold it independently)"""
+        import fcntl
+
+        with open(self.dir / "compact.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            yield
+
+    def compact(self):
+        """Fold log.bin into a new store.bin and truncate the log"""
+        with self._compact_lock():
+            with _lock:
+                self._refresh()
+                series = {}
+                if self._snapshot is not None:
+                    for idx in range(self._snapshot.n_series):
+                        series[self._snapshot.id_at(idx)] = self._snapshot.series(idx)
+                for id_bytes, tail in self._log.items():
+                    series[id_bytes] = sorted(series.get(id_bytes, []) + tail)
+                if not series:
+                    return
+
+                _write_snapshot(self.store_path, series)
+                # Records appended after our read are kept for the next compaction
+                with open(self.log_path, "r+b") as log:
+                    log.seek(self._log_size)
+                    rest = log.read()
+                    log.seek(0)
+                    log.write(rest)
+                    log.truncate(len(rest))
+                self._snapshot_mtime = None
+                self._refresh()
+
+
+def get_store():
+    """Process-wide PriceHistory"""
+    global _store
+    if _store is None:
+        with _lock:
+            if _store is None:
+                _store = PriceHistory()
+    return _store
+
+
+def record(doc_id, price, ts=None):
+    get_store().record(doc_id, price, ts)
+
+
+def latest(doc_id):
+    return get_store().latest(doc_id)
+
+
+def history(doc_id, start=None, end=None):
+    return get_store().history(doc_id, start, end)
+
+
+def summary(doc_id):
+    return get_store().summary(doc_id)
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Inspect or compact the price history store")
+    sub = parser.add_subparsers(dest="command", required=True)
+    show = sub.add_parser("show", help="Print the price history of a product")
+    show.add_argument("doc_id", help="Search document id")
+    sub.add_parser("compact", help="Fold the append log into the columnar store")
+
+    args = parser.parse_args()
+    if args.command == "show":
+        print(json.dumps({"summary": summary(args.doc_id), "history": history(args.doc_id)}, indent=2))
+    else:
+        get_store().compact()
+        print(f"✓ Compacted {HISTORY_DIR}")
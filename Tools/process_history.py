@@ -1,18 +1,24 @@
+import asyncio
 import json
-import os
 from pathlib import Path
 
-from scraping_pipeline import scrape_to_json
-from json2vectordb import ingest_product_to_azure_search
+from scraping_pipeline import scrape_to_json, ascrape_to_json
+from json2vectordb import ingest_product, aingest_product
+from async_clients import AsyncServices
+import content_fingerprint
+import cpu_pool
+import llm_cache
+import rate_limit
 
 
-def process_history(history_data, output_dir="/Users/aryanmehta/Desktop/History_memory/Tools/output"):
+def process_history(history_data, output_dir="/Users/aryanmehta/Desktop/History_memory/Tools/output", keep_screenshots=False):
     """
     Process history data (list of URLs) through scraping pipeline
 
     Args:
         history_data: List of dicts with 'url' and optionally 'lastVisitTime'
         output_dir: Output directory for intermediate files
+        keep_screenshots: Also write screenshot PNGs to output_dir (OCR runs in memory)
 
     Returns:
         dict with stats: total, processed, products, non_products, errors
@@ -45,7 +51,8 @@ def process_history(history_data, output_dir="/Users/aryanmehta/Desktop/History_
         print(f"{'='*80}\n")
 
         try:
-            product_json = scrape_to_json(url, output_dir=output_dir, last_visit_time=last_visit_time)
+            product_json = scrape_to_json(url, output_dir=output_dir, last_visit_time=last_visit_time,
+                                          keep_screenshot=keep_screenshots)
             stats["processed"] += 1
 
             if product_json.get("is_product") != "Yes":
@@ -54,7 +61,7 @@ def process_history(history_data, output_dir="/Users/aryanmehta/Desktop/History_
                 continue
 
             print(f"\n==== Uploading to Azure AI Search ====\n")
-            ingest_product_to_azure_search(product_json)
+            ingest_product(product_json)
 
             # Add to collection
             all_products.append(product_json)
@@ -67,14 +74,92 @@ def process_history(history_data, output_dir="/Users/aryanmehta/Desktop/History_
             stats["errors"] += 1
             continue
 
+    _print_summary(history, stats)
+
+    return {
+        "stats": stats,
+        "products": all_products,
+        "blob_name": None
+    }
+
+
+def _print_summary(history, stats):
     print(f"\n{'='*80}")
     print(f"Completed processing {len(history)} items")
     print(f"Products: {stats['products']}, Non-products: {stats['non_products']}, Errors: {stats['errors']}")
+    cache_stats = llm_cache.stats()
+    print(f"LLM cache: hit rate {cache_stats['hit_rate']:.0%}, "
+          f"saved {cache_stats['saved_prompt_tokens'] + cache_stats['saved_completion_tokens']} tokens")
+    changes = content_fingerprint.stats()
+    print(f"Revisits: {changes['unchanged']} unchanged, {changes['price']} price-only, "
+          f"{changes['changed']} changed, {changes['new']} new")
+    for service, service_stats in rate_limit.stats().items():
+        print(f"{service}: {service_stats['calls']} calls, {service_stats['retries']} retries "
+              f"({service_stats['throttled']} throttled), concurrency limit {service_stats['limit']}")
     print(f"{'='*80}\n")
 
+
+async def aprocess_history(history_data, output_dir="output", keep_screenshots=False):
+    """
+    Async process_history: all items in flight at once
+
+    Concurrency is bounded per service by AsyncServices (scrape workers,
+    OpenAI, Search, HTTP) rather than by processing items one by one.
+    Returns the same dict as process_history (products in history order).
+    """
+    history = history_data
+    print(f"Processing {len(history)} items (async)\n")
+
+    # Items are in flight together: parsing / OCR / CLIP get worker processes
+    cpu_pool.enable()
+
+    stats = {
+        "total": len(history),
+        "processed": 0,
+        "products": 0,
+        "non_products": 0,
+        "errors": 0
+    }
+
+    async def handle(svc, idx, item):
+        url = item.get('url')
+        if not url:
+            print(f"[{idx}/{len(history)}] Skipping item with no URL")
+            stats["errors"] += 1
+            return None
+
+        try:
+            product_json = await ascrape_to_json(svc, url, output_dir=output_dir,
+                                                 last_visit_time=item.get('lastVisitTime'),
+                                                 keep_screenshot=keep_screenshots)
+            stats["processed"] += 1
+
+            if product_json.get("is_product") != "Yes":
+                print(f"\n⊘ Not a product, skipping upload to Azure AI Search: {url}\n")
+                stats["non_products"] += 1
+                return None
+
+            await aingest_product(svc, product_json)
+            stats["products"] += 1
+
+            print(f"\n✓ Successfully processed [{idx}/{len(history)}]: {url}\n")
+            return product_json
+
+        except Exception as e:
+            print(f"\n✗ Error processing {url}: {e}\n")
+            stats["errors"] += 1
+            return None
+
+    async with AsyncServices() as svc:
+        results = await asyncio.gather(*(
+            handle(svc, idx, item) for idx, item in enumerate(history, 1)
+        ))
+
+    _print_summary(history, stats)
+
     return {
         "stats": stats,
-        "products": all_products,
+        "products": [product for product in results if product is not None],
         "blob_name": None
     }
 
@@ -95,6 +180,17 @@ if __name__ == "__main__":
         default="output",
         help="Output directory for intermediate files (default: output)"
     )
+    parser.add_argument(
+        "--keep-screenshots",
+        action="store_true",
+        help="Also save screenshot PNGs to the output directory"
+    )
+    parser.add_argument(
+        "--async",
+        dest="use_async",
+        action="store_true",
+        help="Process items concurrently with the async OpenAI / Azure clients"
+    )
 
     args = parser.parse_args()
 
@@ -103,5 +199,8 @@ if __name__ == "__main__":
         history_data = json.load(f)
 
     # Process the data
-    result = process_history(history_data, args.out)
+    if args.use_async:
+        result = asyncio.run(aprocess_history(history_data, args.out, keep_screenshots=args.keep_screenshots))
+    else:
+        result = process_history(history_data, args.out, keep_screenshots=args.keep_screenshots)
     print(f"\nFinal stats: {result['stats']}")
\ No newline at end of file
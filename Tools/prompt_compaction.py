@@ -0,0 +1,244 @@
+"""
+Token-budgeted compaction of the OCR + scraped inputs for call_llm_smart
+
+OCR text and the scraped main_content / headings largely repeat each other
+and carry policy / footer link lines. This keeps the structured fields
+(title, heading, description, price, brand) as-is, drops boilerplate lines
+and snippets duplicated between OCR and scraped text, ranks what is left by
+product-field relevance and keeps the best snippets that fit the token budget.
+"""
+
+import json
+import os
+import re
+
+
+PROMPT_TOKEN_BUDGET = int(os.environ.get("PROMPT_TOKEN_BUDGET", 1500))
+
+FIXED_FIELDS = ('title', 'heading', 'description', 'price', 'brand')
+
+# Whole-line footer / policy links only: "Free delivery" or "30-day returns"
+# on a product page are facts about the product and are kept
+BOILERPLATE_RE = re.compile(
+    r'^\W*(privacy( policy| notice)?|cookies?( policy| settings| preferences)?|'
+    r'terms( (of|&|and) (use|service|conditions))?|(returns?|refunds?|shipping|delivery) policy|'
+    r'(shipping|delivery) (&|and) returns|sign in|log in|sign up|create (an )?account|newsletter|'
+    r'subscribe( to our newsletter)?|customer service|help cent(er|re)|gift cards?|track (your )?order|'
+    r'accessibility( statement)?|careers|about us|contact us|site ?map|follow us( on \w+)?|'
+    r'download (the|our) app)\W*$'
+    r'|^\W*(©|copyright\b)|\ball rights reserved\b',
+    re.I
+)
+PRICE_RE = re.compile(r'[$€£₹¥]\s?\d|\d+[.,]\d{2}\b|\b(USD|EUR|GBP|INR|price)\b', re.I)
+FIELD_RE = re.compile(
+    r'\b(brand|colou?r|size|material|fabric|model|rating|stars?|reviews?|weight|dimensions|'
+    r'capacity|style|fit|width|length|warranty|condition|in stock)\b',
+    re.I
+)
+SENTENCE_SPLIT_RE = re.compile(r'(?<=[.!?])\s+|\s*\n+\s*')
+REGION_LABEL_RE = re.compile(r'^\[[\w+]+\]$')
+WORD_RE = re.compile(r'[a-z0-9]+')
+# OCR lines shorter than this (in words) only count as duplicates of scraped
+# text when they match a whole scraped line; "Red" or "32" would otherwise
+# be found inside unrelated scraped sentences
+MIN_CONTAINED_WORDS = 4
+
+
+_encoder = None
+
+
+def _get_encoder():
+    global _encoder
+    if _encoder is None:
+        try:
+            import tiktoken
+            try:
+                _encoder = tiktoken.encoding_for_model("gpt-4o-mini")
+            except KeyError:
+                _encoder = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            # Not installed, or the encoding cannot be downloaded (offline host)
+            _encoder = False
+    return _encoder
+
+
+def count_tokens(text):
+    """Tokens for `text` with the model tokenizer (≈ chars / 4 without tiktoken)"""
+    encoder = _get_encoder()
+    if encoder:
+        return len(encoder.encode(text))
+    return (len(text) + 3) // 4
+
+
+def compact_json(data):
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+
+def _norm(text):
+    return ' '.join(WORD_RE.findall(text.lower()))
+
+
+def _score(text, title_words):
+    score = 1.0
+    if PRICE_RE.search(text):
+        score += 5
+    if FIELD_RE.search(text):
+        score += 3
+    words = set(WORD_RE.findall(text.lower()))
+    if title_words and words:
+        score += 4 * len(words & title_words) / len(title_words)
+    # Prefer dense snippets over long paragraphs
+    return score / (1 + len(text) / 400)
+
+
+def compact_inputs(ocr_text, text_data, budget=PROMPT_TOKEN_BUDGET):
+    """
+    Fit OCR + scraped text into `budget` tokens
+
+    Returns:
+        (compacted OCR text, compacted scraped dict)
+    """
+    text_data = text_data or {}
+    fixed = {k: text_data[k] for k in FIXED_FIELDS if text_data.get(k)}
+
+    title_words = set(WORD_RE.findall(' '.join(
+        str(fixed.get(k, '')) for k in ('title', 'heading')
+    ).lower()))
+
+    seen = {_norm(str(v)) for v in fixed.values()}
+    # Space-padded so containment checks match whole words only
+    scraped_blob = ' ' + ' '.join(seen) + ' '
+
+    candidates = []  # (score, source, position, label, text)
+    position = 0
+
+    def add(source, text, label=None):
+        nonlocal position, scraped_blob
+        text = text.strip()
+        key = _norm(text)
+        # Single characters are OCR noise; two already carry sizes ("32", "XL")
+        if len(key.replace(' ', '')) < 2 or key in seen:
+            return
+        if BOILERPLATE_RE.search(text) and not PRICE_RE.search(text):
+            return
+        # OCR snippets the (cleaner) scraped text already contains are dropped
+        if source == 'ocr' and len(key.split()) >= MIN_CONTAINED_WORDS and f' {key} ' in scraped_blob:
+            return
+        seen.add(key)
+        if source != 'ocr':
+            scraped_blob += key + ' '
+        score = _score(text, title_words) + (1 if source == 'headings' else 0)
+        candidates.append((score, source, position, label, text))
+        position += 1
+
+    for heading in text_data.get('headings') or []:
+        add('headings', heading.get('text', '') if isinstance(heading, dict) else str(heading))
+    for sentence in SENTENCE_SPLIT_RE.split(text_data.get('main_content') or ''):
+        add('main_content', sentence)
+
+    label = None
+    for line in (ocr_text or '').splitlines():
+        if REGION_LABEL_RE.match(line.strip()):
+            label = line.strip()
+            continue
+        add('ocr', line, label)
+
+    remaining = budget - count_tokens(compact_json(fixed))
+    selected = []
+    for candidate in sorted(candidates, key=lambda c: c[0], reverse=True):
+        cost = count_tokens(candidate[4]) + 1
+        if cost > remaining:
+            continue
+        selected.append(candidate)
+        remaining -= cost
+
+    selected.sort(key=lambda c: c[2])
+
+    scraped = dict(fixed)
+    headings = [c[4] for c in selected if c[1] == 'headings']
+    main_content = ' '.join(c[4] for c in selected if c[1] == 'main_content')
+    if headings:
+        scraped['headings'] = headings
+    if main_content:
+        scraped['main_content'] = main_content
+
+    ocr_lines = []
+    last_label = None
+    for c in selected:
+        if c[1] != 'ocr':
+            continue
+        if c[3] and c[3] != last_label:
+            ocr_lines.append(c[3])
+            last_label = c[3]
+        ocr_lines.append(c[4])
+
+    return '\n'.join(ocr_lines), scraped
+
+
+def _field_matches(field, expected, actual):
+    if expected is None:
+        return actual in (None, '', 'null')
+    if actual is None:
+        return False
+    if field == 'price':
+        def number(value):
+            match = re.search(r'\d[\d,]*\.?\d*', str(value))
+            return float(match.group().replace(',', '')) if match else None
+        return number(expected) == number(actual)
+    expected_words = set(WORD_RE.findall(str(expected).lower()))
+    actual_words = set(WORD_RE.findall(str(actual).lower()))
+    if not expected_words:
+        return not actual_words
+    return len(expected_words & actual_words) / len(expected_words | actual_words) >= 0.6
+
+
+def evaluate_golden(path, fields=('is_product', 'product_name', 'Brand', 'Color', 'price', 'Category')):
+    """
+    Compare extraction accuracy and prompt size with and without compaction
+
+    `path` is a JSONL file of {"ocr_text", "text_data", "expected": {field: value}}.
+    """
+    from scraping_pipeline import LLM_MODEL, build_smart_messages, client
+
+    totals = {mode: {'correct': 0, 'checked': 0, 'tokens': 0} for mode in ('full', 'compact')}
+
+    with open(path) as f:
+        cases = [json.loads(line) for line in f if line.strip()]
+
+    for idx, case in enumerate(cases, 1):
+        for mode in ('full', 'compact'):
+            messages = build_smart_messages(case.get('ocr_text', ''), case.get('text_data'),
+                                            compact=(mode == 'compact'))
+            response = client.chat.completions.create(
+                model=LLM_MODEL,
+                response_format={"type": "json_object"},
+                messages=messages,
+            )
+            result = json.loads(response.choices[0].message.content)
+            totals[mode]['tokens'] += response.usage.prompt_tokens
+
+            for field in fields:
+                if field not in case['expected']:
+                    continue
+                totals[mode]['checked'] += 1
+                if _field_matches(field, case['expected'][field], result.get(field)):
+                    totals[mode]['correct'] += 1
+
+        print(f"[{idx}/{len(cases)}] done")
+
+    for mode, t in totals.items():
+        accuracy = t['correct'] / t['checked'] if t['checked'] else 0
+        print(f"{mode:8s} accuracy {accuracy:.1%} ({t['correct']}/{t['checked']}) | "
+              f"avg prompt tokens {t['tokens'] / max(len(cases), 1):.0f}")
+
+    return totals
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Golden-set accuracy check for prompt compaction")
+    parser.add_argument("golden", help="JSONL file with ocr_text, text_data and expected fields")
+
+    args = parser.parse_args()
+    evaluate_golden(args.golden)
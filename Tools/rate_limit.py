@@ -0,0 +1,340 @@
+"""
+Rate-limit-aware wrapper for OpenAI / Azure Search / HTTP calls
+
+One Governor per remote service, shared by every caller in the process:
+
+- reads rate-limit headers (retry-after, x-ratelimit-remaining-*,
+  x-ratelimit-reset-*) from responses and errors, and pauses all callers
+  of the service until the window resets instead of letting them fail
+- retries 429 / 5xx / connection errors with full-jitter exponential backoff
+- adapts the number of in-flight calls AIMD-style (+1 per window of
+  successes, halved on a throttle)
+- trips a circuit breaker after repeated failures; while it is open callers
+  wait for the cooldown and a single probe decides whether to close it
+
+    result = rate_limit.call("openai", client.embeddings.with_raw_response.create, ...)
+    result = await rate_limit.acall("openai", svc.openai.embeddings.with_raw_response.create, ...)
+
+Raw responses (anything with `.headers` and `.parse()`) are parsed after
+their headers are read, so callers get the same object as the plain method.
+"""
+
+import asyncio
+import inspect
+import os
+import random
+import re
+import threading
+import time
+
+
+# Initial / max in-flight calls per service (RATE_LIMIT_<SERVICE>_MAX to override the max)
+SERVICE_CONCURRENCY = {
+    "openai": (8, int(os.environ.get("RATE_LIMIT_OPENAI_MAX", 32))),
+    "search": (4, int(os.environ.get("RATE_LIMIT_SEARCH_MAX", 16))),
+    "http": (16, int(os.environ.get("RATE_LIMIT_HTTP_MAX", 64))),
+}
+DEFAULT_CONCURRENCY = (4, 16)
+
+MAX_ATTEMPTS = int(os.environ.get("RATE_LIMIT_MAX_ATTEMPTS", 6))
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 30.0
+
+BREAKER_THRESHOLD = 5       # consecutive failures that open the circuit
+BREAKER_COOLDOWN = 15.0     # first open period, doubled on each failed probe
+BREAKER_MAX_COOLDOWN = 120.0
+BREAKER_MAX_WAIT = float(os.environ.get("RATE_LIMIT_MAX_WAIT", 600))
+
+# Pause proactively once less than this share of the window is left
+LOW_REMAINING_RATIO = 0.05
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+# Transport-level failures, matched by class name so no SDK has to be importable
+RETRYABLE_ERRORS = {
+    'APIConnectionError', 'APITimeoutError',                      # openai
+    'ServiceRequestError', 'ServiceResponseError',                # azure-core
+    'ConnectionError', 'Timeout', 'ConnectTimeout', 'ReadTimeout',  # requests
+    'TransportError', 'TimeoutException',                         # httpx
+    'TimeoutError', 'ConnectionResetError',
+}
+
+_DURATION_RE = re.compile(r'(\d+(?:\.\d+)?)(ms|s|m|h)')
+_DURATION_UNITS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+
+
+class ServiceUnavailable(RuntimeError):
+    """The service's circuit stayed open longer than BREAKER_MAX_WAIT"""
+
+
+def parse_duration(value):
+    """Seconds from "20ms" / "1s" / "6m0s" / "1.5" (OpenAI reset headers), or None"""
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_RE.findall(value)
+    if not parts:
+        return None
+    return sum(float(n) * _DURATION_UNITS[unit] for n, unit in parts)
+
+
+def _status_of(exc):
+    status = getattr(exc, 'status_code', None)
+    if status is None:
+        status = getattr(getattr(exc, 'response', None), 'status_code', None)
+    return status
+
+
+def _headers_of(obj):
+    headers = getattr(obj, 'headers', None)
+    if headers is None:
+        headers = getattr(getattr(obj, 'response', None), 'headers', None)
+    return headers or {}
+
+
+def is_retryable(exc):
+    status = _status_of(exc)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    return any(cls.__name__ in RETRYABLE_ERRORS for cls in type(exc).__mro__)
+
+
+def retry_after(headers):
+    """Server-requested wait in seconds (retry-after-ms / retry-after), or None"""
+    ms = headers.get('retry-after-ms')
+    if ms is not None:
+        try:
+            return float(ms) / 1000
+        except ValueError:
+            pass
+    return parse_duration(headers.get('retry-after'))
+
+
+class Governor:
+    """Concurrency, backoff and circuit state for one remote service"""
+
+    def __init__(self, name, initial=None, maximum=None):
+        default_initial, default_max = SERVICE_CONCURRENCY.get(name, DEFAULT_CONCURRENCY)
+        self.name = name
+        self.max_limit = maximum or default_max
+        self.limit = float(min(initial or default_initial, self.max_limit))
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.last_decrease = 0.0
+        self.failures = 0
+        self.open_until = 0.0
+        self.cooldown = BREAKER_COOLDOWN
+        self.probing = False
+        self.stats = {"calls": 0, "retries": 0, "throttled": 0, "breaker_trips": 0}
+        self._cond = threading.Condition()
+
+    # -- admission ---------------------------------------------------------
+
+    def _admit_delay(self, now):
+        """0 if a call may start now (and reserves its slot), else seconds to wait"""
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.open_until:
+            if now < self.open_until:
+                return self.open_until - now
+            # Half-open: a single probe goes through
+            if self.probing:
+                return 0.2
+            self.probing = True
+            self.in_flight += 1
+            return 0
+        if self.in_flight >= int(self.limit):
+            return 0.05
+        self.in_flight += 1
+        return 0
+
+    def _check_wait(self, started):
+        if self.open_until and time.monotonic() - started > BREAKER_MAX_WAIT:
+            raise ServiceUnavailable(f"{self.name}: circuit open for over {BREAKER_MAX_WAIT:.0f}s")
+
+    def acquire(self):
+        started = time.monotonic()
+        with self._cond:
+            while True:
+                delay = self._admit_delay(time.monotonic())
+                if delay == 0:
+                    return
+                self._check_wait(started)
+                self._cond.wait(min(delay, 1.0))
+
+    async def aacquire(self):
+        started = time.monotonic()
+        while True:
+            with self._cond:
+                delay = self._admit_delay(time.monotonic())
+            if delay == 0:
+                return
+            self._check_wait(started)
+            await asyncio.sleep(min(delay, 1.0))
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    # -- feedback ----------------------------------------------------------
+
+    def observe_headers(self, headers):
+        """Pause everyone when the remaining request/token budget is nearly spent"""
+        if not headers:
+            return
+        for kind in ('requests', 'tokens'):
+            remaining = headers.get(f'x-ratelimit-remaining-{kind}')
+            limit = headers.get(f'x-ratelimit-limit-{kind}')
+            if remaining is None or limit is None:
+                continue
+            try:
+                remaining, limit = int(remaining), int(limit)
+            except ValueError:
+                continue
+            if limit and remaining / limit < LOW_REMAINING_RATIO:
+                reset = parse_duration(headers.get(f'x-ratelimit-reset-{kind}'))
+                if reset:
+                    self._pause(reset)
+
+    def _pause(self, seconds):
+        with self._cond:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def on_success(self, increase=True):
+        """
+        Record a call the service answered
+
+        `increase=False` for non-retryable errors (e.g. 400): the service is
+        reachable, which closes the circuit, but the call earns no extra slot.
+        """
+        with self._cond:
+            self.stats["calls"] += 1
+            self.failures = 0
+            if self.open_until:
+                print(f"⚡ {self.name}: circuit closed")
+            self.open_until = 0.0
+            self.cooldown = BREAKER_COOLDOWN
+            self.probing = False
+            if increase:
+                # Additive increase: about +1 per `limit` successful calls
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def on_failure(self, exc):
+        """Record a retryable failure; returns the seconds to back off before retrying"""
+        status = _status_of(exc)
+        headers = _headers_of(exc)
+        server_wait = retry_after(headers)
+        now = time.monotonic()
+
+        with self._cond:
+            self.stats["retries"] += 1
+            throttled = status == 429
+            if throttled:
+                self.stats["throttled"] += 1
+                # Multiplicative decrease, at most once per backoff window
+                if now - self.last_decrease > BACKOFF_BASE * 2:
+                    self.limit = max(1.0, self.limit / 2)
+                    self.last_decrease = now
+                if server_wait:
+                    self.paused_until = max(self.paused_until, now + server_wait)
+            else:
+                self.failures += 1
+
+            if self.probing or self.failures >= BREAKER_THRESHOLD:
+                if self.probing:
+                    self.cooldown = min(BREAKER_MAX_COOLDOWN, self.cooldown * 2)
+                self.open_until = now + self.cooldown
+                self.probing = False
+                self.stats["breaker_trips"] += 1
+                print(f"⚡ {self.name}: circuit open for {self.cooldown:.0f}s after {exc.__class__.__name__}")
+
+        return server_wait
+
+    def backoff(self, attempt, server_wait=None):
+        if server_wait:
+            return server_wait + random.uniform(0, BACKOFF_BASE)
+        return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+
+_governors = {}
+_governors_lock = threading.Lock()
+
+
+def get_governor(service):
+    with _governors_lock:
+        governor = _governors.get(service)
+        if governor is None:
+            governor = _governors[service] = Governor(service)
+        return governor
+
+
+def _unwrap(governor, result):
+    if hasattr(result, 'headers') and callable(getattr(result, 'parse', None)):
+        governor.observe_headers(result.headers)
+        return result.parse()
+    return result
+
+
+def call(service, fn, *args, **kwargs):
+    """Run `fn(*args, **kwargs)` under `service`'s governor, retrying transient failures"""
+    governor = get_governor(service)
+    for attempt in range(MAX_ATTEMPTS):
+        governor.acquire()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            governor.release()
+            if not is_retryable(e):
+                governor.on_success(increase=False)
+                raise
+            if attempt == MAX_ATTEMPTS - 1:
+                governor.on_failure(e)
+                raise
+            wait = governor.backoff(attempt, governor.on_failure(e))
+            print(f"↻ {service}: {e.__class__.__name__} ({_status_of(e) or 'no status'}), "
+                  f"retrying in {wait:.1f}s")
+            time.sleep(wait)
+            continue
+        governor.release()
+        governor.on_success()
+        return _unwrap(governor, result)
+
+
+async def acall(service, fn, *args, **kwargs):
+    """Async call(): `fn` returns an awaitable"""
+    governor = get_governor(service)
+    for attempt in range(MAX_ATTEMPTS):
+        await governor.aacquire()
+        try:
+            result = await fn(*args, **kwargs)
+        except Exception as e:
+            governor.release()
+            if not is_retryable(e):
+                governor.on_success(increase=False)
+                raise
+            if attempt == MAX_ATTEMPTS - 1:
+                governor.on_failure(e)
+                raise
+            wait = governor.backoff(attempt, governor.on_failure(e))
+            print(f"↻ {service}: {e.__class__.__name__} ({_status_of(e) or 'no status'}), "
+                  f"retrying in {wait:.1f}s")
+            await asyncio.sleep(wait)
+            continue
+        governor.release()
+        governor.on_success()
+        result = _unwrap(governor, result)
+        if inspect.isawaitable(result):
+            result = await result
+        return result
+
+
+def stats():
+    """Per-service counters plus the current adaptive limit"""
+    return {
+        name: {**g.stats, "limit": round(g.limit, 1), "circuit_open": bool(g.open_until)}
+        for name, g in _governors.items()
+    }
@@ -0,0 +1,142 @@
+"""
+Render profile shared by the headless browsers (Playwright + Selenium)
+
+Blocks non-essential resources (fonts, media, ads, trackers) and replaces
+fixed sleeps with readiness conditions evaluated inside the page.
+"""
+
+import time
+from urllib.parse import urlparse
+
+
+# Resource types that never contribute to product data or the screenshot
+BLOCKED_RESOURCE_TYPES = {'font', 'media', 'websocket', 'manifest'}
+
+# Third-party ad / analytics hosts (matched as suffixes of the request host)
+TRACKER_HOSTS = (
+    'doubleclick.net', 'googlesyndication.com', 'googleadservices.com',
+    'google-analytics.com', 'googletagmanager.com', 'googletagservices.com',
+    'adservice.google.com', 'facebook.net', 'connect.facebook.net',
+    'amazon-adsystem.com', 'adsrvr.org', 'adnxs.com', 'criteo.com',
+    'criteo.net', 'taboola.com', 'outbrain.com', 'scorecardresearch.com',
+    'quantserve.com', 'hotjar.com', 'segment.io', 'segment.com',
+    'optimizely.com', 'newrelic.com', 'nr-data.net', 'bat.bing.com',
+    'clarity.ms', 'analytics.tiktok.com', 'sc-static.net',
+    'rubiconproject.com', 'pubmatic.com', 'openx.net', 'casalemedia.com',
+    'moatads.com', 'demdex.net', 'omtrdc.net', 'everesttech.net',
+)
+
+# Chrome DevTools URL patterns (Network.setBlockedURLs) for Selenium
+BLOCKED_URL_PATTERNS = (
+    [f'*{host}*' for host in TRACKER_HOSTS] +
+    ['*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot',
+     '*.mp4', '*.webm', '*.m3u8', '*.mp3', '*.ogg']
+)
+
+# How long the DOM must stay unchanged before the page counts as settled
+MUTATION_QUIET_MS = 500
+
+# Upper bound on the readiness wait; we take whatever rendered by then
+READY_TIMEOUT_S = 10
+
+# Installed before any page script runs; tracks the last DOM mutation time
+MUTATION_TRACKER_JS = """
+(() => {
+    window.__hmLastMutation = performance.now();
+    const start = () => {
+        new MutationObserver(() => { window.__hmLastMutation = performance.now(); })
+            .observe(document, {childList: true, subtree: true, attributes: true});
+    };
+    if (document.documentElement) { start(); }
+    else { document.addEventListener('DOMContentLoaded', start); }
+})();
+"""
+
+# Page is ready once product signals are present, the main image has decoded
+# and the DOM has been quiet for `quietMs`
+READY_CHECK_JS = """
+(quietMs) => {
+    if (document.readyState === 'loading') return false;
+
+    const hasSignal = !!(
+        document.querySelector('meta[property="og:image"]') ||
+        document.querySelector('meta[property="og:title"]') ||
+        document.querySelector('[itemprop="price"], meta[property="og:price:amount"], [class*="price" i]') ||
+        document.querySelector('h1')
+    );
+
+    let mainImageReady = true;
+    let best = null, bestArea = 0;
+    for (const img of document.images) {
+        const r = img.getBoundingClientRect();
+        const area = r.width * r.height;
+        if (area > bestArea && r.top < window.innerHeight) { best = img; bestArea = area; }
+    }
+    if (best) mainImageReady = best.complete && best.naturalWidth > 0;
+
+    const quiet = (performance.now() - (window.__hmLastMutation || 0)) >= quietMs;
+
+    if (document.readyState === 'complete' && quiet) return true;
+    return hasSignal && mainImageReady && quiet;
+}
+"""
+
+
+def is_tracker_host(url):
+    """Check if a request URL points at a known ad / tracker host"""
+    host = (urlparse(url).hostname or '').lower()
+    return any(host == t or host.endswith('.' + t) for t in TRACKER_HOSTS)
+
+
+def apply_to_playwright(context):
+    """
+    Install request interception + mutation tracker on a Playwright context
+    """
+    def handle_route(route):
+        request = route.request
+        if request.resource_type in BLOCKED_RESOURCE_TYPES or is_tracker_host(request.url):
+            return route.abort()
+        return route.continue_()
+
+    context.route('**/*', handle_route)
+    context.add_init_script(MUTATION_TRACKER_JS)
+
+
+def wait_until_ready_playwright(page, timeout=READY_TIMEOUT_S):
+    """Wait for readiness conditions; never raises on timeout"""
+    start = time.time()
+    try:
+        page.wait_for_function(
+            READY_CHECK_JS, arg=MUTATION_QUIET_MS,
+            timeout=timeout * 1000, polling=100
+        )
+        print(f"✓ Page ready in {time.time() - start:.2f}s")
+    except Exception:
+        print(f"⚠ Readiness wait timed out after {timeout}s, continuing")
+
+
+def apply_to_selenium(driver):
+    """
+    Block trackers / heavy resources via CDP and install the mutation tracker
+    """
+    try:
+        driver.execute_cdp_cmd('Network.enable', {})
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': BLOCKED_URL_PATTERNS})
+        driver.execute_cdp_cmd('Page.addScriptToEvaluateOnNewDocument', {'source': MUTATION_TRACKER_JS})
+    except Exception as e:
+        print(f"⚠ Could not apply render profile: {e}")
+
+
+def wait_until_ready_selenium(driver, timeout=READY_TIMEOUT_S):
+    """Wait for readiness conditions; never raises on timeout"""
+    from selenium.webdriver.support.ui import WebDriverWait
+
+    script = f"return ({READY_CHECK_JS})(arguments[0]);"
+    start = time.time()
+    try:
+        WebDriverWait(driver, timeout, poll_frequency=0.1).until(
+            lambda d: d.execute_script(script, MUTATION_QUIET_MS)
+        )
+        print(f"✓ Page ready in {time.time() - start:.2f}s")
+    except Exception:
+        print(f"⚠ Readiness wait timed out after {timeout}s, continuing")
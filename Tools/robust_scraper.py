@@ -2,6 +2,10 @@ import json
 import re
 from urllib.parse import urljoin
 
+import cpu_pool
+import http_cache
+import page_extract
+
 
 def get_representative_image_from_soup(soup, url):
 
@@ -150,32 +154,26 @@ def scrape_with_cloudscraper(url):
     Strategy 1: Use cloudscraper (bypasses Cloudflare and most anti-bot systems)
     """
     try:
-        import cloudscraper
-        from bs4 import BeautifulSoup
+        import cloudscraper  # noqa: F401
+        from http_cache import cached_fetch
 
         print("\n[Strategy 1] Trying cloudscraper...")
 
-        scraper = cloudscraper.create_scraper(
-            browser={
-                'browser': 'chrome',
-                'platform': 'darwin',
-                'desktop': True
-            }
-        )
-
-        response = scraper.get(url, timeout=15)
-        response.raise_for_status()
+        # Shared per-host session (warm connections + Cloudflare clearance
+        # cookies) behind the on-disk cache with conditional revalidation
+        response = cached_fetch(url, 'page', cloudflare=True, strategy='cloudscraper')
+        if response.from_cache:
+            print("✓ Served from HTTP cache")
 
-        # Check if response is HTML
-        content_type = response.headers.get('Content-Type', '').lower()
-        if 'image/' in content_type:
-            print(f"✗ URL returned an image ({content_type}), not HTML")
+        # Check if response is HTML (non-HTML bodies are not cached as pages)
+        content_type = response.content_type.lower()
+        if not http_cache.matches_kind('page', content_type):
+            print(f"✗ URL returned {content_type}, not HTML")
             return None
 
-        soup = BeautifulSoup(response.content, 'html.parser')
         print("✓ Successfully fetched with cloudscraper")
 
-        return soup
+        return response.content
 
     except ImportError:
         print("✗ cloudscraper not installed. Install with: pip install cloudscraper")
@@ -191,8 +189,7 @@ def scrape_with_playwright(url):
     """
     try:
         from playwright.sync_api import sync_playwright
-        from bs4 import BeautifulSoup
-        import time
+        from render_profile import apply_to_playwright, wait_until_ready_playwright
 
         print("\n[Strategy 2] Trying Playwright with stealth...")
 
@@ -218,19 +215,21 @@ def scrape_with_playwright(url):
                 });
             """)
 
+            # Block fonts/media/trackers and track DOM mutations
+            apply_to_playwright(context)
+
             page = context.new_page()
-            page.goto(url, wait_until='networkidle', timeout=30000)
+            page.goto(url, wait_until='domcontentloaded', timeout=30000)
 
-            # Wait for images to load
-            time.sleep(2)
+            # Wait for product signals / main image / DOM quiet period
+            wait_until_ready_playwright(page)
 
             html = page.content()
             browser.close()
 
-            soup = BeautifulSoup(html, 'html.parser')
             print("✓ Successfully fetched with Playwright")
 
-            return soup
+            return html
 
     except ImportError:
         print("✗ Playwright not installed. Install with: pip install playwright && playwright install chromium")
@@ -247,8 +246,7 @@ def scrape_with_selenium(url):
     try:
         from selenium import webdriver
         from selenium.webdriver.chrome.options import Options
-        from bs4 import BeautifulSoup
-        import time
+        from render_profile import apply_to_selenium, wait_until_ready_selenium
 
         print("\n[Strategy 3] Trying Selenium...")
 
@@ -266,16 +264,18 @@ def scrape_with_selenium(url):
         })
         driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
 
+        # Block fonts/media/trackers and track DOM mutations
+        apply_to_selenium(driver)
+
         driver.get(url)
-        time.sleep(3)
+        wait_until_ready_selenium(driver)
 
         html = driver.page_source
         driver.quit()
 
-        soup = BeautifulSoup(html, 'html.parser')
         print("✓ Successfully fetched with Selenium")
 
-        return soup
+        return html
 
     except ImportError:
         print("✗ Selenium not installed. Install with: pip install selenium")
@@ -333,6 +333,15 @@ def extract_text_from_soup(soup, url):
     h1 = soup.find('h1')
     text_data['heading'] = h1.get_text(strip=True) if h1 else None
 
+    # Extract brand (Schema.org Product, product:brand meta, itemprop="brand")
+    text_data['brand'] = (
+        page_extract.brand_from_json_ld(soup.find_all('script', type='application/ld+json')) or
+        page_extract.brand_from_tags(
+            soup.find('meta', property='product:brand') or soup.find('meta', property='og:brand'),
+            soup.find(attrs={'itemprop': 'brand'})
+        )
+    )
+
     # Extract main content
     # Try to find main content areas
     main_content = None
@@ -401,25 +410,38 @@ def robust_scrape(url):
     print(f"🔍 Scraping: {url}\n")
     print("=" * 80)
 
-    soup = None
+    html = None
+
+    # A fresh cached render skips the network entirely
+    cached = http_cache.lookup(url, 'page')
+    if cached is not None and cached.fresh:
+        print(f"✓ Cache hit (strategy: {cached.strategy})")
+        html = cached.body
 
     # Try cloudscraper first (fastest, bypasses most protection)
-    soup = scrape_with_cloudscraper(url)
+    # (stores / revalidates its own cache entry)
+    if html is None:
+        html = scrape_with_cloudscraper(url)
 
     # Try Playwright if cloudscraper failed (most reliable)
-    if soup is None:
-        soup = scrape_with_playwright(url)
+    if html is None:
+        html = scrape_with_playwright(url)
+        if html is not None:
+            http_cache.store(url, 'page', html, content_type='text/html', strategy='playwright')
 
     # Try Selenium as last resort
-    if soup is None:
-        soup = scrape_with_selenium(url)
+    if html is None:
+        html = scrape_with_selenium(url)
+        if html is not None:
+            http_cache.store(url, 'page', html, content_type='text/html', strategy='selenium')
 
-    if soup is None:
+    if html is None:
         print("\n❌ All scraping strategies failed!")
         return None, None, None
 
-    # Extract all images
-    all_images = get_all_images_from_soup(soup, url)
+    # Parse + single DOM visit (images, headings, meta, JSON-LD, prices) on a
+    # CPU pool worker: the GIL-bound part of scraping
+    main_image, all_images, text_data = cpu_pool.extract_page(html, url)
 
     print("\n=== ALL IMAGES FOUND ===\n")
     for idx, img in enumerate(all_images, 1):
@@ -429,18 +451,6 @@ def robust_scrape(url):
 
     print(f"\n--- Total images found: {len(all_images)} ---")
 
-    # Find representative image
-    print("\n" + "=" * 80)
-    print("=== FINDING REPRESENTATIVE IMAGE ===\n")
-
-    main_image = get_representative_image_from_soup(soup, url)
-
-    # Extract text content
-    print("\n" + "=" * 80)
-    print("=== EXTRACTING TEXT CONTENT ===\n")
-
-    text_data = extract_text_from_soup(soup, url)
-
     return main_image, all_images, text_data
 
 
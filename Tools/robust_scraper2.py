@@ -0,0 +1,379 @@
+"""
+Raw-text scraping mode: (main_image, all_text, title) per URL
+
+A lightweight alternative to robust_scraper for stages that only need the
+readable text of a page (cheap classification, embedding):
+
+- fetches over the pooled per-host HTTP sessions (HTTP/2 when available),
+  through the on-disk page cache
+- escalates to cloudscraper on anti-bot challenges, and to a browser only
+  when the static HTML has no readable text (JS-rendered shells)
+- one lxml parse + a boilerplate-removal pass (navigation, cookie banners,
+  link lists, repeated blocks) keeps the main readable text
+
+    main_image, all_text, title = robust_scrape(url)
+
+    for url, main_image, all_text, title in iter_scrape(urls, workers=16):
+        ...
+"""
+
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urljoin
+
+import http_cache
+
+
+try:
+    import lxml.etree
+    import lxml.html
+    _UTF8_PARSER = lxml.html.HTMLParser(encoding='utf-8')
+    LXML_AVAILABLE = True
+except ImportError:
+    LXML_AVAILABLE = False
+
+
+MAX_TEXT_CHARS = 20000
+# Less readable text than this from static HTML → the page needs JS rendering
+MIN_TEXT_CHARS = 200
+MIN_BLOCK_CHARS = 25
+MAX_LINK_DENSITY = 0.5
+DEFAULT_WORKERS = 16
+
+DROPPED_TAGS = ('script', 'style', 'noscript', 'template', 'svg', 'iframe', 'form',
+                'nav', 'header', 'footer', 'aside', 'button', 'select')
+BLOCK_TAGS = ('p', 'li', 'dd', 'dt', 'td', 'th', 'blockquote', 'pre', 'figcaption',
+              'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'div', 'section', 'article', 'main')
+HEADING_TAGS = {'h1', 'h2', 'h3', 'h4', 'h5', 'h6'}
+
+# A class / id / role token that names page chrome as a whole ("nav", "cookie-banner",
+# "site-footer"), not one that merely contains such a word ("header-sticky", "main-menu-open")
+BOILERPLATE_TOKEN_RE = re.compile(
+    r'(?:[a-z0-9]+[-_]{1,2})?'
+    r'(?:nav|navbar|navigation|menu|breadcrumbs?|footer|header|sidebar|cookies?|consent|gdpr|'
+    r'banner|newsletter|subscribe|signup|modal|popup|share|sharing|social|related|recommend\w*|'
+    r'comments?|advert\w*|ads?|promo|skip-link|visually-hidden|sr-only)'
+    r'(?:[-_]{1,2}(?:bar|links|list|items?|widget|buttons?|icons?|banner|notice|popup|modal|'
+    r'form|section|block|area|box|wrapper|container))?',
+    re.I
+)
+# A flagged element is only dropped when its text is this short or mostly links
+MAX_BOILERPLATE_CHARS = 400
+# ... and never when it holds this share of the page's text (a misnamed wrapper)
+MAX_BOILERPLATE_SHARE = 0.5
+CONTENT_TAGS = ('main', 'article', 'h1')
+WHITESPACE_RE = re.compile(r'\s+')
+# Short lines still worth keeping (prices, sizes, ratings)
+SHORT_KEEP_RE = re.compile(r'[$€£¥₹]\s?\d|\d+(\.\d+)?\s?(%|stars?|out of 5|cm|mm|in|oz|lb|kg|g)\b', re.I)
+CHALLENGE_RE = re.compile(r'just a moment|cf-chl|attention required|verify you are human|captcha', re.I)
+
+
+# -- extraction ------------------------------------------------------------
+
+def _clean(text):
+    return WHITESPACE_RE.sub(' ', text or '').strip()
+
+
+def _is_flagged(el):
+    """'hidden' for hidden elements, 'chrome' for chrome-named ones, else None"""
+    if el.get('aria-hidden') == 'true' or el.get('hidden') is not None:
+        return 'hidden'
+    tokens = f"{el.get('class', '')} {el.get('id', '')} {el.get('role', '')}".split()
+    if any(BOILERPLATE_TOKEN_RE.fullmatch(token) for token in tokens):
+        return 'chrome'
+    return None
+
+
+def _is_boilerplate(el, page_chars):
+    """
+    Flagged element that is safe to drop: never one wrapping the main
+    content (<main>, <article>, <h1>, or most of the page's text), and a
+    chrome-named one only when its text is short or mostly links
+    """
+    flag = _is_flagged(el)
+    if flag is None or next(el.iter(*CONTENT_TAGS), None) is not None:
+        return False
+    text = _clean(el.text_content())
+    if page_chars and len(text) > page_chars * MAX_BOILERPLATE_SHARE:
+        return False
+    if flag == 'hidden' or len(text) <= MAX_BOILERPLATE_CHARS:
+        return True
+    link_chars = sum(len(_clean(a.text_content())) for a in el.iter('a'))
+    return link_chars / len(text) > MAX_LINK_DENSITY
+
+
+def _drop_boilerplate(root):
+    """Drop boilerplate subtrees, without descending into the dropped ones"""
+    page_chars = len(_clean(root.text_content()))
+    stack = [root]
+    while stack:
+        el = stack.pop()
+        for child in reversed(list(el)):
+            if not isinstance(child.tag, str):
+                continue
+            if _is_boilerplate(child, page_chars):
+                child.drop_tree()
+            else:
+                stack.append(child)
+
+
+def _text_runs(el):
+    """
+    Text of `el` in document order, split at nested block children (which
+    yield their own runs in between) → (tag, text, characters of it inside links)
+    """
+    parts = [el.text or '']
+    link_chars = 0
+    for child in el:
+        if isinstance(child.tag, str) and child.tag in BLOCK_TAGS:
+            yield el.tag, _clean(' '.join(parts)), link_chars
+            yield from _text_runs(child)
+            parts, link_chars = [], 0
+        elif isinstance(child.tag, str):
+            inline = child.text_content()
+            parts.append(inline)
+            if child.tag == 'a':
+                link_chars += len(_clean(inline))
+            else:
+                link_chars += sum(len(_clean(a.text_content())) for a in child.iter('a'))
+        parts.append(child.tail or '')
+    yield el.tag, _clean(' '.join(parts)), link_chars
+
+
+def _image_from_tree(tree, url):
+    """og:image → twitter:image → JSON-LD Product image → first sizeable <img>"""
+    for xpath in ('//meta[@property="og:image"]/@content',
+                  '//meta[@name="twitter:image"]/@content',
+                  '//link[@rel="image_src"]/@href'):
+        found = tree.xpath(xpath)
+        if found and found[0].strip():
+            return urljoin(url, found[0].strip())
+
+    for script in tree.xpath('//script[@type="application/ld+json"]/text()'):
+        try:
+            data = json.loads(script)
+        except (json.JSONDecodeError, TypeError):
+            continue
+        for item in data if isinstance(data, list) else [data]:
+            if not isinstance(item, dict) or item.get('@type') != 'Product':
+                continue
+            image = item.get('image')
+            if isinstance(image, list) and image:
+                image = image[0]
+            if isinstance(image, dict):
+                image = image.get('url')
+            if isinstance(image, str) and image:
+                return urljoin(url, image)
+
+    for img in tree.iter('img'):
+        src = img.get('src') or img.get('data-src') or img.get('data-original')
+        if not src or src.startswith('data:'):
+            continue
+        try:
+            width, height = int(img.get('width') or 0), int(img.get('height') or 0)
+        except ValueError:
+            width = height = 0
+        # Skip declared-tiny images (icons, pixels); undeclared sizes pass
+        if (width and width < 100) or (height and height < 100):
+            continue
+        return urljoin(url, src)
+    return None
+
+
+def _title_from_tree(tree):
+    for xpath in ('//meta[@property="og:title"]/@content', '//title/text()', '//h1'):
+        found = tree.xpath(xpath)
+        if found:
+            title = _clean(found[0] if isinstance(found[0], str) else found[0].text_content())
+            if title:
+                return title
+    return None
+
+
+def readable_text(tree):
+    """
+    Boilerplate-removal pass over a parsed page → main readable text
+
+    Drops non-content tags and class/id-flagged chrome (menus, cookie
+    banners, sharing widgets), then keeps text blocks that are long enough
+    and not mostly links, in document order, without repeats.
+    """
+    for el in list(tree.iter(*DROPPED_TAGS)):
+        if el.getparent() is not None:
+            el.drop_tree()
+
+    body = tree.find('body')
+    root = body if body is not None else tree
+    _drop_boilerplate(root)
+
+    blocks = []
+    seen = set()
+    total = 0
+    for tag, text, link_chars in _text_runs(root):
+        if not text or text in seen:
+            continue
+        if tag not in HEADING_TAGS and len(text) < MIN_BLOCK_CHARS and not SHORT_KEEP_RE.search(text):
+            continue
+        if len(text) >= MIN_BLOCK_CHARS and link_chars / len(text) > MAX_LINK_DENSITY:
+            continue
+        seen.add(text)
+        blocks.append(text)
+        total += len(text) + 1
+        if total >= MAX_TEXT_CHARS:
+            break
+
+    return '\n'.join(blocks)[:MAX_TEXT_CHARS]
+
+
+def extract(html, url):
+    """One parse → (main_image, all_text, title)"""
+    if not html or not html.strip():
+        return None, '', None
+
+    if not LXML_AVAILABLE:
+        # Slower fallback: robust_scraper's single-pass extractor
+        import page_extract
+        main_image, _, text_data = page_extract.extract_page(page_extract.make_soup(html), url)
+        return main_image, text_data.get('main_content') or '', text_data.get('title')
+
+    # lxml rejects str input carrying an XML encoding declaration
+    if isinstance(html, str):
+        html = html.encode('utf-8')
+        parser = _UTF8_PARSER
+    else:
+        parser = None
+    try:
+        tree = lxml.html.fromstring(html, parser=parser)
+    except (lxml.etree.ParserError, ValueError):
+        return None, '', None
+    main_image = _image_from_tree(tree, url)
+    title = _title_from_tree(tree)
+    return main_image, readable_text(tree), title
+
+
+def needs_browser(all_text):
+    """Static HTML too thin to be the real page (JS-rendered shell)"""
+    return len(all_text or '') < MIN_TEXT_CHARS
+
+
+def _is_challenge(html):
+    head = html[:20000] if isinstance(html, str) else html[:20000].decode('utf-8', errors='replace')
+    return bool(CHALLENGE_RE.search(head))
+
+
+# -- fetching --------------------------------------------------------------
+
+def _fetch_static(url):
+    """Pooled plain GET → HTML, or None (non-HTML / HTTP error)"""
+    from http_session import fetch
+
+    try:
+        response = fetch(url)
+        response.raise_for_status()
+    except Exception as e:
+        print(f"✗ HTTP fetch failed: {e}")
+        return None
+    content_type = response.headers.get('Content-Type', '').lower()
+    if content_type and 'html' not in content_type and 'xml' not in content_type:
+        print(f"✗ URL returned {content_type}, not HTML")
+        return None
+    return response.text
+
+
+def robust_scrape(url, allow_browser=True):
+    """
+    Main readable text of a page, escalating only as far as needed:
+    page cache → pooled HTTP → cloudscraper → browser (Playwright, Selenium)
+
+    Returns:
+        (main_image, all_text, title), or (None, None, None) if every strategy failed
+    """
+    print(f"🔍 Scraping (text): {url}")
+
+    cached = http_cache.lookup(url, 'page')
+    if cached is not None and cached.fresh:
+        result = extract(cached.body, url)
+        if not needs_browser(result[1]):
+            print(f"✓ Cache hit (strategy: {cached.strategy})")
+            return result
+
+    import robust_scraper
+
+    attempts = (
+        ('http', _fetch_static),
+        ('cloudscraper', robust_scraper.scrape_with_cloudscraper),
+    )
+    if allow_browser:
+        attempts += (
+            ('playwright', robust_scraper.scrape_with_playwright),
+            ('selenium', robust_scraper.scrape_with_selenium),
+        )
+
+    best = None
+    for strategy, fetcher in attempts:
+        html = fetcher(url)
+        if html is None:
+            continue
+        if strategy == 'http' and _is_challenge(html):
+            print("✗ Anti-bot challenge page, escalating")
+            continue
+
+        result = extract(html, url)
+        if best is None or len(result[1]) > len(best[1]):
+            best = result
+        if not needs_browser(result[1]):
+            # cloudscraper caches its own responses
+            if strategy != 'cloudscraper':
+                http_cache.store(url, 'page', html, content_type='text/html', strategy=strategy)
+            print(f"✓ {len(result[1])} chars of text via {strategy}")
+            return result
+        print(f"✗ Only {len(result[1])} chars of text via {strategy}, escalating")
+
+    if best is not None:
+        print(f"⚠ Best effort: {len(best[1])} chars of text")
+        return best
+
+    print("❌ All scraping strategies failed!")
+    return None, None, None
+
+
+def iter_scrape(urls, workers=DEFAULT_WORKERS, allow_browser=False):
+    """
+    Scrape many URLs concurrently, yielding as each one finishes
+
+    Yields:
+        (url, main_image, all_text, title) in completion order
+
+    Browser escalation is off by default: the point of this mode is
+    throughput, and thin pages can be re-queued for robust_scraper.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(robust_scrape, url, allow_browser): url for url in urls}
+        for future in as_completed(futures):
+            url = futures[future]
+            try:
+                main_image, all_text, title = future.result()
+            except Exception as e:
+                print(f"✗ {url}: {e}")
+                main_image, all_text, title = None, None, None
+            yield url, main_image, all_text, title
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Raw-text scraper: main image, readable text and title")
+    parser.add_argument("urls", nargs="+", help="URLs to scrape")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help=f"Concurrent fetches (default: {DEFAULT_WORKERS})")
+    parser.add_argument("--browser", action="store_true", help="Allow browser escalation for JS-rendered pages")
+
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    for url, main_image, all_text, title in iter_scrape(args.urls, args.workers, args.browser):
+        print(f"\n{'=' * 80}\n{url}\nTitle: {title}\nImage: {main_image}\n"
+              f"Text ({len(all_text or '')} chars): {(all_text or '')[:300]}")
+    elapsed = time.perf_counter() - start
+    print(f"\n{len(args.urls)} URL(s) in {elapsed:.1f}s ({len(args.urls) / elapsed:.1f} URLs/sec)")
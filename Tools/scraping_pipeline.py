@@ -1,14 +1,48 @@
+import asyncio
 import json
 import os
+import re
 import uuid
 from pathlib import Path
 from openai import OpenAI
 
 from robust_scraper import robust_scrape
 from ss import take_screenshot
-from ss2json import ocr_image, JSON_SCHEMA_EXAMPLE
+from ss2json import JSON_SCHEMA_EXAMPLE
+import content_fingerprint
+import cpu_pool
+import llm_cache
+import rate_limit
+from prompt_compaction import compact_inputs, compact_json
 
-client = OpenAI()
+# Retries / throttling are handled by rate_limit
+client = OpenAI(max_retries=0)
+
+LLM_MODEL = "gpt-4o-mini"
+
+# Weight of each key field in the scraped-text coverage score
+COVERAGE_WEIGHTS = {"name": 0.4, "price": 0.4, "brand": 0.2}
+
+# Screenshot + OCR runs only when scraped-text coverage is below this
+OCR_COVERAGE_THRESHOLD = float(os.environ.get("OCR_COVERAGE_THRESHOLD", 1.0))
+
+# First amount in a scraped price string ("$1,299.00", "Rs. 499", "1.299,00 €", "129.99"),
+# with the currency symbol / code next to it
+PRICE_AMOUNT_RE = re.compile(
+    r'(?:(?P<pre>[$€£¥₹]|(?<![a-z])(?:rs\.?|usd|eur|gbp|inr|jpy|cny|cad|aud))\s?)?'
+    r'(?P<amount>\d(?:[\d.,]*\d)?)'
+    r'(?:\s?(?P<post>[$€£¥₹]|(?:usd|eur|gbp|inr|jpy|cny|cad|aud)\b))?',
+    re.I
+)
+# Symbol → currencies it can stand for; the first is the default
+SYMBOL_CURRENCIES = {
+    "$": ("USD", "CAD", "AUD", "NZD", "SGD", "HKD", "MXN"),
+    "€": ("EUR",),
+    "£": ("GBP",),
+    "¥": ("JPY", "CNY"),
+    "₹": ("INR",),
+    "rs": ("INR",),
+}
 
 
 SMART_SYSTEM_PROMPT = f"""
@@ -33,33 +67,116 @@ Additional rules:
 """
 
 
+def build_smart_user_content(ocr_text: str, scraped_text: dict, compact=True) -> str:
+    """
+    User message for one extraction
+
+    With `compact`, OCR + scraped text are deduplicated, stripped of
+    boilerplate and fitted to PROMPT_TOKEN_BUDGET (see prompt_compaction).
+    """
+    if compact:
+        ocr_text, scraped_text = compact_inputs(ocr_text, scraped_text)
+        dumped_scraped_text = compact_json(scraped_text)
+    else:
+        ocr_text = ocr_text[:5000]
+        dumped_scraped_text = json.dumps(scraped_text, indent=2, ensure_ascii=False)
+
+    return (
+        "OCR_TEXT:\n"
+        + ocr_text
+        + "\n\nSCRAPED_TEXT:\n"
+        + dumped_scraped_text
+        + "\n\nReturn ONE final JSON now:"
+    )
+
+
+def build_smart_messages(ocr_text: str, scraped_text: dict, compact=True) -> list[dict]:
+    """Chat messages for one extraction (shared by sync and batch modes)"""
+    return [
+        {"role": "system", "content": SMART_SYSTEM_PROMPT},
+        {"role": "user", "content": build_smart_user_content(ocr_text, scraped_text, compact)},
+    ]
+
+
+def smart_cache_key(ocr_text: str, scraped_text: dict) -> str:
+    # Keyed on the message actually sent, so budget/compaction changes re-extract
+    return llm_cache.make_key(LLM_MODEL, SMART_SYSTEM_PROMPT, build_smart_user_content(ocr_text, scraped_text))
+
+
 def call_llm_smart(ocr_text: str, scraped_text: dict) -> dict:
 
-    dumped_scraped_text = json.dumps(scraped_text, indent=2, ensure_ascii=False)
+    # Identical inputs (revisits, variant URLs, reruns) reuse the stored JSON
+    cache_key = smart_cache_key(ocr_text, scraped_text)
+    cached = llm_cache.get(cache_key)
+    if cached is not None:
+        print("✓ LLM extraction served from cache")
+        return cached
 
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
+    response = rate_limit.call(
+        "openai", client.chat.completions.with_raw_response.create,
+        model=LLM_MODEL,
         response_format={"type": "json_object"},
-        messages=[
-            {"role": "system", "content": SMART_SYSTEM_PROMPT},
-            {
-                "role": "user",
-                "content": (
-                    "OCR_TEXT:\n"
-                    + ocr_text[:5000]
-                    + "\n\nSCRAPED_TEXT:\n"
-                    + dumped_scraped_text
-                    + "\n\nReturn ONE final JSON now:"
-                )
-            }
-        ]
+        messages=build_smart_messages(ocr_text, scraped_text)
     )
 
     json_str = response.choices[0].message.content
-    return json.loads(json_str)
+    result = json.loads(json_str)
+    llm_cache.put(cache_key, result, response.usage)
+    return result
+
 
+async def acall_llm_smart(svc, ocr_text: str, scraped_text: dict) -> dict:
+    """call_llm_smart over the AsyncOpenAI client of an AsyncServices"""
+    cache_key = smart_cache_key(ocr_text, scraped_text)
+    cached = llm_cache.get(cache_key)
+    if cached is not None:
+        print("✓ LLM extraction served from cache")
+        return cached
 
-def scrape_to_json(url: str, output_dir="output", last_visit_time=None):
+    async with svc.limit("openai"):
+        response = await rate_limit.acall(
+            "openai", svc.openai.chat.completions.with_raw_response.create,
+            model=LLM_MODEL,
+            response_format={"type": "json_object"},
+            messages=build_smart_messages(ocr_text, scraped_text)
+        )
+
+    json_str = response.choices[0].message.content
+    result = json.loads(json_str)
+    llm_cache.put(cache_key, result, response.usage)
+    return result
+
+
+def score_field_coverage(text_data: dict | None) -> tuple[float, list[str]]:
+    """
+    How much of the key product info the HTML scrape already found
+
+    Returns:
+        (score in [0, 1], list of missing key fields)
+    """
+    if not text_data:
+        return 0.0, list(COVERAGE_WEIGHTS)
+
+    name = text_data.get("heading") or text_data.get("title")
+    present = {
+        "name": bool(name and len(name.strip()) >= 3),
+        "price": bool(text_data.get("price") and re.search(r"\d", text_data["price"])),
+        "brand": bool(text_data.get("brand")),
+    }
+
+    score = sum(weight for field, weight in COVERAGE_WEIGHTS.items() if present[field])
+    missing = [field for field in COVERAGE_WEIGHTS if not present[field]]
+    return round(score, 2), missing
+
+
+def prepare_extraction(url: str, output_dir="output", last_visit_time=None, keep_screenshot=False) -> dict:
+    """
+    Scrape (+ screenshot/OCR when needed) everything the LLM step needs
+
+    Returns:
+        dict with url, last_visit_time, main_image, text_data, ocr_text, ocr_decision
+        and the content fingerprints / change since the last visit (see content_fingerprint)
+    """
     Path(output_dir).mkdir(exist_ok=True)
 
     # Ensure URL has a protocol
@@ -70,38 +187,169 @@ def scrape_to_json(url: str, output_dir="output", last_visit_time=None):
     print("\n==== STEP 1: Robust Scraping ====\n")
     main_image, all_images, text_data = robust_scrape(url)
 
-    print("\n==== STEP 2: Screenshot Capture ====\n")
-    screenshot_file = f"{output_dir}/{uuid.uuid4().hex}_screenshot.png"
-    take_screenshot(url, screenshot_file)
+    # Same content as the last visit → the stored extraction is reused (no OCR / LLM)
+    fingerprint, content_fp = content_fingerprint.compute(text_data, main_image)
+    # Nothing scraped → nothing known about the page: treat it as new (store() skips it too)
+    previous = content_fingerprint.lookup(url) if fingerprint else None
+    change = content_fingerprint.classify(previous, fingerprint, content_fp)
+    reusable = change == content_fingerprint.UNCHANGED or (
+        change == content_fingerprint.PRICE and extract_price((text_data or {}).get("price")) is not None
+    )
+    print(f"Content since last visit: {change}")
+
+    # Only pay for a browser launch + OCR when the HTML scrape is missing key fields
+    coverage, missing = score_field_coverage(text_data)
+    run_ocr = coverage < OCR_COVERAGE_THRESHOLD and not reusable
+    ocr_decision = {
+        "ran": run_ocr,
+        "coverage": coverage,
+        "threshold": OCR_COVERAGE_THRESHOLD,
+        "missing": missing,
+        "reason": (f"missing {', '.join(missing)}" if missing else "below threshold") if run_ocr
+                  else f"content {change} since last visit" if reusable
+                  else "scraped text covers key fields",
+    }
+    print(f"Field coverage: {coverage} (missing: {missing or 'none'}) → OCR {'runs' if run_ocr else 'skipped'}")
 
-    print("\n==== STEP 3: OCR on Screenshot ====\n")
-    ocr_text = ocr_image(screenshot_file)
+    if run_ocr:
+        print("\n==== STEP 2: Screenshot Capture ====\n")
+        # Screenshot stays in memory; only written to disk when asked to keep it
+        screenshot_file = f"{output_dir}/{uuid.uuid4().hex}_screenshot.png" if keep_screenshot else None
+        screenshot_png, region_boxes = take_screenshot(url, screenshot_file, with_regions=True)
+        if screenshot_file:
+            print(f"Saved screenshot → {screenshot_file}")
 
-    print("\n==== STEP 4: LLM JSON Extraction (OCR + scraped text fallback) ====\n")
-    final_json = call_llm_smart(ocr_text, text_data)
+        print("\n==== STEP 3: OCR on Screenshot (product regions only) ====\n")
+        ocr_text = cpu_pool.ocr_regions(screenshot_png, region_boxes)
+    else:
+        print("\n==== STEP 2-3: Screenshot + OCR skipped ====\n")
+        ocr_text = ""
 
-    enriched_json = {
-        **final_json,
+    return {
         "url": url,
-        "lastVisitTime": last_visit_time,
-        "original_title": text_data.get("title"),
+        "last_visit_time": last_visit_time,
         "main_image": main_image,
+        "text_data": text_data,
+        "ocr_text": ocr_text,
+        "ocr_decision": ocr_decision,
+        "fingerprint": fingerprint,
+        "content_fingerprint": content_fp,
+        "content_change": change,
+        "previous_product": previous["product"] if reusable else None,
     }
 
+
+def extract_price(raw_price, previous_currency=None) -> dict | None:
+    """
+    Price + currency from a scraped price string, or None without an amount
+
+    Only the first amount counts (sale price before the struck-through one).
+    The price keeps the schema's "amount with currency symbol" form; the
+    currency is left out when the string names none, and an ambiguous
+    symbol ("$") keeps the previous currency when it is one of its options.
+    """
+    match = PRICE_AMOUNT_RE.search(str(raw_price or ""))
+    if not match:
+        return None
+
+    # A symbol after the amount only counts when none precedes it ("$10$12" is two prices)
+    side = "pre" if match.group("pre") else "post" if match.group("post") else None
+    marker = match.group(side).lower().rstrip(".") if side else ""
+    result = {"price": match.group("amount")}
+    if marker in SYMBOL_CURRENCIES:
+        candidates = SYMBOL_CURRENCIES[marker]
+        start, end = (match.start("pre"), match.end("amount")) if side == "pre" else (match.start("amount"), match.end("post"))
+        result["price"] = match.string[start:end]
+        result["currency"] = previous_currency if previous_currency in candidates else candidates[0]
+    elif marker:
+        result["currency"] = marker.upper()
+    return result
+
+
+def reuse_extraction(prepared: dict) -> dict | None:
+    """
+    Extraction from the last visit when the content allows it, else None
+
+    Unchanged content reuses the stored product as is; a price-only change
+    re-extracts price + currency from the scraped price and merges just
+    those keys into the stored product.
+    """
+    previous = prepared.get("previous_product")
+    if previous is None:
+        return None
+
+    final_json = dict(previous)
+    if prepared["content_change"] == content_fingerprint.PRICE:
+        price = extract_price(prepared["text_data"]["price"], previous.get("currency"))
+        if price is None:
+            return None
+        final_json.update(price)
+        print(f"✓ Only the price changed: {previous.get('price')} → {final_json['price']}")
+    else:
+        print("✓ Content unchanged since last visit, reusing extraction")
+    return final_json
+
+
+def finalize_extraction(prepared: dict, final_json: dict, output_dir="output") -> dict:
+    """Merge the LLM output with page metadata and save the product JSON"""
+    enriched_json = {
+        **final_json,
+        "url": prepared["url"],
+        "lastVisitTime": prepared["last_visit_time"],
+        "original_title": (prepared["text_data"] or {}).get("title"),
+        "main_image": prepared["main_image"],
+        "ocr_decision": prepared["ocr_decision"],
+        "content_change": prepared.get("content_change"),
+    }
+
+    content_fingerprint.store(
+        prepared["url"], prepared.get("fingerprint"), prepared.get("content_fingerprint"), enriched_json
+    )
+
     print("\nFINAL JSON OUTPUT:\n")
     print(json.dumps(enriched_json, indent=2, ensure_ascii=False))
 
+    Path(output_dir).mkdir(exist_ok=True)
     out_json_path = f"{output_dir}/{uuid.uuid4().hex}_product.json"
     with open(out_json_path, "w") as f:
         json.dump(enriched_json, f, indent=2, ensure_ascii=False)
 
     print(f"\nSaved JSON → {out_json_path}")
-    print(f"Saved screenshot → {screenshot_file}")
-    print(f"Representative image → {main_image}")
+    print(f"Representative image → {prepared['main_image']}")
 
     return enriched_json
 
 
+def scrape_to_json(url: str, output_dir="output", last_visit_time=None, keep_screenshot=False):
+    prepared = prepare_extraction(url, output_dir, last_visit_time, keep_screenshot)
+
+    final_json = reuse_extraction(prepared)
+    if final_json is None:
+        print("\n==== STEP 4: LLM JSON Extraction (OCR + scraped text fallback) ====\n")
+        final_json = call_llm_smart(prepared["ocr_text"], prepared["text_data"])
+
+    return finalize_extraction(prepared, final_json, output_dir)
+
+
+async def ascrape_to_json(svc, url: str, output_dir="output", last_visit_time=None, keep_screenshot=False):
+    """
+    Async scrape_to_json
+
+    Scrape + screenshot + OCR are blocking (browser drivers, tesseract) and
+    run in a worker thread, bounded by the "scrape" limit; the LLM call is
+    awaited on the event loop.
+    """
+    async with svc.limit("scrape"):
+        prepared = await asyncio.to_thread(
+            prepare_extraction, url, output_dir, last_visit_time, keep_screenshot
+        )
+
+    final_json = reuse_extraction(prepared)
+    if final_json is None:
+        final_json = await acall_llm_smart(svc, prepared["ocr_text"], prepared["text_data"])
+
+    return finalize_extraction(prepared, final_json, output_dir)
+
 
 if __name__ == "__main__":
     import argparse
@@ -109,6 +357,7 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Scrape website → screenshot → OCR → JSON pipeline")
     parser.add_argument("url", help="URL of website to scrape")
     parser.add_argument("--out", default="output", help="Output directory")
+    parser.add_argument("--keep-screenshots", action="store_true", help="Also save screenshot PNGs to the output directory")
 
     args = parser.parse_args()
-    scrape_to_json(args.url, args.out)
+    scrape_to_json(args.url, args.out, keep_screenshot=args.keep_screenshots)
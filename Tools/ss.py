@@ -7,12 +7,18 @@ Fallback option if undetected-chromedriver is not available
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
 import sys
-import time
-import random
 
+from render_profile import apply_to_selenium, wait_until_ready_selenium
 
-def take_screenshot(url, output_file='screenshot.png'):
-    """Take a screenshot of a website with enhanced stealth"""
+
+def take_screenshot(url, output_file=None, with_regions=False):
+    """
+    Take a screenshot of a website with enhanced stealth
+
+    Returns the PNG as bytes; also writes it to `output_file` if given.
+    With `with_regions`, returns (png, boxes) where boxes are the title /
+    price / brand / buy-box rectangles measured in the same render.
+    """
 
     options = Options()
 
@@ -48,25 +54,39 @@ def take_screenshot(url, output_file='screenshot.png'):
     # Hide webdriver property
     driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
 
+    # Block fonts/media/trackers and track DOM mutations
+    apply_to_selenium(driver)
+
     try:
         print(f"Loading: {url}")
         driver.get(url)
 
-        # Wait for page to load with random delay to mimic human behavior
-        wait_time = random.uniform(3, 5)
-        print(f"Waiting {wait_time:.1f}s for page to load...")
-        time.sleep(wait_time)
+        # Wait for product signals / main image / DOM quiet period
+        wait_until_ready_selenium(driver)
 
-        # Scroll to trigger lazy loading
+        # Scroll to trigger lazy loading, then wait for the DOM to settle again
         driver.execute_script("window.scrollTo(0, document.body.scrollHeight/2);")
-        time.sleep(1)
         driver.execute_script("window.scrollTo(0, 0);")
-        time.sleep(1)
+        wait_until_ready_selenium(driver, timeout=3)
 
         print(f"Taking screenshot...")
-        driver.save_screenshot(output_file)
-
-        print(f"✓ Screenshot saved to: {output_file}")
+        png = driver.get_screenshot_as_png()
+
+        if output_file:
+            with open(output_file, 'wb') as f:
+                f.write(png)
+            print(f"✓ Screenshot saved to: {output_file}")
+
+        if with_regions:
+            from ocr_regions import REGION_BOXES_JS
+            try:
+                boxes = driver.execute_script(REGION_BOXES_JS) or []
+            except Exception as e:
+                print(f"⚠ Could not measure product regions: {e}")
+                boxes = []
+            return png, boxes
+
+        return png
 
     except Exception as e:
         print(f"✗ Error: {e}")
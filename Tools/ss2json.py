@@ -2,45 +2,28 @@ import json
 import re
 from pathlib import Path
 
-import pytesseract
-from PIL import Image
-
 from openai import OpenAI
 
-client = OpenAI()
-
-def ocr_image(image_path: str) -> str:
-    import os
-    import subprocess
-
-    if not os.path.exists(image_path):
-        raise FileNotFoundError(f"Screenshot not found: {image_path}")
-
-    try:
-        result = subprocess.run(
-            ['/opt/homebrew/bin/tesseract', image_path, 'stdout'],
-            capture_output=True,
-            text=False, 
-            check=False,
-            timeout=30
-        )
-
-        stdout_text = result.stdout.decode('utf-8', errors='replace') if result.stdout else ''
+import llm_cache
+import cpu_pool
+import rate_limit
 
-        if result.returncode != 0:
-            stderr_text = result.stderr.decode('utf-8', errors='replace') if result.stderr else ''
-            print(f"Tesseract error (code {result.returncode}): {stderr_text[:500]}")
+# Retries / throttling are handled by rate_limit
+client = OpenAI(max_retries=0)
 
-            if stdout_text.strip():
-                print("Using partial OCR output despite errors")
-                return stdout_text
+LLM_MODEL = "gpt-4o-mini"
 
-            raise Exception(f"Tesseract failed: {stderr_text[:200]}")
-
-        return stdout_text
+def ocr_image(image) -> str:
+    """
+    OCR a screenshot with pooled Tesseract engines (on a CPU pool worker, see cpu_pool)
 
-    except subprocess.TimeoutExpired:
-        raise Exception(f"Tesseract timed out on {image_path}")
+    Args:
+        image: PNG bytes, file path, numpy array or PIL image
+    """
+    try:
+        return cpu_pool.ocr(image)
+    except FileNotFoundError:
+        raise
     except Exception as e:
         print(f"OCR error: {e}")
         raise
@@ -82,8 +65,14 @@ def call_llm_for_json(ocr_text: str) -> dict:
     Uses OpenAI gpt-4o-mini with enforced JSON output.
     """
 
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
+    cache_key = llm_cache.make_key(LLM_MODEL, SYSTEM_PROMPT, ocr_text)
+    cached = llm_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    response = rate_limit.call(
+        "openai", client.chat.completions.with_raw_response.create,
+        model=LLM_MODEL,
         response_format={"type": "json_object"},
         messages=[
             {"role": "system", "content": SYSTEM_PROMPT},
@@ -93,12 +82,14 @@ def call_llm_for_json(ocr_text: str) -> dict:
 
     # Extract the JSON string
     json_str = response.choices[0].message.content
-    return json.loads(json_str)
+    result = json.loads(json_str)
+    llm_cache.put(cache_key, result, response.usage)
+    return result
 
 
 
-def extract_product_from_image(image_path: str) -> dict:
-    ocr_text = ocr_image(image_path)
+def extract_product_from_image(image) -> dict:
+    ocr_text = ocr_image(image)
 
     print("OCR TEXT (debug):")
     print(ocr_text)
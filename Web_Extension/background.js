@@ -1,5 +1,13 @@
 const FUNCTION_URL = "https://ingesthistory-func.azurewebsites.net/api/ingesthistory";
 
+// gzip the JSON body (history payloads compress ~10x)
+async function gzipJson(data) {
+  const stream = new Blob([JSON.stringify(data)])
+    .stream()
+    .pipeThrough(new CompressionStream("gzip"));
+  return await new Response(stream).arrayBuffer();
+}
+
 async function sendHistory() {
   return new Promise((resolve, reject) => {
     const ONE_HOUR_MS = 60 * 60 * 1000;
@@ -11,13 +19,13 @@ async function sendHistory() {
         maxResults: 1000,
         startTime: startTime
       },
-      (items) => {
+      async (items) => {
         console.log(`Retrieved ${items.length} history items. Sending to Azure...`);
 
         fetch(FUNCTION_URL, {
           method: "POST",
-          headers: { "Content-Type": "application/json" },
-          body: JSON.stringify(items)
+          headers: { "Content-Type": "application/json", "Content-Encoding": "gzip" },
+          body: await gzipJson(items)
         })
           .then((res) => {
             if (!res.ok) {
@@ -1,8 +1,12 @@
 import os
 import json
+import asyncio
+import sys
+import time
+import weakref
 from pathlib import Path  
 
-from langchain.tools import tool
+from langchain.tools import tool, StructuredTool
 from langchain.agents import create_agent
 from langchain_openai import ChatOpenAI
 
@@ -10,10 +14,14 @@ from azure.search.documents import SearchClient
 from azure.core.credentials import AzureKeyCredential
 from azure.search.documents.models import VectorizedQuery
 
-import torch
-from transformers import CLIPModel, CLIPProcessor
 from openai import OpenAI  
 
+sys.path.insert(0, str(Path(__file__).parent / "Tools"))
+from async_clients import AsyncServices
+import embed_client
+import price_history
+import rate_limit
+
 
 ENDPOINT = os.environ["AZURE_SEARCH_ENDPOINT"]
 INDEX = os.environ["AZURE_SEARCH_INDEX"]
@@ -25,42 +33,45 @@ search_client = SearchClient(
     credential=AzureKeyCredential(API_KEY),
 )
 
-openai_client = OpenAI(api_key=os.environ["OPENAI_API_KEY"])
+# Retries / throttling are handled by rate_limit
+openai_client = OpenAI(api_key=os.environ["OPENAI_API_KEY"], max_retries=0)
 
 def text_embed(text: str) -> list[float]:
     """Get text embedding using the same OpenAI model as indexing."""
-    resp = openai_client.embeddings.create(
+    resp = rate_limit.call(
+        "openai", openai_client.embeddings.with_raw_response.create,
         model="text-embedding-3-small",
         input=text,
     )
     return resp.data[0].embedding  
 
 
-clip_model_name = "openai/clip-vit-base-patch32"
-DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
-
-clip_model = CLIPModel.from_pretrained(clip_model_name).to(DEVICE)
-clip_processor = CLIPProcessor.from_pretrained(clip_model_name)
+def clip_text_embed(text: str) -> list[float]:
+    # Shared embedding service when running, else in-process (see Tools/embed_client.py)
+    return embed_client.embed_text(text)
 
 
-def clip_text_embed(text: str) -> list[float]:
-    inputs = clip_processor(
-        text=[text],
-        images=None,
-        return_tensors="pt",
-        padding=True,
-        truncation=True,
-    ).to(DEVICE)
+def _price_summary(doc_id):
+    try:
+        return price_history.summary(doc_id)
+    except ValueError:
+        return None
 
-    with torch.no_grad():
-        text_features = clip_model.get_text_features(**inputs)
 
-    text_features = text_features / text_features.norm(p=2, dim=-1, keepdim=True)
-    return text_features[0].cpu().tolist()
+def _hit(d) -> dict:
+    hit = {
+        "id": d["id"],
+        "content": d.get("content"),
+        "product": d.get("product_json"),
+        "score": d.get("@search.score"),
+    }
+    summary = _price_summary(d["id"])
+    if summary is not None:
+        hit["price_history"] = summary
+    return hit
 
 
-@tool
-def product_search(query: str) -> str:
+def _product_search(query: str) -> str:
     """
     Retrieve products using Azure AI Search:
 
@@ -104,25 +115,76 @@ def product_search(query: str) -> str:
         top=5,
     )
 
-    text_hits = [
-        {
-            "id": d["id"],
-            "content": d.get("content"),
-            "product": d.get("product_json"),
-            "score": d.get("@search.score"),
-        }
-        for d in semantic_results
-    ]
-
-    image_hits = [
+    text_hits = [_hit(d) for d in semantic_results]
+    image_hits = [_hit(d) for d in image_results]
+
+    return json.dumps(
         {
-            "id": d["id"],
-            "content": d.get("content"),
-            "product": d.get("product_json"),
-            "score": d.get("@search.score"),
-        }
-        for d in image_results
-    ]
+            "text_hits": text_hits,
+            "image_hits": image_hits,
+        },
+        ensure_ascii=False,
+    )
+
+
+# Async clients for agent.ainvoke, one set per event loop: aio clients and
+# semaphores are bound to the loop they were created on, and every
+# asyncio.run (e.g. a Streamlit rerun) starts a new one
+_async_services = weakref.WeakKeyDictionary()
+
+
+def _get_async_services() -> AsyncServices:
+    loop = asyncio.get_running_loop()
+    svc = _async_services.get(loop)
+    if svc is None:
+        svc = AsyncServices(search_key_env="AZURE_SEARCH_API_KEY")
+        _async_services[loop] = svc
+    return svc
+
+
+async def close_async_services():
+    """Close this loop's async clients; await before the loop ends (end of asyncio.run)"""
+    svc = _async_services.pop(asyncio.get_running_loop(), None)
+    if svc is not None:
+        await svc.close()
+
+
+async def _aproduct_search(query: str) -> str:
+    """Async product_search: semantic and image-vector searches run concurrently"""
+    svc = _get_async_services()
+
+    async def fetch_hits(**kwargs):
+        # The aio search client does not retry: the query + first page go through rate_limit
+        results = await svc.search.search(**kwargs)
+        return [_hit(d) async for d in results]
+
+    async def semantic_hits():
+        async with svc.limit("search"):
+            return await rate_limit.acall(
+                "search", fetch_hits,
+                search_text=query,
+                query_type="semantic",
+                semantic_configuration_name="products-semantic-config",
+                top=10,
+            )
+
+    async def image_hits():
+        # CLIP runs on CPU/GPU: keep it off the event loop
+        image_vec = await asyncio.to_thread(clip_text_embed, query)
+        image_vector_query = VectorizedQuery(
+            vector=image_vec,
+            k_nearest_neighbors=5,
+            fields="image_vector",
+        )
+        async with svc.limit("search"):
+            return await rate_limit.acall(
+                "search", fetch_hits,
+                search_text=None,
+                vector_queries=[image_vector_query],
+                top=5,
+            )
+
+    text_hits, image_hits = await asyncio.gather(semantic_hits(), image_hits())
 
     return json.dumps(
         {
@@ -133,6 +195,13 @@ def product_search(query: str) -> str:
     )
 
 
+product_search = StructuredTool.from_function(
+    func=_product_search,
+    coroutine=_aproduct_search,
+    name="product_search",
+)
+
+
 @tool
 def user_preferences() -> str:
     """
@@ -167,6 +236,32 @@ def user_preferences() -> str:
     return json.dumps(data, ensure_ascii=False)
 
 
+@tool
+def price_changes(product_id: str, days: int | None = None) -> str:
+    """
+    Price history of a product the user has viewed, from every visit to it.
+
+    Use this tool when the user asks whether something got cheaper, has
+    dropped in price since they looked, or how its price moved over time.
+    `product_id` is the `id` of a product_search hit; `days` limits the
+    history to the last N days.
+
+    Returns a JSON string with `summary` (first / previous / latest price,
+    min, max, change since first and previous visit) and `history`
+    ([timestamp, price] pairs, oldest first).
+    """
+    start = time.time() - days * 86400 if days else None
+    try:
+        summary = price_history.summary(product_id)
+        history = price_history.history(product_id, start=start)
+    except ValueError:
+        return json.dumps({"error": f"Unknown product id: {product_id}"}, ensure_ascii=False)
+
+    if summary is None:
+        return json.dumps({"error": "No price history recorded for this product"}, ensure_ascii=False)
+    return json.dumps({"summary": summary, "history": history}, ensure_ascii=False)
+
+
 llm = ChatOpenAI(
     model="gpt-4o-mini",
     temperature=0.2,
@@ -174,7 +269,7 @@ llm = ChatOpenAI(
 
 agent = create_agent(
     model=llm,
-    tools=[product_search, user_preferences],
+    tools=[product_search, user_preferences, price_changes],
     system_prompt=(
         "You are a helpful shopping assistant. Do not chat like a bot, chat like a human working in a shop. "
         "Use the `product_search` tool to find products, then summarize the results. For every product displayed, "
@@ -188,10 +283,22 @@ agent = create_agent(
         "\n"
         "Use the `user_preferences` tool whenever the user asks about their own history or preferences "
         "- for example, their favourite brand, how many shoes they saw, or their top categories."
+        "\n\n"
+        "Hits that were seen more than once carry a `price_history` summary. When the user asks whether a "
+        "product dropped in price since they looked, compare its latest price with the previous one, and use "
+        "the `price_changes` tool for the full history. Use `user_preferences` for their biggest price drops."
     ),
 )
 
 
+async def ainvoke(question: str) -> dict:
+    """agent.ainvoke for one question, closing the async clients when done"""
+    try:
+        return await agent.ainvoke({"messages": [{"role": "user", "content": question}]})
+    finally:
+        await close_async_services()
+
+
 if __name__ == "__main__":
     print("Agent ready! Type 'exit' to quit.")
     while True:
@@ -1,7 +1,9 @@
+import asyncio
+import gzip
 import json
 import os
 import sys
-from datetime import datetime
+from datetime import datetime, timedelta
 from pathlib import Path
 import io
 
@@ -15,14 +17,52 @@ if settings_path.exists():
 
 # Now import everything else
 import logging
-from azure.storage.blob import BlobServiceClient
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from azure.core.exceptions import HttpResponseError, ResourceModifiedError, ResourceNotFoundError
+from azure.storage.blob import BlobServiceClient, ContentSettings
 
 # Add Tools directory to path for imports
 tools_dir = Path(__file__).parent.parent / "Tools"
 if tools_dir.exists():
     sys.path.insert(0, str(tools_dir))
 
-from process_history import process_history
+from http_cache import canonical_url
+from run_lock import BlobLease, FileLock, LockHeld
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+# Blob batch requests accept at most 256 sub-requests
+BATCH_DELETE_SIZE = 256
+
+# Blob lifecycle lives in index tags: pending → processing → done / failed
+STATE_TAG = "state"
+STATE_AT_TAG = "state_at"
+STATE_PENDING = "pending"
+STATE_PROCESSING = "processing"
+STATE_DONE = "done"
+STATE_FAILED = "failed"
+LEGACY_PENDING_PREFIX = "pending/"
+# A blob still 'processing' after this long belongs to a crashed run
+STALE_PROCESSING_SECONDS = int(os.environ.get("CRON_STALE_PROCESSING_SECONDS", 6 * 3600))
+# done / failed blobs older than this are folded into archives by --retention
+RETENTION_DAYS = int(os.environ.get("CRON_RETENTION_DAYS", 30))
+
+# Blob downloads are parsed through a buffer of this size, never held whole
+STREAM_BUFFER_SIZE = 1024 * 1024
+
+# URLs written to the log per run; the rest are only counted
+LOG_SAMPLE_SIZE = 5
+
+# "file": flock singleton on this machine; "lease": blob lease shared by workers on several machines
+RUN_LOCK = os.environ.get("CRON_RUN_LOCK", "file")
+
+# PIPELINE_ASYNC=1 processes the work batch's URLs concurrently with the async clients
+PIPELINE_ASYNC = os.environ.get("PIPELINE_ASYNC", "0") == "1"
 
 try:
     from compute_preferences import get_all_products, compute_preferences
@@ -62,61 +102,311 @@ class LoggerWriter:
         pass
 
 
+def _now_tag():
+    """UTC timestamp tag value (fixed width, so tag filters compare it as a date)"""
+    return datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def set_state(container_client, blob_name, state, expect=None):
+    """
+    One index-tag write: state (+ time of the transition)
+
+    With `expect`, the write only succeeds if the blob is still in that
+    state, so two workers can never both claim the same blob.
+
+    Returns:
+        True if the transition was applied
+    """
+    condition = f"\"{STATE_TAG}\"='{expect}'" if expect else None
+    try:
+        container_client.get_blob_client(blob_name).set_blob_tags(
+            {STATE_TAG: state, STATE_AT_TAG: _now_tag()},
+            if_tags_match_condition=condition,
+        )
+        return True
+    except (ResourceModifiedError, ResourceNotFoundError):
+        return False
+    except HttpResponseError as e:
+        if e.status_code == 412:
+            return False
+        raise
+
+
+def find_blobs(container_client, state, before=None):
+    """Names of blobs in `state` (tag filter, no listing of the whole container)"""
+    expression = f"\"{STATE_TAG}\"='{state}'"
+    if before:
+        expression += f" AND \"{STATE_AT_TAG}\"<'{before}'"
+    return [blob.name for blob in container_client.find_blobs_by_tags(expression)]
+
+
 def get_pending_blobs(blob_service_client, container_name):
     """Get list of pending blob files to process"""
     logging.info("Getting list of pending blobs from container...")
     container_client = blob_service_client.get_container_client(container_name)
 
     try:
-        # List all blobs in the "pending" folder
-        logging.info("Listing blobs with prefix 'pending/'...")
-        blobs = container_client.list_blobs(name_starts_with="pending/")
-        blob_list = [blob.name for blob in blobs if blob.name.endswith('.json')]
-        logging.info(f"Found {len(blob_list)} pending blob(s): {blob_list}")
+        blob_list = find_blobs(container_client, STATE_PENDING)
+
+        # Blobs uploaded before state tags: untagged files under the legacy prefix
+        for blob in container_client.list_blobs(name_starts_with=LEGACY_PENDING_PREFIX, include=["tags"]):
+            if not blob.tags and blob.name.endswith(('.json', '.ndjson.gz')):
+                blob_list.append(blob.name)
+
+        logging.info(f"Found {len(blob_list)} pending blob(s): {blob_list[:LOG_SAMPLE_SIZE]}"
+                     f"{' …' if len(blob_list) > LOG_SAMPLE_SIZE else ''}")
         return blob_list
     except Exception as e:
         logging.error(f"Error listing blobs: {e}")
         return []
 
 
-def download_blob(blob_service_client, container_name, blob_name):
-    """Download blob content as JSON"""
-    logging.info(f"Downloading blob: {blob_name}")
-    blob_client = blob_service_client.get_blob_client(container=container_name, blob=blob_name)
+def claim_blobs(blob_service_client, container_name, blob_names):
+    """pending → processing for each blob; returns the ones this run claimed"""
+    container_client = blob_service_client.get_container_client(container_name)
+
+    def claim(name):
+        # Untagged legacy blobs have no state to match against
+        expect = None if name.startswith(LEGACY_PENDING_PREFIX) else STATE_PENDING
+        return name if set_state(container_client, name, STATE_PROCESSING, expect=expect) else None
+
+    with ThreadPoolExecutor(max_workers=min(8, len(blob_names))) as pool:
+        claimed = [name for name in pool.map(claim, blob_names) if name is not None]
+    if len(claimed) < len(blob_names):
+        logging.info(f"{len(blob_names) - len(claimed)} blob(s) were claimed by another worker")
+    return claimed
+
+
+def finish_blobs(blob_service_client, container_name, blob_names, state):
+    """processing → done / failed, one tag write per blob"""
+    container_client = blob_service_client.get_container_client(container_name)
+    with ThreadPoolExecutor(max_workers=max(1, min(8, len(blob_names)))) as pool:
+        applied = sum(pool.map(lambda name: set_state(container_client, name, state), blob_names))
+    logging.info(f"Marked {applied} blob(s) as {state}")
 
+
+def recover_stale(blob_service_client, container_name):
+    """Put blobs left in 'processing' by a crashed run back to pending"""
+    container_client = blob_service_client.get_container_client(container_name)
+    cutoff = (datetime.utcnow() - timedelta(seconds=STALE_PROCESSING_SECONDS)).strftime("%Y-%m-%dT%H:%M:%SZ")
     try:
-        blob_data = blob_client.download_blob().readall()
-        logging.info(f"Downloaded {len(blob_data)} bytes")
-        data = json.loads(blob_data)
-        logging.info(f"Parsed JSON successfully: {len(data)} items")
-        return data
+        stale = find_blobs(container_client, STATE_PROCESSING, before=cutoff)
     except Exception as e:
-        logging.error(f"Error downloading blob {blob_name}: {e}")
-        return None
+        logging.error(f"Error looking for stale blobs: {e}")
+        return
+    recovered = sum(set_state(container_client, name, STATE_PENDING, expect=STATE_PROCESSING) for name in stale)
+    if recovered:
+        logging.warning(f"Reset {recovered} blob(s) stuck in '{STATE_PROCESSING}' back to '{STATE_PENDING}'")
 
 
-def move_blob(blob_service_client, container_name, source_blob_name, dest_folder="processed"):
-    """Move blob from pending to processed folder"""
-    filename = Path(source_blob_name).name
-    dest_blob_name = f"{dest_folder}/{filename}"
+def apply_retention(blob_service_client, container_name, days=RETENTION_DAYS):
+    """
+    Bulk retention: fold done / failed blobs older than `days` into
+    processed/ and failed/ archives (one per BATCH_DELETE_SIZE blobs) and
+    batch-delete the originals
+    """
+    container_client = blob_service_client.get_container_client(container_name)
+    cutoff = (datetime.utcnow() - timedelta(days=days)).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    for state, dest_folder in ((STATE_DONE, "processed"), (STATE_FAILED, "failed")):
+        names = find_blobs(container_client, state, before=cutoff)
+        logging.info(f"Retention: {len(names)} '{state}' blob(s) older than {days} day(s)")
+        for start in range(0, len(names), BATCH_DELETE_SIZE):
+            chunk = names[start:start + BATCH_DELETE_SIZE]
+            items = []
+            sources = []
+            for name in chunk:
+                try:
+                    blob_items = list(iter_blob_items(blob_service_client, container_name, name))
+                except Exception as e:
+                    logging.error(f"Retention: error reading {name}: {e}")
+                    continue
+                items.extend(blob_items)
+                sources.append(name)
+            if sources:
+                archive_batch(blob_service_client, container_name, items, sources, dest_folder)
 
-    logging.info(f"Moving blob from {source_blob_name} to {dest_blob_name}")
 
-    source_client = blob_service_client.get_blob_client(container=container_name, blob=source_blob_name)
-    dest_client = blob_service_client.get_blob_client(container=container_name, blob=dest_blob_name)
+class _BlobStream(io.RawIOBase):
+    """Read-only file object over a blob download's chunk iterator"""
 
-    try:
-        # Copy blob
-        logging.info(f"Copying blob to '{dest_folder}/' folder...")
-        dest_client.start_copy_from_url(source_client.url)
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = b""
+        self.bytes_read = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._buffer:
+            try:
+                self._buffer = next(self._chunks)
+            except StopIteration:
+                return 0
+            self.bytes_read += len(self._buffer)
+        n = min(len(b), len(self._buffer))
+        b[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+
+def iter_blob_items(blob_service_client, container_name, blob_name):
+    """
+    Stream the history items of a pending blob
+
+    The download is consumed chunk by chunk and parsed incrementally
+    (NDJSON lines for .ndjson.gz, ijson for legacy .json arrays), so memory
+    stays flat whatever the blob size. Raises on download/parse errors.
+    """
+    blob_client = blob_service_client.get_blob_client(container=container_name, blob=blob_name)
+    stream = _BlobStream(blob_client.download_blob().chunks())
+    count = 0
+
+    if blob_name.endswith('.ndjson.gz'):
+        # Written by ingestHistory: gzipped, one history item per line
+        with gzip.GzipFile(fileobj=io.BufferedReader(stream, STREAM_BUFFER_SIZE)) as lines:
+            for line in lines:
+                if line.strip():
+                    count += 1
+                    yield json.loads(line)
+    elif ijson is not None:
+        for item in ijson.items(io.BufferedReader(stream, STREAM_BUFFER_SIZE), 'item', use_float=True):
+            count += 1
+            yield item
+    else:
+        # Legacy JSON array without ijson installed: parse in one go
+        for item in json.load(io.BufferedReader(stream, STREAM_BUFFER_SIZE)):
+            count += 1
+            yield item
+
+    logging.info(f"Read {blob_name}: {count} item(s), {stream.bytes_read} bytes")
+
+
+class HistoryMerger:
+    """
+    Merge history items from several pending blobs into one work list
+
+    One entry per URL (canonical form, so tracking variants collapse), with
+    the newest lastVisitTime (and its title / url) and the visit counts of
+    its distinct visits summed. The same visit posted in two overlapping
+    windows (same lastVisitTime) is only counted once. Thread-safe, so
+    parallel blob streams feed it directly.
+    """
+
+    def __init__(self):
+        self.merged = {}
+        self.seen_visits = set()
+        self.received = 0
+        self.sample = []
+        self._lock = threading.Lock()
+
+    def add(self, item):
+        url = item.get('url')
+        if not url:
+            return
+        key = canonical_url(url)
+        visit = (key, item.get('lastVisitTime'))
+
+        with self._lock:
+            self.received += 1
+            if len(self.sample) < LOG_SAMPLE_SIZE:
+                self.sample.append(url)
+
+            repeat = visit in self.seen_visits
+            self.seen_visits.add(visit)
+
+            current = self.merged.get(key)
+            if current is None:
+                self.merged[key] = dict(item)
+                return
 
-        # Delete source blob
-        logging.info("Deleting source blob from 'pending/' folder...")
-        source_client.delete_blob()
+            if not repeat:
+                current['visitCount'] = (current.get('visitCount') or 0) + (item.get('visitCount') or 0)
+            if (item.get('lastVisitTime') or 0) > (current.get('lastVisitTime') or 0):
+                visit_count = current.get('visitCount')
+                current.update(item)
+                current['visitCount'] = visit_count
 
-        logging.info(f"Successfully moved blob to {dest_blob_name}")
+    def items(self):
+        # Newest first, like chrome.history.search
+        return sorted(self.merged.values(), key=lambda item: item.get('lastVisitTime') or 0, reverse=True)
+
+
+def merge_history_items(batches):
+    """Merge iterables of history items (see HistoryMerger)"""
+    merger = HistoryMerger()
+    for items in batches:
+        for item in items:
+            merger.add(item)
+    return merger.items()
+
+
+def compact_pending(blob_service_client, container_name, pending_blobs):
+    """
+    Stream all pending blobs (in parallel) straight into one merged batch
+
+    A blob that fails part-way is left out of the sources, so it stays
+    pending and is read again next run; the items it yielded before the
+    failure are still processed now (reprocessing a URL is harmless).
+
+    Returns:
+        (merged history items, names of the blobs that were read completely)
+    """
+    merger = HistoryMerger()
+
+    def consume(name):
+        try:
+            for item in iter_blob_items(blob_service_client, container_name, name):
+                merger.add(item)
+            return name
+        except Exception as e:
+            logging.error(f"Error reading blob {name}: {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=min(8, len(pending_blobs))) as pool:
+        sources = [name for name in pool.map(consume, pending_blobs) if name is not None]
+
+    merged = merger.items()
+    logging.info(f"Compacted {len(sources)} pending blob(s): {merger.received} item(s) → "
+                 f"{len(merged)} unique URL(s)")
+    if merger.sample:
+        more = f" (+{merger.received - len(merger.sample)} more)" if merger.received > len(merger.sample) else ""
+        logging.info(f"Sample URLs: {', '.join(merger.sample)}{more}")
+    return merged, sources
+
+
+def archive_batch(blob_service_client, container_name, history_data, sources, dest_folder="processed"):
+    """
+    Archive a work batch: one merged blob in `dest_folder`, then delete the
+    source blobs with batch requests (up to 256 deletes per round trip)
+    instead of a copy + delete per blob
+    """
+    container_client = blob_service_client.get_container_client(container_name)
+    timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
+    archive_name = f"{dest_folder}/batch_{timestamp}_{uuid.uuid4().hex[:12]}.ndjson.gz"
+
+    try:
+        lines = [json.dumps({"sources": sources}, separators=(',', ':'))]
+        lines += [json.dumps(item, ensure_ascii=False, separators=(',', ':')) for item in history_data]
+        container_client.upload_blob(
+            archive_name,
+            gzip.compress(("\n".join(lines) + "\n").encode('utf-8')),
+            content_settings=ContentSettings(content_type="application/x-ndjson"),
+        )
+        logging.info(f"Archived work batch to {archive_name}")
     except Exception as e:
-        logging.error(f"Error moving blob {source_blob_name}: {e}")
+        # Keep the originals: they are the only copy
+        logging.error(f"Error archiving work batch: {e}")
+        return
+
+    for start in range(0, len(sources), BATCH_DELETE_SIZE):
+        chunk = sources[start:start + BATCH_DELETE_SIZE]
+        try:
+            container_client.delete_blobs(*chunk)
+        except Exception as e:
+            logging.error(f"Error deleting {len(chunk)} archived blob(s): {e}")
+    logging.info(f"Removed {len(sources)} archived blob(s)")
 
 
 def update_user_preferences():
@@ -166,26 +456,18 @@ def update_user_preferences():
         logging.error(f"Error updating user preferences: {e}", exc_info=True)
 
 
-def main():
-    """Main processing function"""
-    logging.info("="*80)
-    logging.info("Starting cron processor")
-    logging.info(f"Time: {datetime.now()}")
-    logging.info("="*80)
-
-    # Get Azure Storage configuration
-    connection_string = os.environ.get("AZURE_STORAGE_CONNECTION_STRING")
-    container_name = os.environ.get("BLOB_CONTAINER_NAME", "history-products")
-
-    if not connection_string:
-        logging.error("AZURE_STORAGE_CONNECTION_STRING not found in environment variables")
-        return
+def run(blob_service_client, container_name):
+    """Process the pending blobs (caller holds the run lock)"""
+    # Imported only once the run lock is held: loads the scraping/model stack
+    from process_history import process_history, aprocess_history
 
-    # Create blob service client
-    blob_service_client = BlobServiceClient.from_connection_string(connection_string)
+    # Blobs a crashed run left half-done go back into the queue
+    recover_stale(blob_service_client, container_name)
 
-    # Get pending blobs
+    # Get pending blobs and claim them (pending → processing)
     pending_blobs = get_pending_blobs(blob_service_client, container_name)
+    if pending_blobs:
+        pending_blobs = claim_blobs(blob_service_client, container_name, pending_blobs)
 
     processed_any = False
 
@@ -194,27 +476,21 @@ def main():
     else:
         logging.info(f"Found {len(pending_blobs)} pending blob(s) to process")
 
-        # Process each blob
-        for idx, blob_name in enumerate(pending_blobs, 1):
-            logging.info("\n" + "="*80)
-            logging.info(f"Processing blob {idx}/{len(pending_blobs)}: {blob_name}")
-            logging.info("="*80)
-
-            # Download blob content
-            history_data = download_blob(blob_service_client, container_name, blob_name)
-
-            if not history_data:
-                logging.error(f"Failed to download blob {blob_name}, skipping")
-                continue
+        # Merge every pending blob into one deduplicated work batch
+        history_data, sources = compact_pending(blob_service_client, container_name, pending_blobs)
 
-            logging.info(f"Downloaded {len(history_data)} URL(s) from blob")
+        # Claimed but unreadable: back to pending for the next run
+        read = set(sources)
+        unread = [name for name in pending_blobs if name not in read]
+        if unread:
+            finish_blobs(blob_service_client, container_name, unread, STATE_PENDING)
 
-            # Log the URLs we're about to process
-            for i, item in enumerate(history_data, 1):
-                url = item.get('url', 'NO URL')
-                title = item.get('title', 'NO TITLE')
-                logging.info(f"[{i}] URL: {url}")
-                logging.info(f"     Title: {title}")
+        if not sources:
+            logging.error("Failed to download any pending blob, nothing to process")
+        else:
+            logging.info("\n" + "="*80)
+            logging.info(f"Processing work batch: {len(history_data)} URL(s) from {len(sources)} blob(s)")
+            logging.info("="*80)
 
             # Process the history data
             try:
@@ -226,7 +502,10 @@ def main():
                 sys.stdout = LoggerWriter(logging.getLogger(), logging.INFO)
 
                 try:
-                    result = process_history(history_data)
+                    if PIPELINE_ASYNC:
+                        result = asyncio.run(aprocess_history(history_data))
+                    else:
+                        result = process_history(history_data)
                 finally:
                     sys.stdout = old_stdout
 
@@ -242,14 +521,13 @@ def main():
                 else:
                     logging.warning("No products were uploaded to Azure AI Search")
 
-                # Move blob to processed folder
-                move_blob(blob_service_client, container_name, blob_name, "processed")
+                # One tag write per blob; --retention archives them later
+                finish_blobs(blob_service_client, container_name, sources, STATE_DONE)
 
             except Exception as e:
-                logging.error(f"Error processing blob {blob_name}: {e}", exc_info=True)
-                # Move to failed folder
-                logging.info("Moving failed blob to 'failed/' folder")
-                move_blob(blob_service_client, container_name, blob_name, "failed")
+                logging.error(f"Error processing work batch: {e}", exc_info=True)
+                logging.info(f"Marking the work batch's blobs as '{STATE_FAILED}'")
+                finish_blobs(blob_service_client, container_name, sources, STATE_FAILED)
 
     # Update user preferences if we processed any products
     if processed_any:
@@ -259,10 +537,62 @@ def main():
         logging.info("No new products, but updating preferences anyway")
         update_user_preferences()
 
+
+def main(wait=False, wait_timeout=None, lock_mode=RUN_LOCK, retention_days=None):
+    """Main processing function"""
+    logging.info("="*80)
+    logging.info("Starting cron processor")
+    logging.info(f"Time: {datetime.now()}")
+    logging.info("="*80)
+
+    # Get Azure Storage configuration
+    connection_string = os.environ.get("AZURE_STORAGE_CONNECTION_STRING")
+    container_name = os.environ.get("BLOB_CONTAINER_NAME", "history-products")
+
+    if not connection_string:
+        logging.error("AZURE_STORAGE_CONNECTION_STRING not found in environment variables")
+        return
+
+    # Create blob service client
+    blob_service_client = BlobServiceClient.from_connection_string(connection_string)
+
+    # One run at a time: overlapping cron invocations exit (or queue with --wait)
+    if lock_mode == "lease":
+        lock = BlobLease(blob_service_client.get_container_client(container_name))
+    else:
+        lock = FileLock()
+    try:
+        if wait:
+            logging.info(f"Waiting for the run lock ({lock_mode})...")
+        lock.acquire(wait=wait, timeout=wait_timeout)
+    except LockHeld as e:
+        logging.info(f"Another cron_processor run is in progress ({e}); exiting")
+        return
+
+    try:
+        if retention_days is not None:
+            apply_retention(blob_service_client, container_name, retention_days)
+        else:
+            run(blob_service_client, container_name)
+    finally:
+        lock.release()
+
     logging.info("\n" + "="*80)
     logging.info("Cron processor completed successfully")
     logging.info("="*80)
 
-
 if __name__ == "__main__":
-    main()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Process pending history blobs")
+    parser.add_argument("--wait", action="store_true",
+                        help="Wait for a running invocation to finish instead of exiting")
+    parser.add_argument("--wait-timeout", type=float,
+                        help="Give up waiting after this many seconds (default: wait indefinitely)")
+    parser.add_argument("--lock", choices=["file", "lease"], default=RUN_LOCK,
+                        help=f"Run lock: local flock or blob lease across machines (default: {RUN_LOCK})")
+    parser.add_argument("--retention", nargs="?", type=int, const=RETENTION_DAYS, metavar="DAYS",
+                        help=f"Only archive done/failed blobs older than DAYS (default: {RETENTION_DAYS}) and exit")
+
+    args = parser.parse_args()
+    main(args.wait, args.wait_timeout, args.lock, args.retention)
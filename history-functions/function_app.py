@@ -1,23 +1,153 @@
 import azure.functions as func
+import asyncio
+import gzip
 import logging
 import json
 import os
+import uuid
 from datetime import datetime
-from azure.storage.blob import BlobServiceClient
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceExistsError, ResourceModifiedError, ResourceNotFoundError
+from azure.storage.blob import ContentSettings
+from azure.storage.blob.aio import BlobServiceClient
+
+from seen_filter import SeenWindows, from_bytes, item_key, oldest_window, to_bytes
 
 app = func.FunctionApp()
 
+CONTAINER_NAME = os.environ.get("BLOB_CONTAINER_NAME", "history-products")
+# One blob per seen-items window: state/seen/<window>.bin (see seen_filter)
+SEEN_PREFIX = "state/seen/"
+SEEN_SAVE_ATTEMPTS = 3
+
+# Created on the worker's first invocation and reused by every later one
+_blob_service_client = None
+_container_client = None
+_seen = None
+_seen_etags = {}
+_startup_lock = asyncio.Lock()
+
+
+def _seen_blob(window):
+    return f"{SEEN_PREFIX}{window}.bin"
+
+
+async def _load_seen_window(container_client, window):
+    """Download one window → (hashes, etag); empty if not stored yet"""
+    try:
+        downloader = await container_client.download_blob(_seen_blob(window))
+        return from_bytes(await downloader.readall()), downloader.properties.etag
+    except ResourceNotFoundError:
+        return set(), None
+
+
+async def _load_seen(container_client):
+    """Kept windows from storage → (SeenWindows, {window: etag})"""
+    seen = SeenWindows()
+    etags = {}
+    oldest = oldest_window()
+    async for blob in container_client.list_blobs(name_starts_with=SEEN_PREFIX):
+        try:
+            window = int(blob.name[len(SEEN_PREFIX):].split(".")[0])
+        except ValueError:
+            continue
+        if window < oldest:
+            continue
+        hashes, etag = await _load_seen_window(container_client, window)
+        seen.merge(window, hashes)
+        etags[window] = etag
+    return seen, etags
+
+
+async def get_container():
+    """Warm container client (container created once, at worker startup)"""
+    global _blob_service_client, _container_client, _seen, _seen_etags
+    if _container_client is not None:
+        return _container_client
+
+    async with _startup_lock:
+        if _container_client is None:
+            connection_string = os.environ.get("AZURE_STORAGE_CONNECTION_STRING")
+            if not connection_string:
+                raise RuntimeError("AZURE_STORAGE_CONNECTION_STRING not found")
+
+            _blob_service_client = BlobServiceClient.from_connection_string(connection_string)
+            container_client = _blob_service_client.get_container_client(CONTAINER_NAME)
+            try:
+                await container_client.create_container()
+                logging.info(f"Created container: {CONTAINER_NAME}")
+            except ResourceExistsError:
+                pass
+
+            _seen, _seen_etags = await _load_seen(container_client)
+            _container_client = container_client
+    return _container_client
+
+
+async def _save_seen_window(container_client, window):
+    """
+    Persist one window with optimistic concurrency
+
+    Another instance may have saved in between: on an ETag mismatch the
+    remote window is merged in (set union) and the save retried.
+    """
+    blob_client = container_client.get_blob_client(_seen_blob(window))
+    for _ in range(SEEN_SAVE_ATTEMPTS):
+        data = to_bytes(_seen.windows.get(window, ()))
+        etag = _seen_etags.get(window)
+        try:
+            if etag is None:
+                result = await blob_client.upload_blob(data, overwrite=False)
+            else:
+                result = await blob_client.upload_blob(
+                    data,
+                    overwrite=True,
+                    etag=etag,
+                    match_condition=MatchConditions.IfNotModified,
+                )
+            _seen_etags[window] = result["etag"]
+            return True
+        except (ResourceModifiedError, ResourceExistsError):
+            remote, _seen_etags[window] = await _load_seen_window(container_client, window)
+            _seen.merge(window, remote)
+    return False
+
+
+async def save_seen(container_client, windows):
+    """Persist the windows new items were added to, and delete expired ones"""
+    saved = await asyncio.gather(*(_save_seen_window(container_client, window) for window in windows))
+
+    for window in _seen.expire():
+        _seen_etags.pop(window, None)
+        try:
+            await container_client.delete_blob(_seen_blob(window))
+        except ResourceNotFoundError:
+            pass
+    return all(saved)
+
+
+def parse_body(req: func.HttpRequest):
+    """JSON body, gzip-decoded when sent with Content-Encoding: gzip"""
+    body = req.get_body()
+    if req.headers.get("Content-Encoding", "").lower() == "gzip" or body[:2] == b"\x1f\x8b":
+        body = gzip.decompress(body)
+    return json.loads(body)
+
+
+def to_ndjson_gz(items):
+    lines = "".join(json.dumps(item, ensure_ascii=False, separators=(",", ":")) + "\n" for item in items)
+    return gzip.compress(lines.encode("utf-8"))
+
+
 @app.route(
     route="ingestHistory",
     auth_level=func.AuthLevel.ANONYMOUS,
     methods=["POST"]
 )
-def ingestHistory(req: func.HttpRequest) -> func.HttpResponse:
-    logging.info("ingestHistory function triggered")
-
+async def ingestHistory(req: func.HttpRequest) -> func.HttpResponse:
     try:
-        data = req.get_json()
-    except ValueError:
+        data = parse_body(req)
+    except (ValueError, OSError, EOFError):
         logging.exception("Failed to parse JSON body")
         return func.HttpResponse("Invalid JSON", status_code=400)
 
@@ -28,57 +158,59 @@ def ingestHistory(req: func.HttpRequest) -> func.HttpResponse:
             status_code=400
         )
 
-    logging.info("Received %d history items", len(data))
-
-    for i, item in enumerate(data, start=1):
-        url = item.get("url", "")
-        title = item.get("title", "")
-        logging.info(f"[{i}] URL: {url}")
-        logging.info(f"[{i}] Title: {title}")
-
     try:
-        connection_string = os.environ.get("AZURE_STORAGE_CONNECTION_STRING")
-        container_name = os.environ.get("BLOB_CONTAINER_NAME", "history-products")
-
-        if not connection_string:
-            logging.error("AZURE_STORAGE_CONNECTION_STRING not found")
-            return func.HttpResponse(
-                json.dumps({"status": "error", "message": "Storage not configured"}),
-                status_code=500,
-                mimetype="application/json"
+        container_client = await get_container()
+
+        # Drop visits already accepted by an earlier (overlapping) post
+        new_items = []
+        new_keys = set()
+        batch = SeenWindows()
+        for item in data:
+            if not isinstance(item, dict) or not item.get("url"):
+                continue
+            key = item_key(item)
+            if key in new_keys or _seen.is_seen(item):
+                continue
+            new_keys.add(key)
+            batch.add(item)
+            new_items.append(item)
+        duplicates = len(data) - len(new_items)
+
+        logging.info("ingestHistory: received %d items, %d new, %d already seen",
+                     len(data), len(new_items), duplicates)
+
+        blob_name = None
+        if new_items:
+            # Second resolution + random suffix: concurrent posts never collide
+            timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
+            blob_name = f"history/history_{timestamp}_{uuid.uuid4().hex[:12]}.ndjson.gz"
+
+            # Queue state is an index tag (cron_processor: pending → processing → done / failed)
+            await container_client.upload_blob(
+                blob_name,
+                to_ndjson_gz(new_items),
+                overwrite=False,
+                content_settings=ContentSettings(content_type="application/x-ndjson"),
+                tags={"state": "pending", "state_at": datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")},
             )
+            logging.info(f"Saved {len(new_items)} URLs to blob: {blob_name}")
 
-        blob_service_client = BlobServiceClient.from_connection_string(connection_string)
-        container_client = blob_service_client.get_container_client(container_name)
-
-        try:
-            container_client.create_container()
-            logging.info(f"Created container: {container_name}")
-        except Exception:
-            pass 
-
-        timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
-        blob_name = f"pending/history_{timestamp}.json"
-
-        blob_client = blob_service_client.get_blob_client(
-            container=container_name,
-            blob=blob_name
-        )
-
-        json_data = json.dumps(data, indent=2, ensure_ascii=False)
-        blob_client.upload_blob(json_data, overwrite=True)
-
-        logging.info(f"Saved {len(data)} URLs to blob: {blob_name}")
+            # Only marked as seen once stored, so a failed upload can be re-sent
+            for window, hashes in batch.windows.items():
+                _seen.merge(window, hashes)
+            if not await save_seen(container_client, batch.windows):
+                logging.warning("Could not persist the seen-items windows (concurrent updates)")
 
         response_data = {
             "status": "success",
-            "message": f"Saved {len(data)} history items for processing",
+            "message": f"Saved {len(new_items)} history items for processing",
             "blob_name": blob_name,
-            "count": len(data)
+            "count": len(new_items),
+            "duplicates": duplicates
         }
 
         return func.HttpResponse(
-            json.dumps(response_data, indent=2),
+            json.dumps(response_data),
             status_code=200,
             mimetype="application/json"
         )
@@ -0,0 +1,209 @@
+"""
+Run coordination for cron_processor
+
+cron starts the processor every minute while one run can take much
+longer; overlapping runs would process the same pending blobs and each
+load the models. Two ways to keep it to one run at a time:
+
+- FileLock: flock on a local lock file (one machine). Released by the
+  kernel if the process dies, so a crash never leaves a stale lock.
+- BlobLease: a renewable lease on a blob in the container, for workers on
+  several machines. A background thread renews it; if the holder dies the
+  lease expires after LEASE_DURATION seconds.
+
+Both record who holds the lock (pid, host, start time), so a run that is
+turned away can say how long the current holder has been running.
+"""
+
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timezone
+
+
+LOCK_FILE = os.environ.get(
+    "CRON_LOCK_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs", "cron_processor.lock")
+)
+LEASE_BLOB = "state/cron_processor.lock"
+LEASE_DURATION = 60  # seconds; renewed every LEASE_DURATION / 3
+WAIT_POLL_SECONDS = 5
+
+
+class LockHeld(Exception):
+    """Another run holds the lock"""
+
+    def __init__(self, holder):
+        self.holder = holder or {}
+        super().__init__(describe_holder(self.holder))
+
+
+def _holder_info():
+    return {
+        "pid": os.getpid(),
+        "host": socket.gethostname(),
+        "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+
+
+def _poll_interval(deadline):
+    if deadline is None:
+        return WAIT_POLL_SECONDS
+    return max(0.0, min(WAIT_POLL_SECONDS, deadline - time.monotonic()))
+
+
+def describe_holder(holder):
+    """'pid 123 on host, running for 4m12s' from recorded holder info"""
+    if not holder:
+        return "held by an unknown process"
+    running = ""
+    try:
+        started = datetime.fromisoformat(holder["started_at"])
+        seconds = int((datetime.now(timezone.utc) - started).total_seconds())
+        running = f", running for {seconds // 3600}h{seconds % 3600 // 60:02d}m{seconds % 60:02d}s"
+    except (KeyError, TypeError, ValueError):
+        pass
+    return f"held by pid {holder.get('pid', '?')} on {holder.get('host', '?')}{running}"
+
+
+class FileLock:
+    """Exclusive flock on LOCK_FILE; holder info is written into the file"""
+
+    def __init__(self, path=LOCK_FILE):
+        self.path = path
+        self._fd = None
+
+    def read_holder(self):
+        try:
+            with open(self.path) as f:
+                return json.loads(f.read() or "{}")
+        except (OSError, ValueError):
+            return {}
+
+    def acquire(self, wait=False, timeout=None):
+        """
+        Take the lock; raises LockHeld if it is taken (after `timeout`
+        seconds in wait mode, or immediately otherwise)
+        """
+        import fcntl
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                if not wait or (deadline is not None and time.monotonic() >= deadline):
+                    os.close(fd)
+                    raise LockHeld(self.read_holder())
+                time.sleep(_poll_interval(deadline))
+
+        os.ftruncate(fd, 0)
+        os.write(fd, json.dumps(_holder_info()).encode("utf-8"))
+        os.fsync(fd)
+        self._fd = fd
+        return self
+
+    def release(self):
+        if self._fd is None:
+            return
+        import fcntl
+
+        os.ftruncate(self._fd, 0)
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        os.close(self._fd)
+        self._fd = None
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class BlobLease:
+    """Renewable lease on LEASE_BLOB; holder info is kept in its metadata"""
+
+    def __init__(self, container_client, blob_name=LEASE_BLOB, duration=LEASE_DURATION):
+        self.blob_client = container_client.get_blob_client(blob_name)
+        self.duration = duration
+        self.lease = None
+        self.lost = threading.Event()
+        self._stop = threading.Event()
+        self._renewer = None
+
+    def read_holder(self):
+        try:
+            return dict(self.blob_client.get_blob_properties().metadata or {})
+        except Exception:
+            return {}
+
+    def _try_acquire(self):
+        from azure.core.exceptions import HttpResponseError, ResourceExistsError, ResourceNotFoundError
+
+        try:
+            return self.blob_client.acquire_lease(lease_duration=self.duration)
+        except ResourceNotFoundError:
+            try:
+                self.blob_client.upload_blob(b"", overwrite=False)
+            except ResourceExistsError:
+                pass
+            return self.blob_client.acquire_lease(lease_duration=self.duration)
+        except (ResourceExistsError, HttpResponseError) as e:
+            # 409 LeaseAlreadyPresent
+            if getattr(e, "status_code", None) == 409:
+                return None
+            raise
+
+    def acquire(self, wait=False, timeout=None):
+        """Take the lease; raises LockHeld if another worker holds it"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            lease = self._try_acquire()
+            if lease is not None:
+                break
+            if not wait or (deadline is not None and time.monotonic() >= deadline):
+                raise LockHeld(self.read_holder())
+            time.sleep(_poll_interval(deadline))
+
+        self.lease = lease
+        self.blob_client.set_blob_metadata(
+            {k: str(v) for k, v in _holder_info().items()}, lease=lease
+        )
+        self._renewer = threading.Thread(target=self._renew_loop, daemon=True)
+        self._renewer.start()
+        return self
+
+    def _renew_loop(self):
+        while not self._stop.wait(self.duration / 3):
+            try:
+                self.lease.renew()
+            except Exception as e:
+                # Another worker may take over once the lease expires
+                logging.error(f"Lost run lease {LEASE_BLOB}: {e}")
+                self.lost.set()
+                return
+
+    def release(self):
+        if self.lease is None:
+            return
+        self._stop.set()
+        if self._renewer is not None:
+            self._renewer.join(timeout=5)
+        try:
+            self.blob_client.set_blob_metadata({}, lease=self.lease)
+            self.lease.release()
+        except Exception:
+            pass
+        self.lease = None
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *exc):
+        self.release()
@@ -0,0 +1,96 @@
+"""
+History items recently accepted by ingestHistory, per time window
+
+The extension posts the last hour of history every hour (plus manual
+sends), so consecutive posts overlap. Items are keyed by
+(url, lastVisitTime): the same visit posted twice is dropped, a real
+revisit (new lastVisitTime) still goes through.
+
+Only overlapping posts need deduping, so keys are kept per WINDOW_SECONDS
+window of their visit time, for the last KEEP_WINDOWS windows; older
+windows expire. A visit older than that is always accepted (the rare late
+duplicate is merged by cron_processor). Each window is an exact set of
+64-bit key hashes, stored as its own small blob: a post rewrites only the
+windows it added to, and two copies of a window merge by set union.
+"""
+
+import hashlib
+import time
+
+
+WINDOW_SECONDS = 3600
+# Current window + the two before it: the hourly post's overlap plus late / manual sends
+KEEP_WINDOWS = 3
+
+
+def item_key(item):
+    """Dedupe key of one history item"""
+    url = (item.get("url") or "").strip()
+    last_visit = item.get("lastVisitTime")
+    if isinstance(last_visit, (int, float)):
+        last_visit = int(last_visit)
+    return f"{url}\x00{last_visit}"
+
+
+def key_hash(key):
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def current_window(now=None):
+    return int((time.time() if now is None else now) // WINDOW_SECONDS)
+
+
+def window_of(item, now=None):
+    """Window of the item's visit (extension times are epoch ms); arrival time without one"""
+    last_visit = item.get("lastVisitTime")
+    if isinstance(last_visit, (int, float)):
+        return int(last_visit // 1000 // WINDOW_SECONDS)
+    return current_window(now)
+
+
+def oldest_window(now=None):
+    return current_window(now) - KEEP_WINDOWS + 1
+
+
+def to_bytes(hashes):
+    return b"".join(h.to_bytes(8, "little") for h in sorted(hashes))
+
+
+def from_bytes(data):
+    return {int.from_bytes(data[i:i + 8], "little") for i in range(0, len(data) - len(data) % 8, 8)}
+
+
+class SeenWindows:
+    """{window: set of key hashes} for the windows still kept"""
+
+    def __init__(self):
+        self.windows = {}
+
+    def _entry(self, item, now=None):
+        """(window, hash) of an item, or None when its window has expired"""
+        window = window_of(item, now)
+        if window < oldest_window(now):
+            return None
+        return window, key_hash(item_key(item))
+
+    def is_seen(self, item, now=None):
+        entry = self._entry(item, now)
+        return entry is not None and entry[1] in self.windows.get(entry[0], ())
+
+    def add(self, item, now=None):
+        """Record an accepted item → its window, or None if too old to track"""
+        entry = self._entry(item, now)
+        if entry is None:
+            return None
+        self.windows.setdefault(entry[0], set()).add(entry[1])
+        return entry[0]
+
+    def merge(self, window, hashes):
+        self.windows.setdefault(window, set()).update(hashes)
+
+    def expire(self, now=None):
+        """Drop windows that fell out of the kept range → their ids"""
+        expired = [window for window in self.windows if window < oldest_window(now)]
+        for window in expired:
+            del self.windows[window]
+        return expired
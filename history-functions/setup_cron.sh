@@ -5,12 +5,15 @@ PROCESSOR_SCRIPT="$SCRIPT_DIR/cron_processor.py"
 PYTHON_PATH=$(which python3)
 
 CRON_ENTRY="* * * * * PATH=/opt/homebrew/bin:/usr/local/bin:/usr/bin:/bin && cd $SCRIPT_DIR && $PYTHON_PATH $PROCESSOR_SCRIPT >> $SCRIPT_DIR/logs/cron.log 2>&1"
+# Daily bulk retention: archive done / failed blobs (waits up to an hour for a running processor)
+RETENTION_ENTRY="30 3 * * * PATH=/opt/homebrew/bin:/usr/local/bin:/usr/bin:/bin && cd $SCRIPT_DIR && $PYTHON_PATH $PROCESSOR_SCRIPT --retention --wait --wait-timeout 3600 >> $SCRIPT_DIR/logs/cron.log 2>&1"
 
 echo "Setting up cron job for history processor"
 echo "=================================="
 echo "Script location: $PROCESSOR_SCRIPT"
 echo "Python path: $PYTHON_PATH"
 echo "Cron entry: $CRON_ENTRY"
+echo "Retention entry: $RETENTION_ENTRY"
 echo "=================================="
 echo ""
 
@@ -29,19 +32,20 @@ echo ""
     crontab -l 2>/dev/null | grep -vF "$PROCESSOR_SCRIPT" | crontab -
 }
 
-(crontab -l 2>/dev/null; echo "$CRON_ENTRY") | crontab -
+(crontab -l 2>/dev/null; echo "$CRON_ENTRY"; echo "$RETENTION_ENTRY") | crontab -
 
-echo "✅ Cron job installed successfully!"
+echo "✅ Cron jobs installed successfully!"
 echo ""
-echo "The processor will run every hour at minute 0"
+echo "The processor will run every minute"
+echo "Retention (--retention) will run daily at 03:30"
 echo "Logs will be saved to: $SCRIPT_DIR/logs/"
 echo ""
 echo "To view your cron jobs:"
 echo "  crontab -l"
 echo ""
-echo "To remove the cron job:"
+echo "To remove the cron jobs:"
 echo "  crontab -e"
-echo "  (then delete the line containing 'cron_processor.py')"
+echo "  (then delete the lines containing 'cron_processor.py')"
 echo ""
 echo "To test the processor manually:"
 echo "  cd $SCRIPT_DIR"
@@ -10,69 +10,87 @@ from pathlib import Path
 # Add Tools directory to path
 sys.path.insert(0, str(Path(__file__).parent / 'Tools'))
 
+from Tools.jsonl_results import ResultWriter, done_urls, finalize
 from Tools.robust_scraper import robust_scrape
 
 
-def process_history(history_file='history.json', output_file='scraped_data.json'):
-    """Process all URLs from history and extract data"""
+def process_history(history_file='history.json', output_file='scraped_data.jsonl', limit=None, retry_failed=False):
+    """
+    Process all URLs from history and extract data
+
+    Results are appended to `output_file` (JSONL, one result per line); URLs
+    already recorded there are skipped, so an interrupted run resumes.
+    `limit` caps the number of URLs processed in this run.
+    """
 
     # Load history
     with open(history_file, 'r') as f:
         history = json.load(f)
 
-    print(f"Found {len(history)} URLs in history\n")
-
-    results = []
-
-    for idx, item in enumerate(history, 1):
-        url = item.get('url')
-        title = item.get('title', 'No title')
-
-        print(f"\n{'='*100}")
-        print(f"[{idx}/{len(history)}] Processing: {title}")
-        print(f"URL: {url}")
-        print('='*100)
-
-        try:
-            main_image, all_images, text_data = robust_scrape(url)
-
-            result = {
-                'url': url,
-                'original_title': title,
-                'lastVisitTime': item.get('lastVisitTime'),
-                'visitCount': item.get('visitCount'),
-                'scraped_data': {
-                    'representative_image': main_image,
-                    'image_count': len(all_images) if all_images else 0,
-                    'text': text_data
-                },
-                'success': True
-            }
-
-            results.append(result)
-
-            print(f"\n✓ Successfully scraped")
-            print(f"  - Image: {main_image[:100] if main_image else 'None'}...")
-            print(f"  - Title: {text_data.get('title', 'N/A') if text_data else 'N/A'}")
-
-        except Exception as e:
-            print(f"\n✗ Failed: {e}")
-            results.append({
-                'url': url,
-                'original_title': title,
-                'success': False,
-                'error': str(e)
-            })
-
-        # Save after each URL (in case of crashes)
-        with open(output_file, 'w') as f:
-            json.dump(results, f, indent=2)
+    done = done_urls(output_file, retry_failed)
+    todo = [item for item in history if item.get('url') not in done]
+    skipped = len(history) - len(todo)
+    if limit is not None:
+        todo = todo[:limit]
+
+    print(f"Found {len(history)} URLs in history ({skipped} already in {output_file}), "
+          f"processing {len(todo)}\n")
+
+    stats = {'processed': 0, 'success': 0, 'failed': 0}
+    writer = ResultWriter(output_file)
+
+    try:
+        for idx, item in enumerate(todo, 1):
+            url = item.get('url')
+            title = item.get('title', 'No title')
+
+            print(f"\n{'='*100}")
+            print(f"[{idx}/{len(todo)}] Processing: {title}")
+            print(f"URL: {url}")
+            print('='*100)
+
+            try:
+                main_image, all_images, text_data = robust_scrape(url)
+
+                result = {
+                    'url': url,
+                    'original_title': title,
+                    'lastVisitTime': item.get('lastVisitTime'),
+                    'visitCount': item.get('visitCount'),
+                    'scraped_data': {
+                        'representative_image': main_image,
+                        'image_count': len(all_images) if all_images else 0,
+                        'text': text_data
+                    },
+                    'success': True
+                }
+
+                writer.write(result)
+                stats['success'] += 1
+
+                print(f"\n✓ Successfully scraped")
+                print(f"  - Image: {main_image[:100] if main_image else 'None'}...")
+                print(f"  - Title: {text_data.get('title', 'N/A') if text_data else 'N/A'}")
+
+            except Exception as e:
+                print(f"\n✗ Failed: {e}")
+                writer.write({
+                    'url': url,
+                    'original_title': title,
+                    'success': False,
+                    'error': str(e)
+                })
+                stats['failed'] += 1
+
+            stats['processed'] += 1
+    finally:
+        writer.close()
 
     print(f"\n\n{'='*100}")
     print(f"✓ Completed! Results saved to: {output_file}")
-    print(f"  - Total processed: {len(results)}")
-    print(f"  - Successful: {sum(1 for r in results if r.get('success'))}")
-    print(f"  - Failed: {sum(1 for r in results if not r.get('success'))}")
+    print(f"  - Total processed: {stats['processed']}")
+    print(f"  - Successful: {stats['success']}")
+    print(f"  - Failed: {stats['failed']}")
     print('='*100)
 
 
@@ -81,9 +99,16 @@ if __name__ == "__main__":
 
     parser = argparse.ArgumentParser(description='Process browser history URLs')
     parser.add_argument('--input', default='history.json', help='Input history JSON file')
-    parser.add_argument('--output', default='scraped_data.json', help='Output file for scraped data')
+    parser.add_argument('--output', default='scraped_data.jsonl', help='Output JSONL file for scraped data (appended, resumable)')
     parser.add_argument('--limit', type=int, help='Limit number of URLs to process')
+    parser.add_argument('--retry-failed', action='store_true', help='Re-process URLs whose earlier attempt failed')
+    parser.add_argument('--finalize', nargs='?', const='', metavar='JSON_FILE',
+                        help='Only convert the JSONL output to a JSON array (default: output path with .json)')
 
     args = parser.parse_args()
 
-    process_history(args.input, args.output)
+    if args.finalize is not None:
+        json_path = finalize(args.output, args.finalize or None)
+        print(f"✓ Wrote {json_path}")
+    else:
+        process_history(args.input, args.output, args.limit, args.retry_failed)
@@ -0,0 +1,27 @@
+"""
+Shared test setup
+
+Puts Tools/ and history-functions/ on sys.path (the scripts import each
+other by module name) and points every local store at a throwaway
+directory, so tests never read or write ~/.history_memory.
+"""
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+
+ROOT = Path(__file__).resolve().parent.parent
+for path in (ROOT / "Tools", ROOT / "history-functions"):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
+
+_store_dir = Path(tempfile.mkdtemp(prefix="history_memory_tests_"))
+os.environ["LLM_CACHE_PATH"] = str(_store_dir / "llm_cache.db")
+os.environ["FINGERPRINT_STORE_PATH"] = str(_store_dir / "fingerprints.db")
+os.environ["HTTP_CACHE_DIR"] = str(_store_dir / "http_cache")
+os.environ["HTTP_COOKIE_DIR"] = str(_store_dir / "cookies")
+os.environ["PRICE_HISTORY_DIR"] = str(_store_dir / "price_history")
+os.environ["CPU_POOL_SIZE"] = "0"
+os.environ.setdefault("OPENAI_API_KEY", "test")
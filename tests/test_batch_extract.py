@@ -0,0 +1,493 @@
+"""
+batch_extract against a local stand-in for the OpenAI files / batches API
+
+FakeBatchAPI is a small HTTP server speaking the endpoints batch_extract
+uses (file upload, batch create / retrieve, file content). Each batch walks
+through a scripted list of statuses, one per retrieve, and on reaching a
+terminal status writes output / error files from its input requests.
+"""
+
+import itertools
+import json
+import sys
+import threading
+import time
+from email.parser import BytesParser
+from email.policy import default as default_policy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("openai")
+from openai import OpenAI
+
+import batch_extract
+import llm_cache
+from batch_extract import BatchRun, custom_id_for
+from scraping_pipeline import smart_cache_key
+
+
+def product_for(custom_id):
+    """Extraction returned by the fake model for one request"""
+    return {"is_product": "Yes", "product_name": f"product {custom_id}", "price": "$10"}
+
+
+class FakeBatchAPI:
+    """In-process files + batches endpoints (see module docstring)"""
+
+    def __init__(self):
+        self.files = {}
+        self.batches = {}
+        self.uploads = []
+        self.retrieves = 0
+        # Statuses returned by successive retrieves of a new batch (last one sticks)
+        self.script = ["in_progress", "completed"]
+        # custom_ids that finished before an "expired" batch ran out of time
+        self.finished_before_expiry = set()
+        # (custom_id, body) → extraction dict, or None for a failed request
+        self.respond = lambda custom_id, body: product_for(custom_id)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, payload, content_type="application/json"):
+                data = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _body(self):
+                return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+            def do_POST(self):
+                with api._lock:
+                    if self.path == "/v1/files":
+                        self._send(200, api.create_file(self.headers["Content-Type"], self._body()))
+                    elif self.path == "/v1/batches":
+                        self._send(200, api.create_batch(json.loads(self._body())))
+                    else:
+                        self._send(404, {"error": {"message": f"no route {self.path}"}})
+
+            def do_GET(self):
+                with api._lock:
+                    parts = self.path.strip("/").split("/")
+                    if parts[:2] == ["v1", "batches"] and len(parts) == 3 and parts[2] in api.batches:
+                        self._send(200, api.retrieve_batch(parts[2]))
+                    elif parts[:2] == ["v1", "files"] and len(parts) == 4 and parts[2] in api.files:
+                        self._send(200, api.files[parts[2]], "application/octet-stream")
+                    else:
+                        self._send(404, {"error": {"message": f"no route {self.path}"}})
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _add_file(self, data):
+        file_id = f"file-{next(self._ids)}"
+        self.files[file_id] = data
+        return file_id
+
+    def create_file(self, content_type, body):
+        message = BytesParser(policy=default_policy).parsebytes(
+            f"Content-Type: {content_type}\r\n\r\n".encode() + body
+        )
+        data = next(part.get_payload(decode=True) for part in message.iter_parts() if part.get_filename())
+        file_id = self._add_file(data)
+        self.uploads.append([json.loads(line) for line in data.decode().splitlines() if line.strip()])
+        return {"id": file_id, "object": "file", "bytes": len(data), "created_at": int(time.time()),
+                "filename": "batch_input.jsonl", "purpose": "batch", "status": "processed"}
+
+    def create_batch(self, params):
+        batch_id = f"batch_{next(self._ids)}"
+        requests = [json.loads(line) for line in self.files[params["input_file_id"]].decode().splitlines() if line]
+        self.batches[batch_id] = {
+            "id": batch_id,
+            "object": "batch",
+            "endpoint": params["endpoint"],
+            "input_file_id": params["input_file_id"],
+            "completion_window": params["completion_window"],
+            "status": "validating",
+            "created_at": int(time.time()),
+            "output_file_id": None,
+            "error_file_id": None,
+            "request_counts": {"total": len(requests), "completed": 0, "failed": 0},
+            "_requests": requests,
+            "_steps": list(self.script),
+        }
+        return self._public(self.batches[batch_id])
+
+    def retrieve_batch(self, batch_id):
+        self.retrieves += 1
+        batch = self.batches[batch_id]
+        steps = batch["_steps"]
+        status = steps.pop(0) if len(steps) > 1 else steps[0]
+        if batch["status"] != status:
+            batch["status"] = status
+            if status in ("completed", "expired", "failed"):
+                self._finish(batch)
+        return self._public(batch)
+
+    def _finish(self, batch):
+        if batch["status"] == "failed":
+            batch["errors"] = {"object": "list", "data": [{"code": "invalid_request", "message": "bad input"}]}
+            return
+
+        output, errors = [], []
+        for request in batch["_requests"]:
+            custom_id = request["custom_id"]
+            if batch["status"] == "expired" and custom_id not in self.finished_before_expiry:
+                errors.append({"id": f"req_{custom_id}", "custom_id": custom_id, "response": None,
+                               "error": {"code": "batch_expired", "message": "not completed in time"}})
+                continue
+            product = self.respond(custom_id, request["body"])
+            if product is None:
+                errors.append({"id": f"req_{custom_id}", "custom_id": custom_id, "error": None, "response": {
+                    "status_code": 400, "body": {"error": {"message": "invalid request"}}}})
+                continue
+            output.append({"id": f"req_{custom_id}", "custom_id": custom_id, "error": None, "response": {
+                "status_code": 200,
+                "body": {
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": json.dumps(product)}}],
+                    "usage": {"prompt_tokens": 100, "completion_tokens": 20, "total_tokens": 120},
+                },
+            }})
+
+        def jsonl(lines):
+            return "".join(json.dumps(line) + "\n" for line in lines).encode()
+
+        batch["output_file_id"] = self._add_file(jsonl(output)) if output else None
+        batch["error_file_id"] = self._add_file(jsonl(errors)) if errors else None
+        batch["request_counts"] = {"total": len(batch["_requests"]), "completed": len(output), "failed": len(errors)}
+
+    @staticmethod
+    def _public(batch):
+        return {k: v for k, v in batch.items() if not k.startswith("_")}
+
+
+@pytest.fixture(scope="module")
+def fake_server():
+    server = FakeBatchAPI().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def api(fake_server, monkeypatch):
+    """Fresh script for each test, and batch_extract's client pointed at the stand-in"""
+    fake_server.script = ["in_progress", "completed"]
+    fake_server.finished_before_expiry = set()
+    fake_server.respond = lambda custom_id, body: product_for(custom_id)
+    fake_server.uploads.clear()
+    fake_server.retrieves = 0
+    monkeypatch.setenv("OPENAI_BASE_URL", fake_server.base_url)
+    monkeypatch.setattr(batch_extract, "client", OpenAI(max_retries=0))
+    return fake_server
+
+
+_unique = itertools.count()
+
+
+def make_prepared(name, previous_product=None):
+    """prepare_extraction-shaped entry for a page titled `name` (unique per call)"""
+    title = f"{name} {next(_unique)} {time.time_ns()}"
+    url = f"https://shop.example/{title.replace(' ', '-')}"
+    prepared = {
+        "url": url,
+        "last_visit_time": 1700000000000,
+        "main_image": None,
+        "text_data": {"title": title, "price": "$10", "main_content": f"{title} description"},
+        "ocr_text": "",
+        "ocr_decision": {"ran": False},
+        "fingerprint": None,
+        "content_fingerprint": None,
+        "content_change": "unchanged" if previous_product else "new",
+        "previous_product": previous_product,
+    }
+    return {"custom_id": custom_id_for(url), "prepared": prepared}
+
+
+def new_run(tmp_path, entries):
+    run = BatchRun(tmp_path / "work")
+    for entry in entries:
+        run.add_prepared(entry)
+    return run
+
+
+def history_of(entries):
+    return [{"url": entry["prepared"]["url"]} for entry in entries if "prepared" in entry]
+
+
+@pytest.fixture
+def no_scraping(monkeypatch):
+    """Resumed runs must not scrape again"""
+    def fail(url, **kwargs):
+        raise AssertionError(f"re-scraped {url}")
+    monkeypatch.setattr(batch_extract, "prepare_extraction", fail)
+
+
+# -- submit ----------------------------------------------------------------
+
+def test_submit_uploads_only_pending_prompts(api, tmp_path):
+    pending = [make_prepared("Sneaker"), make_prepared("Boot")]
+    reused = make_prepared("Sandal", previous_product={"is_product": "Yes", "product_name": "Sandal"})
+    cached = make_prepared("Loafer")
+    llm_cache.put(smart_cache_key(cached["prepared"]["ocr_text"], cached["prepared"]["text_data"]),
+                  {"is_product": "Yes", "product_name": "Loafer"})
+    failed = {"custom_id": custom_id_for("https://shop.example/broken"), "url": "https://shop.example/broken",
+              "error": "timeout"}
+
+    run = new_run(tmp_path, pending + [reused, cached, failed])
+    batch_extract.submit_batches(run)
+
+    assert len(api.uploads) == 1
+    uploaded = api.uploads[0]
+    assert [request["custom_id"] for request in uploaded] == [entry["custom_id"] for entry in pending]
+    assert all(request["url"] == batch_extract.BATCH_ENDPOINT for request in uploaded)
+    assert all(request["body"]["model"] == batch_extract.LLM_MODEL for request in uploaded)
+
+    state = BatchRun(run.dir).state
+    assert state["phase"] == "submitted"
+    assert len(state["batches"]) == 1
+    assert state["batches"][0]["batch_id"] in api.batches
+    assert state["batches"][0]["downloaded"] is False
+
+
+def test_submit_splits_into_batches_of_max_requests(api, tmp_path, monkeypatch):
+    monkeypatch.setattr(batch_extract, "BATCH_MAX_REQUESTS", 2)
+    run = new_run(tmp_path, [make_prepared("Shirt") for _ in range(5)])
+
+    batch_extract.submit_batches(run)
+
+    assert [len(upload) for upload in api.uploads] == [2, 2, 1]
+    assert len(run.state["batches"]) == 3
+
+
+# -- poll ------------------------------------------------------------------
+
+def test_poll_waits_through_in_progress_until_completed(api, tmp_path):
+    api.script = ["validating", "in_progress", "in_progress", "finalizing", "completed"]
+    entries = [make_prepared("Jacket"), make_prepared("Scarf")]
+    run = new_run(tmp_path, entries)
+    batch_extract.submit_batches(run)
+
+    batch_extract.poll_batches(run, poll_interval=0)
+
+    assert api.retrieves == 5
+    assert run.state["phase"] == "downloaded"
+    assert run.state["batches"][0]["status"] == "completed"
+    assert run.state["batches"][0]["downloaded"] is True
+    results = run.results()
+    for entry in entries:
+        assert results[entry["custom_id"]]["result"] == product_for(entry["custom_id"])
+        assert results[entry["custom_id"]]["usage"]["prompt_tokens"] == 100
+
+
+def test_poll_records_failed_requests_of_a_completed_batch(api, tmp_path):
+    good, bad = make_prepared("Watch"), make_prepared("Ring")
+    api.respond = lambda custom_id, body: None if custom_id == bad["custom_id"] else product_for(custom_id)
+    run = new_run(tmp_path, [good, bad])
+    batch_extract.submit_batches(run)
+
+    batch_extract.poll_batches(run, poll_interval=0)
+
+    results = run.results()
+    assert "result" in results[good["custom_id"]]
+    assert "invalid request" in results[bad["custom_id"]]["error"]
+
+
+def test_poll_failed_batch_is_terminal_without_results(api, tmp_path):
+    api.script = ["validating", "failed"]
+    entries = [make_prepared("Hat"), make_prepared("Belt")]
+    run = new_run(tmp_path, entries)
+    batch_extract.submit_batches(run)
+
+    batch_extract.poll_batches(run, poll_interval=0)
+
+    assert run.state["batches"][0]["status"] == "failed"
+    assert run.state["batches"][0]["downloaded"] is True
+    assert run.results() == {}
+
+    result = batch_extract.fan_in(run, tmp_path / "output", ingest=False)
+    assert result["stats"]["errors"] == 2
+    assert result["products"] == []
+
+
+def test_poll_expired_batch_keeps_partial_results(api, tmp_path):
+    api.script = ["in_progress", "expired"]
+    done, expired = make_prepared("Glove"), make_prepared("Sock")
+    api.finished_before_expiry = {done["custom_id"]}
+    run = new_run(tmp_path, [done, expired])
+    batch_extract.submit_batches(run)
+
+    batch_extract.poll_batches(run, poll_interval=0)
+
+    results = run.results()
+    assert run.state["batches"][0]["status"] == "expired"
+    assert "result" in results[done["custom_id"]]
+    assert "batch_expired" in results[expired["custom_id"]]["error"]
+
+
+# -- resume ----------------------------------------------------------------
+
+def test_resume_polls_submitted_batch_instead_of_resubmitting(api, tmp_path, no_scraping):
+    api.script = ["in_progress", "completed"]
+    entries = [make_prepared("Coat"), make_prepared("Vest")]
+    run = new_run(tmp_path, entries)
+    batch_extract.submit_batches(run)
+    batch_id = run.state["batches"][0]["batch_id"]
+
+    # Process killed while polling: state.json says submitted, nothing downloaded
+    result = batch_extract.run_batch_extraction(history_of(entries), work_dir=run.dir,
+                                                output_dir=tmp_path / "output", poll_interval=0, ingest=False)
+
+    assert len(api.uploads) == 1
+    assert [b["batch_id"] for b in BatchRun(run.dir).state["batches"]] == [batch_id]
+    assert result["stats"]["products"] == 2
+
+
+def test_resume_after_crash_between_submit_and_phase_update(api, tmp_path, no_scraping):
+    entries = [make_prepared("Tie")]
+    run = new_run(tmp_path, entries)
+    batch_extract.submit_batches(run)
+    # The batch was recorded but the crash happened before phase → submitted
+    run.state["phase"] = "prepare"
+    run.save_state()
+
+    result = batch_extract.run_batch_extraction(history_of(entries), work_dir=run.dir,
+                                                output_dir=tmp_path / "output", poll_interval=0, ingest=False)
+
+    assert len(api.uploads) == 1
+    assert result["stats"]["products"] == 1
+
+
+def test_resume_submits_chunks_missing_after_crash_between_submissions(api, tmp_path, monkeypatch, no_scraping):
+    monkeypatch.setattr(batch_extract, "BATCH_MAX_REQUESTS", 2)
+    entries = [make_prepared("Glove") for _ in range(5)]
+    run = new_run(tmp_path, entries)
+
+    create = batch_extract.client.batches.create
+    created = []
+
+    def crash_on_second_chunk(**kwargs):
+        if created:
+            raise KeyboardInterrupt("killed between chunk submissions")
+        created.append(kwargs)
+        return create(**kwargs)
+
+    monkeypatch.setattr(batch_extract.client.batches, "create", crash_on_second_chunk)
+    with pytest.raises(KeyboardInterrupt):
+        batch_extract.submit_batches(run)
+    monkeypatch.setattr(batch_extract.client.batches, "create", create)
+
+    state = BatchRun(run.dir).state
+    assert state["phase"] == "prepare"
+    assert len(state["batches"]) == 1
+
+    result = batch_extract.run_batch_extraction(history_of(entries), work_dir=run.dir,
+                                                output_dir=tmp_path / "output", poll_interval=0, ingest=False)
+
+    batches = BatchRun(run.dir).state["batches"]
+    assert [len(info["custom_ids"]) for info in batches] == [2, 2, 1]
+    assert sorted(i for info in batches for i in info["custom_ids"]) == sorted(e["custom_id"] for e in entries)
+    assert result["stats"]["products"] == 5
+
+
+def test_resume_prepares_only_missing_urls(api, tmp_path, monkeypatch):
+    prepared_before = make_prepared("Cap")
+    missing = make_prepared("Bag")
+    run = new_run(tmp_path, [prepared_before])
+    scraped = []
+
+    def prepare(url, output_dir="output", last_visit_time=None):
+        scraped.append(url)
+        return missing["prepared"]
+
+    monkeypatch.setattr(batch_extract, "prepare_extraction", prepare)
+    result = batch_extract.run_batch_extraction(history_of([prepared_before, missing]), work_dir=run.dir,
+                                                output_dir=tmp_path / "output", poll_interval=0, ingest=False)
+
+    assert scraped == [missing["prepared"]["url"]]
+    assert [request["custom_id"] for request in api.uploads[0]] == \
+        [prepared_before["custom_id"], missing["custom_id"]]
+    assert result["stats"]["products"] == 2
+
+
+# -- fan in ----------------------------------------------------------------
+
+def test_fan_in_merges_batch_results_cache_and_reused_extractions(api, tmp_path, monkeypatch):
+    api.script = ["in_progress", "expired"]
+    from_batch, expired = make_prepared("Dress"), make_prepared("Skirt")
+    api.finished_before_expiry = {from_batch["custom_id"]}
+    reused = make_prepared("Blouse", previous_product={"is_product": "Yes", "product_name": "Blouse (stored)"})
+    cached = make_prepared("Kimono")
+    llm_cache.put(smart_cache_key(cached["prepared"]["ocr_text"], cached["prepared"]["text_data"]),
+                  {"is_product": "Yes", "product_name": "Kimono (cached)"})
+    not_product = make_prepared("About us")
+    not_product_id = not_product["custom_id"]
+    previous_respond = api.respond
+    api.respond = lambda custom_id, body: {"is_product": "No"} if custom_id == not_product_id \
+        else previous_respond(custom_id, body)
+    api.finished_before_expiry.add(not_product_id)
+
+    run = new_run(tmp_path, [from_batch, expired, reused, cached, not_product])
+    batch_extract.submit_batches(run)
+    batch_extract.poll_batches(run, poll_interval=0)
+
+    ingested = []
+    monkeypatch.setitem(sys.modules, "json2vectordb", SimpleNamespace(ingest_product=ingested.append))
+    result = batch_extract.fan_in(run, tmp_path / "output", ingest=True)
+
+    assert result["stats"] == {"total": 5, "processed": 4, "products": 3, "non_products": 1, "errors": 1}
+    names = sorted(product["product_name"] for product in ingested)
+    assert names == sorted([f"product {from_batch['custom_id']}", "Blouse (stored)", "Kimono (cached)"])
+    assert all(product["url"] for product in ingested)
+
+    # Batch results are cached, so a later sync run of the same page is free
+    batch_key = smart_cache_key(from_batch["prepared"]["ocr_text"], from_batch["prepared"]["text_data"])
+    assert llm_cache.get(batch_key) == product_for(from_batch["custom_id"])
+
+    # A second fan-in (resumed after a crash) does not upload anything twice
+    ingested.clear()
+    again = batch_extract.fan_in(run, tmp_path / "output", ingest=True)
+    assert ingested == []
+    assert again["stats"]["errors"] == 1
+
+
+def test_fan_in_retries_ingest_failures_on_next_run(api, tmp_path, monkeypatch):
+    entries = [make_prepared("Parka"), make_prepared("Poncho")]
+    run = new_run(tmp_path, entries)
+    batch_extract.submit_batches(run)
+    batch_extract.poll_batches(run, poll_interval=0)
+
+    failing_url = entries[0]["prepared"]["url"]
+    uploaded = []
+
+    def flaky_ingest(product):
+        if product["url"] == failing_url:
+            raise RuntimeError("search unavailable")
+        uploaded.append(product["url"])
+
+    monkeypatch.setitem(sys.modules, "json2vectordb", SimpleNamespace(ingest_product=flaky_ingest))
+    first = batch_extract.fan_in(run, tmp_path / "output", ingest=True)
+    assert first["stats"]["errors"] == 1
+    assert uploaded == [entries[1]["prepared"]["url"]]
+
+    monkeypatch.setitem(sys.modules, "json2vectordb", SimpleNamespace(ingest_product=lambda p: uploaded.append(p["url"])))
+    batch_extract.fan_in(run, tmp_path / "output", ingest=True)
+    assert uploaded == [entries[1]["prepared"]["url"], failing_url]
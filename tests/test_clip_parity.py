@@ -0,0 +1,63 @@
+"""
+CLIP ONNX backend vs torch: vectors must stay index-compatible
+
+Exports the towers into a temporary CLIP_ONNX_DIR with the configured
+quantization (CLIP_ONNX_QUANTIZE) and compares text and image vectors of
+both backends. Needs torch, onnxruntime, transformers and the model weights.
+"""
+
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("onnxruntime")
+pytest.importorskip("transformers")
+from PIL import Image, ImageDraw
+
+import clip_embed
+from clip_embed import COSINE_TOLERANCE
+
+
+TEXTS = ["red running shoes", "black leather handbag", "white cotton t-shirt", "blue denim jacket"]
+
+
+def sample_images():
+    """A few synthetic product-like pictures (shapes on plain backgrounds)"""
+    images = []
+    for background, shape, fill in (("white", "ellipse", "red"), ("lightgray", "rectangle", "black"),
+                                     ("beige", "polygon", "navy")):
+        image = Image.new("RGB", (320, 240), background)
+        draw = ImageDraw.Draw(image)
+        if shape == "polygon":
+            draw.polygon([(160, 30), (290, 210), (30, 210)], fill=fill)
+        else:
+            getattr(draw, shape)([60, 40, 260, 200], fill=fill)
+        images.append(image)
+    return images
+
+
+@pytest.fixture(scope="module")
+def onnx_backend(tmp_path_factory):
+    """Fresh export of the ONNX towers; torch model loaded alongside"""
+    monkeypatch = pytest.MonkeyPatch()
+    monkeypatch.setattr(clip_embed, "ONNX_DIR", tmp_path_factory.mktemp("clip_onnx"))
+    monkeypatch.setattr(clip_embed, "_sessions", None)
+    try:
+        clip_embed.load()
+    except OSError as e:
+        monkeypatch.undo()
+        pytest.skip(f"CLIP weights unavailable: {e}")
+    clip_embed.load_onnx()
+    yield
+    monkeypatch.undo()
+
+
+def test_onnx_text_vectors_match_torch(onnx_backend):
+    text_cosines, _ = clip_embed.parity_cosines(TEXTS, [])
+    assert len(text_cosines) == len(TEXTS)
+    assert min(text_cosines) >= COSINE_TOLERANCE
+
+
+def test_onnx_image_vectors_match_torch(onnx_backend):
+    _, image_cosines = clip_embed.parity_cosines([], sample_images())
+    assert len(image_cosines) == 3
+    assert min(image_cosines) >= COSINE_TOLERANCE
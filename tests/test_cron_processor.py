@@ -0,0 +1,139 @@
+"""
+cron_processor's blob lifecycle against Azurite
+
+Covers what only a real blob endpoint can check: the conditional tag write
+that makes claims exclusive, the reset of blobs left 'processing' by a
+crashed run, and retention archiving. Skipped unless Azurite answers at
+AZURITE_CONNECTION_STRING (default: the local development account, e.g.
+`azurite-blob --loose` on 127.0.0.1:10000).
+"""
+
+import gzip
+import json
+import os
+import threading
+import uuid
+
+import pytest
+
+pytest.importorskip("azure.storage.blob")
+from azure.storage.blob import BlobServiceClient
+
+CONNECTION_STRING = os.environ.get("AZURITE_CONNECTION_STRING", "UseDevelopmentStorage=true")
+OLD = "2000-01-01T00:00:00Z"
+
+
+def _azurite():
+    """BlobServiceClient for Azurite, or None when it is not reachable"""
+    service = BlobServiceClient.from_connection_string(
+        CONNECTION_STRING, retry_total=0, connection_timeout=2, read_timeout=5,
+    )
+    try:
+        service.get_service_properties()
+    except Exception:
+        return None
+    return service
+
+
+_service = _azurite()
+if _service is None:
+    pytest.skip(f"Azurite not reachable at {CONNECTION_STRING}", allow_module_level=True)
+
+import cron_processor
+from cron_processor import (
+    STATE_AT_TAG, STATE_DONE, STATE_FAILED, STATE_PENDING, STATE_PROCESSING, STATE_TAG,
+)
+
+
+@pytest.fixture
+def container():
+    """Fresh container per test → its name"""
+    name = f"test-{uuid.uuid4().hex[:12]}"
+    _service.create_container(name)
+    yield name
+    _service.delete_container(name)
+
+
+def upload(container, name, items, state=STATE_PENDING, state_at=None):
+    """An ingestHistory-style history blob with state tags"""
+    data = gzip.compress("".join(json.dumps(item) + "\n" for item in items).encode())
+    _service.get_container_client(container).upload_blob(
+        name, data, tags={STATE_TAG: state, STATE_AT_TAG: state_at or cron_processor._now_tag()},
+    )
+
+
+def state_of(container, name):
+    return _service.get_blob_client(container, name).get_blob_tags().get(STATE_TAG)
+
+
+def blob_names(container, prefix=None):
+    return sorted(b.name for b in _service.get_container_client(container).list_blobs(name_starts_with=prefix))
+
+
+def item(n):
+    return {"url": f"https://shop.example/p/{n}", "title": f"Product {n}", "lastVisitTime": 1_700_000_000_000 + n}
+
+
+def test_set_state_only_applies_when_expected_state_matches(container):
+    upload(container, "history/a.ndjson.gz", [item(1)])
+    client = _service.get_container_client(container)
+
+    assert cron_processor.set_state(client, "history/a.ndjson.gz", STATE_PROCESSING, expect=STATE_PENDING)
+    assert not cron_processor.set_state(client, "history/a.ndjson.gz", STATE_PROCESSING, expect=STATE_PENDING)
+    assert state_of(container, "history/a.ndjson.gz") == STATE_PROCESSING
+
+
+def test_concurrent_claims_never_share_a_blob(container):
+    names = [f"history/{n:03d}.ndjson.gz" for n in range(24)]
+    for n, name in enumerate(names):
+        upload(container, name, [item(n)])
+
+    start = threading.Barrier(2)
+    claimed = {}
+
+    def worker(worker_id):
+        start.wait()
+        claimed[worker_id] = cron_processor.claim_blobs(_service, container, names)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not set(claimed[0]) & set(claimed[1])
+    assert sorted(claimed[0] + claimed[1]) == names
+    assert {state_of(container, name) for name in names} == {STATE_PROCESSING}
+
+
+def test_recover_stale_resets_only_old_processing_blobs(container):
+    upload(container, "history/crashed.ndjson.gz", [item(1)], state=STATE_PROCESSING, state_at=OLD)
+    upload(container, "history/running.ndjson.gz", [item(2)], state=STATE_PROCESSING)
+    upload(container, "history/done.ndjson.gz", [item(3)], state=STATE_DONE, state_at=OLD)
+
+    cron_processor.recover_stale(_service, container)
+
+    assert state_of(container, "history/crashed.ndjson.gz") == STATE_PENDING
+    assert state_of(container, "history/running.ndjson.gz") == STATE_PROCESSING
+    assert state_of(container, "history/done.ndjson.gz") == STATE_DONE
+    assert "history/crashed.ndjson.gz" in cron_processor.get_pending_blobs(_service, container)
+
+
+def test_retention_archives_old_done_and_failed_blobs(container):
+    upload(container, "history/old-done.ndjson.gz", [item(1), item(2)], state=STATE_DONE, state_at=OLD)
+    upload(container, "history/old-failed.ndjson.gz", [item(3)], state=STATE_FAILED, state_at=OLD)
+    upload(container, "history/new-done.ndjson.gz", [item(4)], state=STATE_DONE)
+    upload(container, "history/old-pending.ndjson.gz", [item(5)], state=STATE_PENDING, state_at=OLD)
+
+    cron_processor.apply_retention(_service, container, days=30)
+
+    assert blob_names(container, "history/") == ["history/new-done.ndjson.gz", "history/old-pending.ndjson.gz"]
+
+    def archive(folder):
+        (name,) = blob_names(container, f"{folder}/")
+        data = _service.get_blob_client(container, name).download_blob().readall()
+        header, *items = [json.loads(line) for line in gzip.decompress(data).splitlines()]
+        return header["sources"], items
+
+    assert archive("processed") == (["history/old-done.ndjson.gz"], [item(1), item(2)])
+    assert archive("failed") == (["history/old-failed.ndjson.gz"], [item(3)])
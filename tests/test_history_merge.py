@@ -0,0 +1,89 @@
+"""
+cron_processor's blob streaming and history merge, without a blob endpoint
+
+A fake blob service hands iter_blob_items the blob bytes as download
+chunks split at odd sizes, so the streaming parsers see items, lines and
+gzip frames cut at arbitrary points.
+"""
+
+import gzip
+import json
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("azure.storage.blob")
+import cron_processor
+from cron_processor import HistoryMerger, iter_blob_items, merge_history_items
+
+
+def fake_service(blobs, chunk_sizes=(1, 7, 64, 3, 1000)):
+    """BlobServiceClient stand-in: {name: bytes}, downloaded in chunks of cycling sizes"""
+    def chunks(data):
+        offset, i = 0, 0
+        while offset < len(data):
+            size = chunk_sizes[i % len(chunk_sizes)]
+            yield data[offset:offset + size]
+            offset += size
+            i += 1
+
+    def get_blob_client(container, blob):
+        data = blobs[blob]
+        return SimpleNamespace(download_blob=lambda: SimpleNamespace(chunks=lambda: chunks(data)))
+
+    return SimpleNamespace(get_blob_client=get_blob_client)
+
+
+def item(n, **fields):
+    return {"id": str(n), "url": f"https://shop.example/p/{n}", "title": f"Product {n} – é",
+            "lastVisitTime": 1_700_000_000_000.0 + n, "visitCount": 1, **fields}
+
+
+ITEMS = [item(n) for n in range(200)]
+
+
+def test_ndjson_gz_blob_streams_every_item():
+    data = gzip.compress("".join(json.dumps(i, ensure_ascii=False) + "\n" for i in ITEMS).encode())
+    service = fake_service({"history/a.ndjson.gz": data})
+
+    assert list(iter_blob_items(service, "c", "history/a.ndjson.gz")) == ITEMS
+
+
+@pytest.mark.parametrize("with_ijson", [True, False])
+def test_legacy_json_array_blob_streams_every_item(monkeypatch, with_ijson):
+    if with_ijson:
+        pytest.importorskip("ijson")
+    else:
+        monkeypatch.setattr(cron_processor, "ijson", None)
+    service = fake_service({"pending/legacy.json": json.dumps(ITEMS, ensure_ascii=False).encode()})
+
+    assert list(iter_blob_items(service, "c", "pending/legacy.json")) == ITEMS
+
+
+def test_merger_counts_a_visit_posted_twice_once():
+    visit = item(1, visitCount=3)
+    merger = HistoryMerger()
+    for posted in (visit, dict(visit), dict(visit, url=visit["url"] + "?utm_source=newsletter")):
+        merger.add(posted)
+
+    (merged,) = merger.items()
+    assert merged["visitCount"] == 3
+    assert merger.received == 3
+
+
+def test_merger_newest_visit_wins_and_visit_counts_add_up():
+    older = item(1, title="Old title", visitCount=2)
+    newer = dict(older, url=older["url"] + "?ref=email", title="New title",
+                 lastVisitTime=older["lastVisitTime"] + 60_000, visitCount=1)
+
+    for order in ((older, newer), (newer, older)):
+        (merged,) = merge_history_items([order])
+        assert merged["title"] == "New title"
+        assert merged["url"] == newer["url"]
+        assert merged["lastVisitTime"] == newer["lastVisitTime"]
+        assert merged["visitCount"] == 3
+
+
+def test_merged_items_come_newest_first():
+    merged = merge_history_items([ITEMS[:100], ITEMS[100:]])
+    assert [i["id"] for i in merged] == [i["id"] for i in reversed(ITEMS)]
@@ -0,0 +1,79 @@
+"""
+robust_scraper2's readable-text pass on small fixture pages
+"""
+
+import pytest
+
+pytest.importorskip("lxml")
+
+from robust_scraper2 import extract
+
+
+PRODUCT = """
+<h1>Organic Linen Shirt</h1>
+<span class="price">$129.99</span>
+<p>Relaxed-fit shirt woven from European flax linen, garment washed for softness.</p>
+<p>Mother-of-pearl buttons, a chest pocket and a curved hem that works tucked or untucked.</p>
+"""
+
+CHROME = """
+<div class="cookie-banner">We use cookies to improve your experience. Accept all cookies?</div>
+<div class="social-share"><a href="/s/fb">Share on Facebook</a> <a href="/s/x">Share on X</a></div>
+<ul class="main-nav"><li><a href="/men">Men's clothing and accessories</a></li>
+<li><a href="/women">Women's clothing and accessories</a></li></ul>
+"""
+
+
+def page(body):
+    return f"<html><head><title>Organic Linen Shirt</title></head><body>{body}</body></html>"
+
+
+def text_of(html):
+    return extract(html, "https://shop.example/p/1")[1]
+
+
+@pytest.mark.parametrize("wrapper", [
+    '<div class="layout--with-sidebar">{}</div>',
+    '<div class="pdp header-sticky">{}</div>',
+    '<div class="product-detail js-share-enabled">{}</div>',
+    '<div class="content ads-container-parent">{}</div>',
+    '<div class="main-menu-open">{}</div>',
+    '<div id="sidebar">{}</div>',
+    '<div class="related">{}</div>',
+])
+def test_chrome_like_wrapper_keeps_main_content(wrapper):
+    text = text_of(page(CHROME + wrapper.format(PRODUCT)))
+
+    assert "Organic Linen Shirt" in text
+    assert "$129.99" in text
+    assert "European flax linen" in text
+    assert "Mother-of-pearl buttons" in text
+
+
+def test_chrome_blocks_are_dropped():
+    text = text_of(page(CHROME + f"<main>{PRODUCT}</main>"))
+
+    assert "European flax linen" in text
+    assert "cookies" not in text
+    assert "Share on" not in text
+    assert "accessories" not in text
+
+
+def test_long_text_under_chrome_name_is_kept():
+    review = "<p>" + "Great shirt, true to size and the linen softens after every wash. " * 10 + "</p>"
+    text = text_of(page(f"<main>{PRODUCT}</main><section class='comments'>{review}</section>"))
+
+    assert "true to size" in text
+
+
+def test_blocks_come_out_in_document_order():
+    html = page('<main><h1>Organic Linen Shirt</h1><span>$129.99</span>'
+                '<p>Relaxed-fit shirt woven from European flax linen.</p>Made in Portugal, fair wage certified.</main>')
+    lines = text_of(html).splitlines()
+
+    assert lines == [
+        "Organic Linen Shirt",
+        "$129.99",
+        "Relaxed-fit shirt woven from European flax linen.",
+        "Made in Portugal, fair wage certified.",
+    ]
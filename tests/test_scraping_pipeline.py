@@ -0,0 +1,82 @@
+"""
+Reuse of the stored extraction on revisits (no network, no browser, no LLM)
+"""
+
+import pytest
+
+import content_fingerprint
+import scraping_pipeline
+from scraping_pipeline import extract_price, reuse_extraction
+
+
+STORED = {"is_product": "Yes", "product_name": "Linen shirt", "price": "$49.99", "currency": "USD", "Brand": "Acme"}
+
+
+def revisit(raw_price, previous=STORED):
+    return {"previous_product": previous, "content_change": content_fingerprint.PRICE,
+            "text_data": {"price": raw_price}}
+
+
+@pytest.mark.parametrize("raw, previous_currency, expected", [
+    ("$39.99$49.99", None, {"price": "$39.99", "currency": "USD"}),
+    ("CA$ 59.00", "CAD", {"price": "$ 59.00", "currency": "CAD"}),
+    ("₹1,299 M.R.P.: ₹1,999", None, {"price": "₹1,299", "currency": "INR"}),
+    ("Rs. 499", None, {"price": "Rs. 499", "currency": "INR"}),
+    ("1.299,00 €", None, {"price": "1.299,00 €", "currency": "EUR"}),
+    ("49.99 GBP", None, {"price": "49.99", "currency": "GBP"}),
+    ("129.99", "USD", {"price": "129.99"}),
+    ("Price on request", None, None),
+    (None, None, None),
+])
+def test_extract_price(raw, previous_currency, expected):
+    assert extract_price(raw, previous_currency) == expected
+
+
+def test_price_only_change_merges_price_and_currency():
+    reused = reuse_extraction(revisit("Sale £35.00 (was £49.99)"))
+    assert reused == {**STORED, "price": "£35.00", "currency": "GBP"}
+
+
+def test_price_only_change_without_currency_keeps_stored_currency():
+    reused = reuse_extraction(revisit("35.00"))
+    assert reused == {**STORED, "price": "35.00"}
+
+
+def test_price_only_change_without_amount_is_not_reused():
+    assert reuse_extraction(revisit("Out of stock")) is None
+
+
+def test_unchanged_content_reuses_stored_product():
+    prepared = {**revisit("$49.99"), "content_change": content_fingerprint.UNCHANGED}
+    assert reuse_extraction(prepared) == STORED
+
+
+@pytest.fixture
+def scrape_result(monkeypatch):
+    """What robust_scrape returns for the next prepare_extraction; OCR is stubbed out"""
+    result = {}
+    monkeypatch.setattr(scraping_pipeline, "robust_scrape", lambda url: result["value"])
+    monkeypatch.setattr(scraping_pipeline, "take_screenshot", lambda url, path, with_regions: (b"png", []))
+    monkeypatch.setattr(scraping_pipeline.cpu_pool, "ocr_regions", lambda png, boxes: "OCR TEXT")
+    return result
+
+
+@pytest.mark.parametrize("stored_before", [False, True])
+def test_failed_scrape_is_never_reused(scrape_result, tmp_path, stored_before):
+    url = f"https://shop.example/p/{tmp_path.name}"
+    if stored_before:
+        text_data = {"title": "Linen shirt", "price": "$49.99", "main_content": "Linen shirt, relaxed fit"}
+        fingerprint, content_fp = content_fingerprint.compute(text_data, None)
+        content_fingerprint.store(url, fingerprint, content_fp, STORED)
+
+    for _ in range(2):
+        scrape_result["value"] = (None, None, None)
+        prepared = scraping_pipeline.prepare_extraction(url, output_dir=tmp_path)
+        assert prepared["content_change"] == content_fingerprint.NEW
+        assert prepared["previous_product"] is None
+        assert prepared["ocr_text"] == "OCR TEXT"
+        scraping_pipeline.finalize_extraction(prepared, {"is_product": "Yes", "product_name": "From OCR"}, tmp_path)
+
+    # Failed scrapes are not stored: a good earlier record (if any) stays as it was
+    stored = content_fingerprint.lookup(url)
+    assert (stored and stored["product"]) == (STORED if stored_before else None)